@@ -1,22 +1,23 @@
 import os
 import sys
-import django
 import streamlit as st
-from datetime import datetime, timedelta
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from django.utils import timezone
-from django.db.models import Count, Q
-import numpy as np
+from datetime import timedelta
+
+# Configure Django once per process (Streamlit re-runs this script on every interaction)
+PROJECT_ROOT = os.path.abspath("..")
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
 
-# Configure Django
-sys.path.append(os.path.abspath(".."))
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Projecto_Final.settings")
-django.setup()
+from Projecto_Final.bootstrap import setup_django
+setup_django()
 
-from Gestao.models import Modulo, Aula, RegistoPresenca, CodigoPresenca, Utilizador
-from auth.login import login_user
+from Projecto_Final import ligacoes
+
+from django.utils import timezone
+from Gestao import referencias, servicos
+from Gestao.alteracoes import aulas_alteradas, ultima_sequencia
+from Gestao.leitura import painel
+from auth.login import login_user, retomar_sessao
 
 # LOGO
 st.logo(
@@ -33,9 +34,154 @@ st.set_page_config(
     initial_sidebar_state="collapsed",
 )
 
-def generate_time_series_data(codes):
+# Columns kept in the snapshot for merging and status, never shown
+INTERNAL_COLUMNS = ["id", "aula_id", "timestamp", "valido", "valido_desde", "expira"]
+# The snapshot only keeps what the statistics and charts need; usage details are read per page
+SNAPSHOT_COLUMNS = INTERNAL_COLUMNS + ["Código", "Data", "Hora", "Formador", "Usos"]
+TABLE_COLUMNS = [
+    "Código", "Data", "Hora", "Módulo", "Formador", "Aula", "Status",
+    "Usado por", "Hora de uso", "Motivo atraso", "Justificativo",
+]
+PAGE_SIZES = [25, 50, 100, 200]
+
+
+def build_code_rows(codes):
+    """One summary row per code (module and teacher names come from the reference cache)"""
+    codes = list(codes)
+    # Codes are shared by the class and stay valid when used: usage comes from the check-ins
+    usos = servicos.usos_codigos(codes)
+    rows = []
+    for code in codes:
+        modulo_ref = referencias.modulo(code.aula.modulo_id)
+        rows.append({
+            "id": code.id,
+            "aula_id": code.aula_id,
+            "timestamp": code.timestamp,
+            "valido": code.valido,
+            "valido_desde": code.valido_desde or code.timestamp,
+            "expira": code.expira,
+            "Código": code.codigo,
+            "Data": code.timestamp.strftime("%d/%m/%Y"),
+            "Hora": code.timestamp.strftime("%H:%M:%S"),
+            "Módulo": modulo_ref.nome if modulo_ref else "-",
+            "Formador": referencias.nome_utilizador(modulo_ref.formador_id) if modulo_ref else "-",
+            "Aula": f"{code.aula.data.strftime('%d/%m/%Y')} - {code.aula.periodo}",
+            "Usos": usos[code.id],
+        })
+    return rows
+
+
+def build_detail_rows(linhas):
+    """Table rows for one page of the code log (servicos.pagina_codigos)"""
+    rows = []
+    # Student names are not in the reference cache: one query for the whole page
+    formandos = {linha["registo"].formando_id for linha in linhas if linha["registo"]}
+    nomes = referencias.nomes_utilizadores(formandos)
+    for linha, row in zip(linhas, build_code_rows(linha["codigo"] for linha in linhas)):
+        registro = linha["registo"]
+        rows.append({
+            **row,
+            "Status": linha["estado"],
+            "Usado por": nomes.get(registro.formando_id, "-") if registro else "-",
+            "Hora de uso": registro.entrada.strftime("%H:%M:%S") if registro else "-",
+            "Motivo atraso": registro.motivo_atraso if registro and registro.motivo_atraso else "-",
+            "Justificativo": registro.justificativo.name if registro and registro.justificativo else "-"
+        })
+    return rows
+
+
+def load_code_snapshot(codes, filters):
+    """Summary rows for the filtered codes, refreshed incrementally from the change feed.
+    
+    The last snapshot of each filter set is kept in the session together with
+    the feed sequence it was loaded at. On a rerun only the classes touched by
+    code or attendance writes since then are re-read, and their rows replace
+    the old ones (new, used, replaced and deleted codes alike).
+    """
+    import pandas as pd
+    
+    snapshots = st.session_state.setdefault("monitor_snapshots", {})
+    snapshot = snapshots.get(filters)
+    # Read the sequence first: anything written while loading is picked up again next time
+    sequencia = ultima_sequencia()
+    
+    if snapshot is None:
+        df = pd.DataFrame(build_code_rows(codes), columns=SNAPSHOT_COLUMNS)
+    elif sequencia == snapshot["sequencia"]:
+        return snapshot["df"]
+    else:
+        aulas = aulas_alteradas(
+            snapshot["sequencia"], ate=sequencia, entidades=["codigopresenca", "registopresenca"]
+        )
+        df = snapshot["df"]
+        if aulas:
+            novas = pd.DataFrame(build_code_rows(codes.filter(aula_id__in=aulas)), columns=SNAPSHOT_COLUMNS)
+            df = pd.concat([df[~df["aula_id"].isin(aulas)], novas], ignore_index=True)
+    
+    if not df.empty:
+        df = df.sort_values("timestamp", ascending=False, ignore_index=True)
+    snapshots[filters] = {"sequencia": sequencia, "df": df}
+    return df
+
+
+def show_code_table(codes, key):
+    """Details table paginated in the database: only the current page is loaded and sent to the browser"""
+    import pandas as pd
+    
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        page_size = st.selectbox("Linhas por página", PAGE_SIZES, key="monitor_page_size")
+    with col2:
+        order = st.selectbox("Ordenar", ["Mais recentes", "Mais antigos"], key="monitor_order")
+    
+    # Stack of keyset cursors, one per page already visited; reset whenever filters or sorting change
+    key = (key, page_size, order)
+    if st.session_state.get("monitor_page_key") != key:
+        st.session_state.monitor_page_key = key
+        st.session_state.monitor_cursors = [None]
+    cursors = st.session_state.monitor_cursors
+    
+    total = codes.count()
+    page, has_next = servicos.pagina_codigos(codes, cursors[-1], page_size, descendente=order == "Mais recentes")
+    
+    st.dataframe(
+        pd.DataFrame(build_detail_rows(page), columns=TABLE_COLUMNS),
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "Código": st.column_config.TextColumn("Código", width="medium"),
+            "Data": st.column_config.TextColumn("Data", width="small"),
+            "Hora": st.column_config.TextColumn("Hora", width="small"),
+            "Módulo": st.column_config.TextColumn("Módulo", width="large"),
+            "Formador": st.column_config.TextColumn("Formador", width="medium"),
+            "Aula": st.column_config.TextColumn("Aula", width="medium"),
+            "Status": st.column_config.TextColumn("Status", width="small"),
+            "Usado por": st.column_config.TextColumn("Usado por", width="medium"),
+            "Hora de uso": st.column_config.TextColumn("Hora de uso", width="small"),
+            "Motivo atraso": st.column_config.TextColumn("Motivo atraso", width="large"),
+            "Justificativo": st.column_config.TextColumn("Justificativo", width="medium")
+        }
+    )
+    
+    pages = max(1, -(-total // page_size))
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("⬅️ Anterior", disabled=len(cursors) == 1, key="monitor_prev"):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        st.caption(f"Página {len(cursors)} de {pages} · {total} códigos")
+    with col3:
+        if st.button("Seguinte ➡️", disabled=not has_next, key="monitor_next"):
+            cursors.append((page[-1]["codigo"].timestamp, page[-1]["codigo"].id))
+            st.rerun()
+
+
+def generate_time_series_data(df):
     """Generate time series data for visualization"""
-    df = pd.DataFrame(codes.values('timestamp', 'valido'))
+    import pandas as pd
+    
+    df = df[['timestamp', 'valido']].copy()
     df['timestamp'] = pd.to_datetime(df['timestamp'])
     df['date'] = df['timestamp'].dt.date
     df['hour'] = df['timestamp'].dt.hour
@@ -51,16 +197,19 @@ def generate_time_series_data(codes):
 
 def show_anomaly_detection(df):
     """Detect and display potential anomalies in code usage"""
+    import pandas as pd
+    
     anomalies = []
     
-    # Check for multiple uses of the same code
-    code_uses = df[df['Status'] == 'Usado'].groupby('Código').size()
-    multiple_uses = code_uses[code_uses > 1]
-    if not multiple_uses.empty:
+    # A code is shared by the whole class, so many uses are normal; check-ins under
+    # several codes of the same class mean older codes kept circulating
+    codes_used = df[df['Usos'] > 0].groupby('aula_id').size()
+    multiple_codes = codes_used[codes_used > 1]
+    if not multiple_codes.empty:
         anomalies.append({
             'type': 'Códigos Múltiplos',
-            'description': f'Encontrados {len(multiple_uses)} códigos usados mais de uma vez',
-            'severity': 'Alta'
+            'description': f'Encontradas {len(multiple_codes)} aulas com presenças registadas com mais de um código',
+            'severity': 'Média'
         })
     
     # Check for very quick code generation (potential abuse)
@@ -112,24 +261,28 @@ def mostrar_interface_admin(user):
             with col3:
                 end_date = st.date_input("Data final", value=timezone.now().date())
     
-    # Advanced filter options
+    # Advanced filter options (dropdowns come from the process-wide reference cache: no queries)
     st.subheader("🔍 Filtros Avançados")
     col1, col2, col3, col4 = st.columns(4)
+    formadores = referencias.formadores()
+    modulos = referencias.modulos()
     
     with col1:
         formador = st.selectbox(
             "Formador",
-            options=["Todos"] + list(Utilizador.objects.filter(tipo="Formador").values_list("username", flat=True))
+            options=["Todos", *formadores],
+            format_func=lambda i: formadores.get(i, i)
         )
     with col2:
         modulo = st.selectbox(
             "Módulo",
-            options=["Todos"] + list(Modulo.objects.values_list("nome", flat=True))
+            options=["Todos", *modulos],
+            format_func=lambda i: modulos[i].nome if i in modulos else i
         )
     with col3:
         status = st.selectbox(
             "Status do Código",
-            options=["Todos", "Válido", "Usado", "Expirado"]
+            options=["Todos", *servicos.ESTADOS_CODIGO]
         )
     with col4:
         periodo = st.selectbox(
@@ -138,53 +291,37 @@ def mostrar_interface_admin(user):
         )
     
     # Query codes with advanced filtering
-    codes = CodigoPresenca.objects.filter(
-        timestamp__date__range=[start_date, end_date]
-    ).select_related('aula', 'aula__modulo', 'aula__modulo__formador')
+    filters = (start_date, end_date, formador, modulo, periodo)
+    criteria = {
+        "formador_id": None if formador == "Todos" else formador,
+        "modulo_id": None if modulo == "Todos" else modulo,
+        "periodo": None if periodo == "Todos" else periodo.lower(),
+    }
+    codes = servicos.codigos_filtrados(start_date, end_date, **criteria).select_related('aula')
     
-    if formador != "Todos":
-        codes = codes.filter(aula__modulo__formador__username=formador)
-    if modulo != "Todos":
-        codes = codes.filter(aula__modulo__nome=modulo)
-    if periodo != "Todos":
-        codes = codes.filter(aula__periodo=periodo.lower())
+    # Rows from the session snapshot, topped up with what changed since the last rerun
+    snapshot = load_code_snapshot(codes, filters)
+    timeline = snapshot[["timestamp", "valido"]]
     
-    # Create DataFrame for display
-    data = []
-    for code in codes:
-        # Get attendance record if code was used
-        registro = RegistoPresenca.objects.filter(
-            aula=code.aula,
-            entrada__gte=code.timestamp
-        ).first()
-        
-        # Determine code status
-        if not code.valido:
-            code_status = "Usado"
-        elif not code.is_valid():
-            code_status = "Expirado"
-        else:
-            code_status = "Válido"
-        
-        if status != "Todos" and code_status != status:
-            continue
-            
-        data.append({
-            "Código": code.codigo,
-            "Data": code.timestamp.strftime("%d/%m/%Y"),
-            "Hora": code.timestamp.strftime("%H:%M:%S"),
-            "Módulo": code.aula.modulo.nome,
-            "Formador": code.aula.modulo.formador.get_full_name() or code.aula.modulo.formador.username,
-            "Aula": f"{code.aula.data.strftime('%d/%m/%Y')} - {code.aula.periodo}",
-            "Status": code_status,
-            "Usado por": registro.formando.get_full_name() if registro else "-",
-            "Hora de uso": registro.entrada.strftime("%H:%M:%S") if registro else "-",
-            "Motivo atraso": registro.motivo_atraso if registro and registro.motivo_atraso else "-",
-            "Justificativo": registro.justificativo.name if registro and registro.justificativo else "-"
-        })
+    if not snapshot.empty:
+        # Status depends on the current time, so it is derived on every rerun instead of cached
+        agora = timezone.now()
+        expired = snapshot["expira"] < agora
+        statuses = (
+            expired.map({True: "Expirado", False: "Válido"})
+            .mask(~expired & (snapshot["valido_desde"] > agora), "Agendado")
+            .where(snapshot["valido"], "Substituído")
+        )
+        snapshot = snapshot.assign(Status=statuses)
+        if status != "Todos":
+            snapshot = snapshot[snapshot["Status"] == status]
     
-    if data:
-        df = pd.DataFrame(data)
+    if not snapshot.empty:
+        # Heavy libraries are imported only once there is something to chart
+        import plotly.express as px
+        
+        df = snapshot[["aula_id", "Código", "Data", "Hora", "Formador", "Status", "Usos"]].copy()
+        used = int((df["Usos"] > 0).sum())
         
         # Display statistics
         st.subheader("📊 Estatísticas")
@@ -194,11 +331,11 @@ def mostrar_interface_admin(user):
         with col2:
             st.metric("Códigos Válidos", len(df[df["Status"] == "Válido"]))
         with col3:
-            st.metric("Códigos Usados", len(df[df["Status"] == "Usado"]))
+            st.metric("Códigos Usados", used)
         with col4:
             st.metric("Códigos Expirados", len(df[df["Status"] == "Expirado"]))
         with col5:
-            st.metric("Taxa de Uso", f"{(len(df[df['Status'] == 'Usado']) / len(df) * 100):.1f}%")
+            st.metric("Taxa de Uso", f"{(used / len(df) * 100):.1f}%")
         
         # Visualizations
         st.subheader("📈 Visualizações")
@@ -206,7 +343,7 @@ def mostrar_interface_admin(user):
         
         with tab1:
             # Time series visualization
-            daily_counts, hourly_counts = generate_time_series_data(codes)
+            daily_counts, hourly_counts = generate_time_series_data(timeline)
             
             col1, col2 = st.columns(2)
             with col1:
@@ -223,7 +360,7 @@ def mostrar_interface_admin(user):
             # Formador analysis
             formador_stats = df.groupby('Formador').agg({
                 'Código': 'count',
-                'Status': lambda x: (x == 'Usado').sum()
+                'Usos': lambda x: (x > 0).sum()
             }).reset_index()
             formador_stats.columns = ['Formador', 'Total Códigos', 'Códigos Usados']
             formador_stats['Taxa de Uso'] = (formador_stats['Códigos Usados'] / formador_stats['Total Códigos'] * 100).round(1)
@@ -242,37 +379,38 @@ def mostrar_interface_admin(user):
             else:
                 st.success("✅ Nenhuma anomalia detectada")
         
-        # Display detailed table with sorting and filtering
+        # Display detailed table, paginated and sorted in the database
         st.subheader("📝 Detalhes dos Códigos")
-        st.dataframe(
-            df,
-            use_container_width=True,
-            hide_index=True,
-            column_config={
-                "Código": st.column_config.TextColumn("Código", width="medium"),
-                "Data": st.column_config.TextColumn("Data", width="small"),
-                "Hora": st.column_config.TextColumn("Hora", width="small"),
-                "Módulo": st.column_config.TextColumn("Módulo", width="large"),
-                "Formador": st.column_config.TextColumn("Formador", width="medium"),
-                "Aula": st.column_config.TextColumn("Aula", width="medium"),
-                "Status": st.column_config.TextColumn("Status", width="small"),
-                "Usado por": st.column_config.TextColumn("Usado por", width="medium"),
-                "Hora de uso": st.column_config.TextColumn("Hora de uso", width="small"),
-                "Motivo atraso": st.column_config.TextColumn("Motivo atraso", width="large"),
-                "Justificativo": st.column_config.TextColumn("Justificativo", width="medium")
-            }
+        show_code_table(
+            servicos.codigos_filtrados(start_date, end_date, estado=None if status == "Todos" else status, **criteria),
+            (*filters, status),
         )
     else:
         st.info("Nenhum código encontrado para os filtros selecionados.")
+    
+    show_connection_stats()
+
+def show_connection_stats():
+    """Database connections held by this Streamlit process (Projecto_Final/ligacoes.py)"""
+    estado = ligacoes.estado()
+    st.caption(
+        f"🔌 Ligações à base de dados neste processo: {estado['abertas']} abertas "
+        f"({estado['em_uso']} em uso, {estado['no_pool']} no pool) · "
+        f"{estado['reutilizadas']} reutilizadas e {estado['criadas']} criadas em {estado['execucoes']} execuções"
+    )
 
 def main():
-    # Session and login
-    user = st.session_state.get("user", None)
+    # Session and login (a signed token in the URL resumes the session after a refresh)
+    user = st.session_state.get("user", None) or retomar_sessao()
     
     if not user:
         login_user()
     else:
-        mostrar_interface_admin(user)
+        # The monitor never writes: every query goes through the read-only connection
+        with painel():
+            mostrar_interface_admin(user)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Connections come from the process pool and go back to it when the run ends
+    with ligacoes.execucao():
+        main()
\ No newline at end of file
@@ -1,8 +1,11 @@
 import streamlit as st
-from Gestao.models import Modulo, Aula, RegistoPresenca
+from Gestao.models import Modulo, Aula
+from Gestao import servicos
 from django.utils import timezone
 from datetime import timedelta
 
+# Attendance editor labels for RegistoPresenca.estado (both absence states show as "Falta")
+EDITOR_STATUS = {'presente': "Presente", 'atrasado': "Atrasado"}
 
 
 def mostrar_interface_formador(user):
@@ -15,23 +18,25 @@ def mostrar_interface_formador(user):
     with col2:
         end_date = st.date_input("Data final", value=timezone.now().date())
     
-    modulos = Modulo.objects.filter(formador=user)
+    modulos = list(Modulo.objects.filter(formador=user))
     
     # Create tabs for different views
     tab1, tab2, tab3 = st.tabs(["Visão Geral", "Detalhes por Aula", "Estatísticas"])
     
     with tab1:
+        resumos = servicos.resumo_modulos(modulos)
         for modulo in modulos:
             with st.expander(f"{modulo.nome} - Resumo"):
                 # Summary cards
                 col1, col2, col3 = st.columns(3)
-                total_aulas = Aula.objects.filter(modulo=modulo).count()
-                col1.metric("Total de Aulas", total_aulas)
+                resumo = resumos[modulo.id]
+                col1.metric("Total de Aulas", resumo['total_aulas'])
                 
-                presencas = RegistoPresenca.objects.filter(aula__modulo=modulo, entrada__isnull=False).count()
+                presencas = resumo['presencas']
                 col2.metric("Presenças Registadas", presencas)
                 
-                faltas = RegistoPresenca.objects.filter(aula__modulo=modulo, entrada__isnull=True).count()
+                # Faltas inferidas: inscritos nas aulas realizadas menos presenças
+                faltas = resumo['faltas']
                 col3.metric("Faltas", faltas)
                 
                 # Mini chart
@@ -42,23 +47,25 @@ def mostrar_interface_formador(user):
                 st.bar_chart(chart_data)
     
     with tab2:
+        import pandas as pd
+        
         st.write("Detalhamento por aula")
         for modulo in modulos:
-            aulas = Aula.objects.filter(modulo=modulo, data__range=[start_date, end_date]).order_by("data")
+            aulas = list(Aula.objects.filter(modulo=modulo, data__range=[start_date, end_date]).order_by("data"))
+            # Enrolled formandos and their records for every class of the module in a fixed number of queries
+            rosters = servicos.roster_aulas(modulo, aulas)
             
             for aula in aulas:
                 with st.expander(f"{aula.data} ({aula.periodo})"):
-                    presencas = RegistoPresenca.objects.filter(aula=aula)
-                    
-                    # Interactive attendance editor
+                    # Interactive attendance editor: every enrolled formando, no registo = absence
                     df = pd.DataFrame([{
-                        "Nome": p.formando.username,
-                        "Status": "Presente" if p.entrada else "Falta",
-                        "Hora": p.entrada.time() if p.entrada else "-",
-                        "Justificação": p.motivo_atraso if p.motivo_atraso else ""
-                    } for p in presencas])
+                        "Nome": linha['formando'].username,
+                        "Status": EDITOR_STATUS.get(p.estado, "Falta") if p else "Falta",
+                        "Hora": p.entrada.time() if p and p.entrada else "-",
+                        "Justificação": p.motivo_atraso if p and p.motivo_atraso else ""
+                    } for linha in rosters[aula.id] for p in [linha['registo']]])
                     
-                    edited_df = st.data_editor(
+                    st.data_editor(
                         df,
                         column_config={
                             "Status": st.column_config.SelectboxColumn(
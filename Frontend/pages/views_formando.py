@@ -1,31 +1,34 @@
 import streamlit as st
-from datetime import datetime, timedelta
+from datetime import timedelta
 from django.utils import timezone
-from Gestao.models import Modulo, Aula, RegistoPresenca
+from Gestao.models import RegistoPresenca
+from Gestao import servicos
 
 def mostrar_interface_formando(user):
     st.subheader("Módulos disponíveis")
-    modulos = Modulo.objects.all()
-    hoje = timezone.now().date()
 
-    for modulo in modulos:
-        aulas = Aula.objects.filter(modulo=modulo, data=hoje)
-        if aulas.exists():
-            with st.expander(modulo.nome):
-                for aula in aulas:
-                    st.markdown(f"Aula de hoje ({aula.periodo})")
-                    if st.button(f"Registar presença ({aula.periodo})", key=f"{aula.id}"):
-                        _, created = RegistoPresenca.objects.get_or_create(
-                            formando=user,
-                            aula=aula,
-                            defaults={
-                                "entrada": timezone.now(),
-                                "saida": timezone.now() + timedelta(hours=3),
-                                "motivo_atraso": "",
-                                "falta_justificada": False
-                            }
-                        )
-                        if created:
-                            st.success("Presença registada!")
-                        else:
-                            st.info("Já existe presença para esta aula.")
+    # Apenas as aulas de hoje dos módulos em que o formando está inscrito
+    aulas_por_modulo = {}
+    aulas_hoje = sorted(servicos.aulas_de_hoje(user), key=lambda par: (par[0].modulo.nome, par[0].periodo))
+    for aula, _ in aulas_hoje:
+        aulas_por_modulo.setdefault(aula.modulo, []).append(aula)
+
+    for modulo, aulas in aulas_por_modulo.items():
+        with st.expander(modulo.nome):
+            for aula in aulas:
+                st.markdown(f"Aula de hoje ({aula.periodo})")
+                if st.button(f"Registar presença ({aula.periodo})", key=f"{aula.id}"):
+                    _, created = RegistoPresenca.objects.get_or_create(
+                        formando=user,
+                        aula=aula,
+                        defaults={
+                            "entrada": timezone.now(),
+                            "saida": timezone.now() + timedelta(hours=3),
+                            "motivo_atraso": "",
+                            "falta_justificada": False
+                        }
+                    )
+                    if created:
+                        st.success("Presença registada!")
+                    else:
+                        st.info("Já existe presença para esta aula.")
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import Utilizador, Curso, Modulo, Aula, RegistoPresenca
+from .models import Utilizador, Curso, Modulo, Inscricao, Aula, RegistoPresenca
 
 @admin.register(Utilizador)
 class UtilizadorAdmin(UserAdmin):
@@ -22,5 +22,6 @@ class UtilizadorAdmin(UserAdmin):
 # Registar os outros modelos normalmente
 admin.site.register(Curso)
 admin.site.register(Modulo)
+admin.site.register(Inscricao)
 admin.site.register(Aula)
 admin.site.register(RegistoPresenca)
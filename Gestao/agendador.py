@@ -0,0 +1,236 @@
+"""
+Agendador de tarefas periódicas (arrancado pelo launch.py).
+
+Cada tarefa é um comando de gestão corrido num processo próprio
+(python manage.py ...) segundo uma expressão cron de 5 campos, em hora
+local. As execuções correm num pool de threads; uma tarefa que ainda esteja
+a correr quando volta a estar na hora é saltada em vez de se sobrepor.
+
+A duração e o resultado de cada execução ficam num histórico JSON
+(HISTORICO) que o comando estado_agendador mostra. O módulo não importa o
+Django, por isso o launcher usa-o sem configurar settings.
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HISTORICO = os.path.join(BASE_DIR, ".agendador.json")
+HISTORICO_MAXIMO = 50  # execuções guardadas por tarefa
+SAIDA_MAXIMA = 2000  # caracteres finais da saída guardados quando a tarefa falha
+
+# nome: (expressão cron, argumentos de manage.py)
+TAREFAS = {
+    'gerar_codigos': ("30 6 * * *", ["gerar_codigos"]),
+    'limpar_codigos': ("*/30 * * * *", ["limpar_codigos"]),
+    'atualizar_alertas': ("0 1 * * *", ["atualizar_alertas"]),
+    'calcular_risco': ("30 1 * * *", ["calcular_risco", "--mostrar", "0"]),
+    'calcular_horas': ("0 2 * * *", ["calcular_horas"]),
+    'reconstruir_indice_presencas': ("30 2 * * *", ["reconstruir_indice_presencas"]),
+}
+
+
+# --------------------------
+# Expressões cron
+# --------------------------
+_LIMITES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+def _campo(texto, minimo, maximo):
+    valores = set()
+    for parte in texto.split(','):
+        intervalo, _, passo = parte.partition('/')
+        if intervalo == '*':
+            inicio, fim = minimo, maximo
+        elif '-' in intervalo:
+            inicio, fim = (int(v) for v in intervalo.split('-'))
+        else:
+            inicio = fim = int(intervalo)
+        if not minimo <= inicio <= fim <= maximo:
+            raise ValueError(f"Valor fora de [{minimo}, {maximo}]: {parte}")
+        valores.update(range(inicio, fim + 1, int(passo) if passo else 1))
+    return valores
+
+
+class Cron:
+    """Expressão cron clássica: minuto hora dia-do-mês mês dia-da-semana (0 e 7 = domingo)"""
+
+    def __init__(self, expressao):
+        campos = expressao.split()
+        if len(campos) != 5:
+            raise ValueError(f"Expressão cron inválida: {expressao!r}")
+        self.expressao = expressao
+        self.minutos, self.horas, self.dias, self.meses, dias_semana = (
+            _campo(texto, *limites) for texto, limites in zip(campos, _LIMITES)
+        )
+        self.dias_semana = {d % 7 for d in dias_semana}
+        # Como no cron: com dia do mês e dia da semana restritos, basta um deles
+        self._ou = campos[2] != '*' and campos[4] != '*'
+
+    def dia_coincide(self, momento):
+        no_mes = momento.day in self.dias
+        na_semana = (momento.weekday() + 1) % 7 in self.dias_semana
+        dia = (no_mes or na_semana) if self._ou else (no_mes and na_semana)
+        return dia and momento.month in self.meses
+
+    def coincide(self, momento):
+        return momento.minute in self.minutos and momento.hour in self.horas and self.dia_coincide(momento)
+
+    def proxima(self, depois):
+        """Próximo minuto (estritamente depois de `depois`) em que a expressão coincide"""
+        momento = depois.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limite = momento + timedelta(days=366 * 4)
+        while momento < limite:
+            if not self.dia_coincide(momento):
+                momento = momento.replace(hour=0, minute=0) + timedelta(days=1)
+            elif momento.hour not in self.horas:
+                momento = momento.replace(minute=0) + timedelta(hours=1)
+            elif momento.minute not in self.minutos:
+                momento += timedelta(minutes=1)
+            else:
+                return momento
+        return None
+
+
+# --------------------------
+# Histórico
+# --------------------------
+_lock_historico = threading.Lock()
+
+
+def ler_historico(caminho=HISTORICO):
+    try:
+        with open(caminho, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _registar(nome, execucao, caminho=HISTORICO):
+    with _lock_historico:
+        historico = ler_historico(caminho)
+        execucoes = historico.setdefault(nome, [])
+        execucoes.append(execucao)
+        del execucoes[:-HISTORICO_MAXIMO]
+        # Escrita atómica: o comando de estado nunca lê um ficheiro a meio
+        temporario = f"{caminho}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(historico, f, ensure_ascii=False, indent=1)
+        os.replace(temporario, caminho)
+
+
+# --------------------------
+# Agendador
+# --------------------------
+class Agendador:
+    """Corre as tarefas na hora certa num pool de threads, sem sobreposições"""
+
+    def __init__(self, tarefas=None, workers=2, historico=HISTORICO):
+        tarefas = TAREFAS if tarefas is None else tarefas
+        self.tarefas = {nome: (Cron(expressao), args) for nome, (expressao, args) in tarefas.items()}
+        self.historico = historico
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agendador")
+        self.a_correr = {}  # nome -> subprocess.Popen (None enquanto arranca)
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._ciclo, name="agendador", daemon=True)
+        self._thread.start()
+        print(f"[agendador] {len(self.tarefas)} tarefas: " + ", ".join(
+            f"{nome} ({cron.expressao})" for nome, (cron, _) in self.tarefas.items()
+        ))
+
+    def _ciclo(self):
+        ultimo = datetime.now().replace(second=0, microsecond=0)
+        while True:
+            # Acorda no início de cada minuto; minutos perdidos (ex.: suspensão) não são recuperados
+            agora = datetime.now()
+            espera = 60 - agora.second - agora.microsecond / 1_000_000
+            if self._parar.wait(espera):
+                return
+            minuto = datetime.now().replace(second=0, microsecond=0)
+            if minuto <= ultimo:
+                continue
+            ultimo = minuto
+            for nome, (cron, _) in self.tarefas.items():
+                if cron.coincide(minuto):
+                    self.disparar(nome)
+
+    def disparar(self, nome):
+        """Submete a tarefa ao pool; devolve False se a execução anterior ainda não terminou"""
+        with self._lock:
+            if nome in self.a_correr:
+                print(f"[agendador] {nome} ainda está a correr; execução saltada")
+                _registar(nome, {'inicio': datetime.now().isoformat(timespec='seconds'),
+                                 'resultado': 'saltada'}, self.historico)
+                return False
+            self.a_correr[nome] = None
+        self.pool.submit(self._correr, nome)
+        return True
+
+    def _correr(self, nome):
+        _, args = self.tarefas[nome]
+        inicio = datetime.now()
+        relogio = time.perf_counter()
+        execucao = {'inicio': inicio.isoformat(timespec='seconds')}
+        try:
+            processo = subprocess.Popen(
+                [sys.executable, "manage.py", *args], cwd=BASE_DIR,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+            )
+            with self._lock:
+                self.a_correr[nome] = processo
+            saida, _ = processo.communicate()
+            execucao['codigo_saida'] = processo.returncode
+            execucao['resultado'] = 'ok' if processo.returncode == 0 else 'erro'
+            if processo.returncode != 0:
+                execucao['saida'] = saida[-SAIDA_MAXIMA:]
+        except OSError as e:
+            execucao.update(resultado='erro', saida=str(e))
+        finally:
+            execucao['segundos'] = round(time.perf_counter() - relogio, 3)
+            with self._lock:
+                self.a_correr.pop(nome, None)
+            _registar(nome, execucao, self.historico)
+            print(f"[agendador] {nome}: {execucao['resultado']} em {execucao['segundos']:.1f}s")
+
+    def parar(self, timeout=10):
+        """Deixa de agendar; as tarefas em curso têm `timeout` segundos para terminar"""
+        self._parar.set()
+        limite = time.time() + timeout
+        while self.a_correr and time.time() < limite:
+            time.sleep(0.1)
+        with self._lock:
+            for processo in self.a_correr.values():
+                if processo is not None and processo.poll() is None:
+                    processo.terminate()
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+def estado(agora=None, tarefas=None, caminho=HISTORICO):
+    """Resumo por tarefa: expressão, última execução, duração média e próxima execução"""
+    agora = agora or datetime.now()
+    tarefas = TAREFAS if tarefas is None else tarefas
+    historico = ler_historico(caminho)
+    resumo = []
+    for nome, (expressao, _) in tarefas.items():
+        execucoes = historico.get(nome, [])
+        duracoes = [e['segundos'] for e in execucoes if 'segundos' in e]
+        resumo.append({
+            'tarefa': nome,
+            'cron': expressao,
+            'ultima': execucoes[-1] if execucoes else None,
+            'execucoes': len(execucoes),
+            'falhas': sum(e['resultado'] == 'erro' for e in execucoes),
+            'media_segundos': sum(duracoes) / len(duracoes) if duracoes else None,
+            'maximo_segundos': max(duracoes) if duracoes else None,
+            'proxima': Cron(expressao).proxima(agora),
+        })
+    return resumo
@@ -0,0 +1,170 @@
+"""
+Alertas de assiduidade (faltas seguidas e taxa de presença recente).
+
+O estado de cada formando (EstadoAssiduidade) avança aula a aula: uma
+presença repõe a sequência de faltas, uma falta aumenta-a, e a taxa
+recente é uma média móvel exponencial. As faltas são virtuais, por isso
+só se sabe que alguém faltou depois de a aula acontecer: processar()
+avança o estado dia a dia (tipicamente à noite) até ontem, e uma
+presença gravada entretanto repõe logo a sequência (ver signals).
+
+Quando um limite é ultrapassado cria-se uma Notificacao para o formando
+e para o formador do módulo. A mesma passagem serve para o histórico
+inteiro: tudo é lido em poucas queries e gravado em massa.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Aula, EstadoAssiduidade, Inscricao, Modulo, Notificacao, RegistoPresenca
+
+DIAS_NOTIFICAR = 7  # cruzamentos mais antigos (backfill) só atualizam o estado, sem notificar
+
+# Estado de partida quando o histórico de um formando tem de ser refeito
+REINICIO = {
+    'faltas_consecutivas': 0,
+    'taxa_recente': 1.0,
+    'aulas_processadas': 0,
+    'processado_ate': None,
+}
+
+
+def _modulos_por_formando(formandos=None):
+    """{formando_id: set(modulo_id)} a partir das inscrições, em duas queries"""
+    inscricoes = Inscricao.objects.all()
+    if formandos is not None:
+        inscricoes = inscricoes.filter(formando__in=formandos)
+    modulos_do_curso = {}
+    for modulo_id, curso_id in Modulo.objects.values_list('id', 'curso_id'):
+        modulos_do_curso.setdefault(curso_id, set()).add(modulo_id)
+    resultado = {}
+    for formando_id, curso_id, modulo_id in inscricoes.values_list('formando_id', 'curso_id', 'modulo_id'):
+        alvo = {modulo_id} if modulo_id else modulos_do_curso.get(curso_id, set())
+        resultado.setdefault(formando_id, set()).update(alvo)
+    return resultado
+
+
+def _notificacoes(formando_id, formador_id, titulo, mensagem):
+    return [
+        Notificacao(formando_id=destinatario, titulo=titulo, mensagem=mensagem, tipo='assiduidade')
+        for destinatario in (formando_id, formador_id)
+    ]
+
+
+def processar(ate=None, formandos=None, desde_inicio=False):
+    """Avança o estado de assiduidade até à data `ate` (por omissão ontem).
+
+    Devolve (aulas avaliadas, notificações criadas).
+    """
+    hoje = timezone.now().date()
+    if ate is None:
+        ate = hoje - timedelta(days=1)
+    notificar_desde = hoje - timedelta(days=DIAS_NOTIFICAR)
+    limite_faltas = settings.ALERTA_FALTAS_CONSECUTIVAS
+    taxa_minima = settings.ALERTA_TAXA_MINIMA
+    alfa = 2 / (settings.ALERTA_JANELA_AULAS + 1)
+
+    modulos_de = _modulos_por_formando(formandos)
+    estados = EstadoAssiduidade.objects.in_bulk(list(modulos_de))
+    for formando_id in modulos_de:
+        if formando_id not in estados:
+            estados[formando_id] = EstadoAssiduidade(formando_id=formando_id)
+        elif desde_inicio:
+            for campo, valor in REINICIO.items():
+                setattr(estados[formando_id], campo, valor)
+
+    inicios = [e.processado_ate for e in estados.values()]
+    desde = None if None in inicios else min(inicios)
+    todos_modulos = set().union(*modulos_de.values()) if modulos_de else set()
+
+    aulas = Aula.objects.filter(modulo__in=todos_modulos, data__lte=ate)
+    if desde is not None:
+        aulas = aulas.filter(data__gt=desde)
+    # Os registos são filtrados pela mesma subquery das aulas, sem listas enormes de ids
+    registos = RegistoPresenca.objects.filter(aula__in=aulas)
+    if formandos is not None:
+        registos = registos.filter(formando__in=formandos)
+    aulas = list(
+        aulas.order_by('data', 'periodo', 'id')
+        .values_list('id', 'modulo_id', 'modulo__nome', 'modulo__formador_id', 'data')
+    )
+    presentes = set(registos.filter(estado__in=RegistoPresenca.PRESENTES).values_list('formando_id', 'aula_id'))
+    justificadas = set(registos.filter(estado='justificada').values_list('formando_id', 'aula_id'))
+
+    # Aulas por módulo, já na ordem cronológica global (o índice serve para intercalar módulos)
+    aulas_por_modulo = {}
+    for posicao, aula in enumerate(aulas):
+        aulas_por_modulo.setdefault(aula[1], []).append((posicao, aula))
+
+    avaliadas = 0
+    notificacoes = []
+    for formando_id, modulos in modulos_de.items():
+        estado = estados[formando_id]
+        ja_notificado = max(filter(None, [estado.notificado_ate, notificar_desde - timedelta(days=1)]))
+        do_formando = sorted(a for m in modulos for a in aulas_por_modulo.get(m, ()))
+        for _, (aula_id, modulo_id, modulo_nome, formador_id, data) in do_formando:
+            if estado.processado_ate and data <= estado.processado_ate:
+                continue
+            par = (formando_id, aula_id)
+            if par in justificadas:
+                continue
+            avaliadas += 1
+            estado.aulas_processadas += 1
+            if par in presentes:
+                estado.faltas_consecutivas = 0
+                estado.taxa_recente = estado.taxa_recente * (1 - alfa) + alfa
+            else:
+                estado.faltas_consecutivas += 1
+                estado.taxa_recente = estado.taxa_recente * (1 - alfa)
+
+            # Só se notifica na passagem do limite, não em cada aula seguinte
+            if estado.faltas_consecutivas >= limite_faltas and not estado.alerta_faltas:
+                estado.alerta_faltas = True
+                if data > ja_notificado:
+                    notificacoes += _notificacoes(
+                        formando_id, formador_id, "Faltas consecutivas",
+                        f"{estado.faltas_consecutivas} faltas seguidas (última: {modulo_nome}, {data:%d/%m/%Y}).",
+                    )
+            elif estado.faltas_consecutivas < limite_faltas:
+                estado.alerta_faltas = False
+
+            if estado.taxa_recente < taxa_minima and not estado.alerta_taxa:
+                estado.alerta_taxa = True
+                if data > ja_notificado:
+                    notificacoes += _notificacoes(
+                        formando_id, formador_id, "Assiduidade em risco",
+                        f"Taxa de presença recente de {estado.taxa_recente:.0%} (mínimo {taxa_minima:.0%}).",
+                    )
+            elif estado.taxa_recente >= taxa_minima:
+                estado.alerta_taxa = False
+        estado.processado_ate = ate
+        estado.notificado_ate = max(ate, ja_notificado)
+
+    campos = [
+        'faltas_consecutivas', 'taxa_recente', 'aulas_processadas',
+        'processado_ate', 'notificado_ate', 'alerta_faltas', 'alerta_taxa',
+    ]
+    with transaction.atomic():
+        EstadoAssiduidade.objects.bulk_create(
+            list(estados.values()),
+            update_conflicts=True,
+            unique_fields=['formando'],
+            update_fields=campos,
+            batch_size=1000,
+        )
+        Notificacao.objects.bulk_create(notificacoes, batch_size=1000)
+    return avaliadas, len(notificacoes)
+
+
+def registar_escrita(registo, aula, removido=False):
+    """Reação imediata a uma escrita de presença (chamada pelos signals)"""
+    estado = EstadoAssiduidade.objects.filter(formando_id=registo.formando_id).first()
+    if estado is None:
+        return
+    if estado.processado_ate and aula.data <= estado.processado_ate:
+        # Correção de uma aula já processada: o histórico deste formando é refeito na próxima passagem
+        EstadoAssiduidade.objects.filter(pk=estado.pk).update(**REINICIO)
+    elif not removido and registo.estado in RegistoPresenca.PRESENTES and estado.faltas_consecutivas:
+        EstadoAssiduidade.objects.filter(pk=estado.pk).update(faltas_consecutivas=0, alerta_faltas=False)
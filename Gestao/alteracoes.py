@@ -0,0 +1,87 @@
+"""
+Feed de alterações das presenças.
+
+Cada escrita em RegistoPresenca, Aula e CodigoPresenca acrescenta uma linha
+a Alteracao (via signals). O id dessa linha é um número de sequência
+monotónico, por isso qualquer cliente pode perguntar "o que mudou desde a
+sequência N" e atualizar-se incrementalmente.
+
+Escritas em massa (bulk_create, QuerySet.update/delete) não disparam
+signals; quem as usa deve chamar registar_em_massa().
+"""
+from django.db.models import Max
+
+from .models import Alteracao, Aula, CodigoPresenca, RegistoPresenca
+
+LIMITE_PADRAO = 1000
+ENTIDADES_SEGUIDAS = (RegistoPresenca, Aula, CodigoPresenca)
+
+
+def _aula_e_modulo(instance):
+    """Aula e módulo a que a escrita diz respeito, sem queries quando já estão em cache"""
+    if isinstance(instance, Aula):
+        return instance.id, instance.modulo_id
+    aula_id = instance.aula_id
+    campo = type(instance)._meta.get_field('aula')
+    if campo.is_cached(instance):
+        return aula_id, instance.aula.modulo_id
+    modulo_id = Aula.objects.filter(id=aula_id).values_list('modulo_id', flat=True).first()
+    return aula_id, modulo_id
+
+
+def registar(instance, operacao):
+    aula_id, modulo_id = _aula_e_modulo(instance)
+    return Alteracao.objects.create(
+        entidade=instance._meta.model_name,
+        objeto_id=instance.pk,
+        operacao=operacao,
+        aula_id=aula_id,
+        modulo_id=modulo_id,
+    )
+
+
+def registar_em_massa(instances, operacao):
+    """Regista várias escritas de uma vez (para código que usa bulk_create ou update)"""
+    return Alteracao.objects.bulk_create([
+        Alteracao(
+            entidade=instance._meta.model_name,
+            objeto_id=instance.pk,
+            operacao=operacao,
+            aula_id=aula_id,
+            modulo_id=modulo_id,
+        )
+        for instance in instances
+        for aula_id, modulo_id in [_aula_e_modulo(instance)]
+    ])
+
+
+def ultima_sequencia(modulos=None):
+    """Número de sequência da última alteração (opcionalmente só dos módulos indicados)"""
+    alteracoes = Alteracao.objects.all()
+    if modulos is not None:
+        alteracoes = alteracoes.filter(modulo_id__in=[getattr(m, 'pk', m) for m in modulos])
+    return alteracoes.aggregate(ultima=Max('id'))['ultima'] or 0
+
+
+def alteracoes_desde(sequencia, limite=LIMITE_PADRAO, entidades=None, modulo_id=None, aula_id=None, ate=None):
+    """Alterações com sequência maior que a indicada (e até `ate`, se dado), por ordem, no máximo `limite`"""
+    alteracoes = Alteracao.objects.filter(id__gt=sequencia)
+    if ate is not None:
+        alteracoes = alteracoes.filter(id__lte=ate)
+    if entidades:
+        alteracoes = alteracoes.filter(entidade__in=entidades)
+    if modulo_id is not None:
+        alteracoes = alteracoes.filter(modulo_id=modulo_id)
+    if aula_id is not None:
+        alteracoes = alteracoes.filter(aula_id=aula_id)
+    return list(alteracoes.order_by('id')[:limite])
+
+
+def aulas_alteradas(sequencia, ate=None, entidades=None):
+    """Ids das aulas tocadas pelas alterações com sequência maior que a indicada (e até `ate`)"""
+    alteracoes = Alteracao.objects.filter(id__gt=sequencia, aula_id__isnull=False)
+    if ate is not None:
+        alteracoes = alteracoes.filter(id__lte=ate)
+    if entidades:
+        alteracoes = alteracoes.filter(entidade__in=entidades)
+    return set(alteracoes.values_list('aula_id', flat=True).distinct())
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class GestaoConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "Gestao"
+
+    def ready(self):
+        # Liga os signals que alimentam o feed de alterações
+        from . import signals  # noqa: F401
@@ -0,0 +1,77 @@
+"""
+Regras de assiduidade com faltas virtuais.
+
+Uma falta não é guardada como linha de RegistoPresenca: é inferida como
+(formandos inscritos) - (formandos com estado presente/atrasado). Só existe linha
+para uma falta quando esta traz dados próprios (justificação, documento ou
+falta_justificada).
+"""
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Aula, Inscricao, RegistoPresenca
+
+
+def aulas_realizadas(aulas):
+    """Só as aulas que já aconteceram podem ter faltas"""
+    return aulas.filter(data__lte=timezone.now().date())
+
+
+def presencas_por_aula(aulas):
+    """Número de presenças de cada aula, numa única query agrupada"""
+    return dict(
+        RegistoPresenca.objects.filter(aula__in=aulas, estado__in=RegistoPresenca.PRESENTES)
+        .values_list('aula')
+        .annotate(total=Count('id'))
+    )
+
+
+def resumo_modulo(modulo):
+    """Totais de aulas, presenças, faltas e atrasos de um módulo"""
+    aulas = Aula.objects.filter(modulo=modulo)
+    totais = RegistoPresenca.objects.filter(aula__modulo=modulo).aggregate(
+        presencas=Count('id', filter=Q(estado__in=RegistoPresenca.PRESENTES)),
+        atrasos=Count('id', filter=Q(estado='atrasado')),
+        presencas_realizadas=Count(
+            'id', filter=Q(estado__in=RegistoPresenca.PRESENTES, aula__data__lte=timezone.now().date())
+        ),
+    )
+    inscritos = Inscricao.objects.formandos_de(modulo).count()
+    esperados = aulas_realizadas(aulas).count() * inscritos
+    return {
+        'total_aulas': aulas.count(),
+        'inscritos': inscritos,
+        'presencas': totais['presencas'],
+        'faltas': max(0, esperados - totais['presencas_realizadas']),
+        'atrasos': totais['atrasos'],
+    }
+
+
+def registo_tem_dados(registo):
+    """Uma linha de falta só se justifica se guardar informação além da ausência"""
+    return bool(
+        registo.entrada
+        or registo.falta_justificada
+        or registo.motivo_atraso
+        or registo.justificativo
+    )
+
+
+def marcar_falta(formando_id, aula, justificacao=""):
+    """Regista uma falta: guarda a justificação se existir, senão remove a linha"""
+    registo = RegistoPresenca.objects.filter(formando_id=formando_id, aula=aula).first()
+    if registo is None and not justificacao:
+        return None
+    if registo is None:
+        registo = RegistoPresenca(formando_id=formando_id, aula=aula)
+    registo.entrada = None
+    registo.saida = None
+    registo.motivo_atraso = justificacao
+    registo.falta_justificada = registo.falta_justificada or bool(justificacao)
+    registo.estado = 'justificada' if registo.falta_justificada else 'falta'
+    if registo_tem_dados(registo):
+        registo.save()
+        return registo
+    if registo.pk:
+        registo.delete()
+    return None
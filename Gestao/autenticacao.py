@@ -0,0 +1,99 @@
+"""
+Autenticação para os frontends Streamlit.
+
+O PBKDF2 do Django demora centenas de milissegundos por verificação. Para
+que o início de uma aula (a turma inteira a entrar ao mesmo tempo) não
+sature o processo, os hashes correm num pool limitado de threads, e uma
+sessão já autenticada é retomada com um token assinado e com validade,
+sem voltar a calcular o hash.
+
+iniciar_autenticacao() devolve logo um Future: o script Streamlit liberta a
+thread e vai vendo se o hash já terminou (auth/login.py); depois
+concluir_autenticacao() grava, na thread do script, o novo hash quando o
+algoritmo ou as iterações mudaram, como faz User.check_password.
+"""
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password
+from django.core import signing
+from django.db.models import F
+from django.utils.crypto import constant_time_compare
+
+from .models import Utilizador
+
+TOKEN_SALT = "Gestao.autenticacao.sessao"
+
+_pool_hash = ThreadPoolExecutor(
+    max_workers=getattr(settings, "LOGIN_HASH_WORKERS", None) or os.cpu_count() or 1,
+    thread_name_prefix="login-hash",
+)
+
+
+def _verificar(user, password):
+    """Corre no pool: (utilizador ou None, palavra-passe a voltar a guardar ou None); não toca na base de dados"""
+    novo_hash = []
+    if not check_password(password, user.password, setter=novo_hash.append):
+        return None, None
+    return user, (novo_hash[0] if novo_hash else None)
+
+
+def iniciar_autenticacao(username, password):
+    """Agenda a verificação no pool e devolve o Future sem esperar pelo hash.
+
+    Lança Utilizador.DoesNotExist se o utilizador não existir.
+    """
+    user = Utilizador.objects.get(username=username)
+    if not user.is_active:
+        futuro = Future()
+        futuro.set_result((None, None))
+        return futuro
+    return _pool_hash.submit(_verificar, user, password)
+
+
+def concluir_autenticacao(futuro):
+    """Utilizador autenticado (ou None) de um Future terminado; guarda o hash atualizado se for preciso"""
+    user, password = futuro.result()
+    if user is not None and password is not None:
+        user.set_password(password)
+        user.save(update_fields=['password'])
+    return user
+
+
+def autenticar(username, password):
+    """Versão síncrona: devolve o utilizador se a palavra-passe estiver correta, None caso contrário"""
+    return concluir_autenticacao(iniciar_autenticacao(username, password))
+
+
+def criar_token_sessao(user):
+    """Token assinado que identifica o utilizador, a sua palavra-passe atual e a versão da sessão"""
+    return signing.dumps(
+        {"u": user.pk, "h": user.get_session_auth_hash(), "v": user.versao_sessao},
+        salt=TOKEN_SALT,
+        compress=True,
+    )
+
+
+def utilizador_do_token(token, max_age=None):
+    """Retoma a sessão a partir do token; None se for inválido, expirado ou revogado"""
+    if max_age is None:
+        max_age = settings.SESSAO_STREAMLIT_DURACAO
+    try:
+        dados = signing.loads(token, salt=TOKEN_SALT, max_age=max_age)
+    except signing.BadSignature:
+        return None
+    user = Utilizador.objects.filter(pk=dados.get("u"), is_active=True).first()
+    # Mudar a palavra-passe muda o hash de sessão e invalida os tokens anteriores
+    if user is None or not constant_time_compare(dados.get("h", ""), user.get_session_auth_hash()):
+        return None
+    # Terminar a sessão incrementa a versão e revoga os tokens anteriores (URLs copiados, stream SSE)
+    if dados.get("v") != user.versao_sessao:
+        return None
+    return user
+
+
+def revogar_sessoes(user):
+    """Invalida todos os tokens de sessão já emitidos para o utilizador"""
+    Utilizador.objects.filter(pk=user.pk).update(versao_sessao=F("versao_sessao") + 1)
+    user.refresh_from_db(fields=["versao_sessao"])
@@ -0,0 +1,136 @@
+"""
+Códigos de presença.
+
+Os códigos do dia são pré-gerados de uma vez (comando gerar_codigos, de
+manhã) e cada um só é aceite a partir de CODIGO_ANTECEDENCIA_MINUTOS antes
+do início da sua aula e até CODIGO_VALIDADE_MINUTOS depois. Abrir a página
+do formador só lê o código ativo da aula, o mesmo em qualquer sessão ou
+dispositivo; só o botão "Gerar Novo Código" escreve na base de dados.
+
+O código é partilhado pela turma inteira, por isso usá-lo não o invalida:
+deixa de servir quando expira ou quando o formador gera outro (fica
+substituído). Se foi usado vê-se pelas presenças da aula
+(servicos.usos_codigos).
+
+Os códigos em vigor vivem também em CodigoAtivo, uma tabela pequena na
+mesma base de dados que todos os processos (workers Streamlit, Django,
+comandos) leem: validar um código é uma leitura pela chave primária, sem
+tocar no histórico de CodigoPresenca. A tabela é mantida pelos signals de
+CodigoPresenca e, nas operações em massa, por sincronizar(); os expirados
+são apagados por limpar_expirados() (comando limpar_codigos, agendado).
+"""
+import secrets
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .alteracoes import registar_em_massa
+from .models import Aula, CodigoAtivo, CodigoPresenca
+
+
+def _novos_codigos(n):
+    """n códigos de 6 caracteres distintos entre si e dos já existentes"""
+    codigos = set()
+    while len(codigos) < n:
+        candidatos = {secrets.token_hex(3).upper() for _ in range(n - len(codigos))}
+        existentes = set(CodigoPresenca.objects.filter(codigo__in=candidatos).values_list('codigo', flat=True))
+        codigos |= candidatos - existentes
+    return list(codigos)
+
+
+def _inicio_periodo(aula):
+    inicio = settings.HORARIO_PERIODOS.get(aula.periodo)
+    inicio = time.fromisoformat(inicio) if inicio else time.min
+    return timezone.make_aware(datetime.combine(aula.data, inicio))
+
+
+def inicio_validade(aula):
+    """Início da validade de um código pré-gerado: início do período - CODIGO_ANTECEDENCIA_MINUTOS"""
+    return _inicio_periodo(aula) - timedelta(minutes=settings.CODIGO_ANTECEDENCIA_MINUTOS)
+
+
+def expiracao(aula):
+    """Fim da validade de um código pré-gerado: início do período + CODIGO_VALIDADE_MINUTOS"""
+    return _inicio_periodo(aula) + timedelta(minutes=settings.CODIGO_VALIDADE_MINUTOS)
+
+
+def por_expirar(agora=None):
+    """Códigos ainda não expirados, incluindo os pré-gerados cuja validade ainda não começou"""
+    return CodigoAtivo.objects.filter(expira__gte=agora or timezone.now())
+
+
+def ativos(agora=None):
+    """Códigos aceites agora num check-in"""
+    agora = agora or timezone.now()
+    return por_expirar(agora).filter(Q(valido_desde__isnull=True) | Q(valido_desde__lte=agora))
+
+
+def sincronizar(codigos, agora=None):
+    """Acerta o registo de códigos ativos com os CodigoPresenca indicados"""
+    agora = agora or timezone.now()
+    em_vigor = [c for c in codigos if c.valido and c.expira and c.expira >= agora]
+    retirados = {c.codigo for c in codigos} - {c.codigo for c in em_vigor}
+    if retirados:
+        CodigoAtivo.objects.filter(codigo__in=retirados).delete()
+    CodigoAtivo.objects.bulk_create(
+        [CodigoAtivo(codigo=c.codigo, aula_id=c.aula_id, expira=c.expira, valido_desde=c.valido_desde)
+         for c in em_vigor],
+        update_conflicts=True,
+        unique_fields=['codigo'],
+        update_fields=['aula', 'expira', 'valido_desde'],
+    )
+
+
+def remover(codigo):
+    CodigoAtivo.objects.filter(codigo=codigo).delete()
+
+
+def limpar_expirados(agora=None):
+    """Apaga do registo os códigos expirados; devolve quantos apagou"""
+    return CodigoAtivo.objects.filter(expira__lt=agora or timezone.now()).delete()[0]
+
+
+def pre_gerar(dia=None, agora=None):
+    """Cria um código para cada aula do dia que ainda não tenha um por expirar; devolve quantos criou"""
+    agora = agora or timezone.now()
+    dia = dia or timezone.localdate(agora)
+    com_codigo = por_expirar(agora).filter(aula__data=dia).values('aula_id')
+    # Aulas cuja janela já passou (corrida a meio do dia) ficariam com um código já expirado
+    aulas = [a for a in Aula.objects.filter(data=dia).exclude(id__in=com_codigo) if expiracao(a) > agora]
+    if not aulas:
+        return 0
+    with transaction.atomic():
+        criados = CodigoPresenca.objects.bulk_create([
+            CodigoPresenca(aula=aula, codigo=codigo, valido_desde=inicio_validade(aula), expira=expiracao(aula))
+            for aula, codigo in zip(aulas, _novos_codigos(len(aulas)))
+        ])
+        # bulk_create não dispara signals: o feed de alterações e o registo são alimentados aqui
+        registar_em_massa(criados, 'criar')
+        sincronizar(criados, agora)
+    limpar_expirados(agora)
+    return len(criados)
+
+
+def codigo_ativo(aula_id):
+    """Código da aula a mostrar ao formador (o mais recente, mesmo que ainda não aceite), ou None; nunca escreve"""
+    return por_expirar().filter(aula_id=aula_id).order_by('-expira').first()
+
+
+def gerar_novo(aula_id):
+    """Substitui o código ativo da aula por um novo, válido CODIGO_VALIDADE_MINUTOS a partir de agora"""
+    with transaction.atomic():
+        em_vigor = CodigoAtivo.objects.filter(aula_id=aula_id)
+        anteriores = list(CodigoPresenca.objects.filter(codigo__in=em_vigor.values('codigo')).select_related('aula'))
+        CodigoPresenca.objects.filter(id__in=[c.id for c in anteriores]).update(valido=False)
+        registar_em_massa(anteriores, 'atualizar')
+        em_vigor.delete()
+        # O signal de post_save acrescenta o novo código ao registo
+        return CodigoPresenca.objects.create(aula_id=aula_id, codigo=_novos_codigos(1)[0])
+
+
+def aula_do_codigo(codigo, agora=None):
+    """Aula de um código aceite agora, ou None (uma leitura pela chave primária do registo)"""
+    return ativos(agora).filter(pk=codigo).values_list('aula_id', flat=True).first()
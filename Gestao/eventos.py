@@ -0,0 +1,137 @@
+"""
+Pub/sub em processo para eventos de presença em tempo real (SSE).
+
+Os check-ins são escritos pelos processos Streamlit, não pelo Django, por
+isso o broker é alimentado por uma única thread que segue o feed de
+alterações (Gestao.alteracoes) a cada INTERVALO segundos, apenas para as
+aulas com subscritores. Cada ligação SSE fica à espera na sua própria fila;
+o custo na base de dados é o mesmo com 1 ou 100 formadores ligados.
+
+Cada stream ocupa uma thread do gunicorn enquanto está aberto, por isso há
+no máximo SSE_MAXIMO_STREAMS por processo (o resto fica livre para os
+outros pedidos, incluindo /saude/) e cada um termina ao fim de
+SSE_DURACAO_MAXIMA segundos; o EventSource do browser volta a ligar-se.
+"""
+import logging
+import queue
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .alteracoes import alteracoes_desde, ultima_sequencia
+from .assiduidade import presencas_por_aula
+from .models import RegistoPresenca
+
+INTERVALO = 0.5  # segundos entre leituras do feed
+TAMANHO_FILA = 100  # eventos pendentes por subscritor antes de descartar
+LOTE = 1000  # alterações lidas do feed de cada vez
+
+logger = logging.getLogger(__name__)
+
+
+class Broker:
+    def __init__(self, maximo_streams=None, seguir=True):
+        self._lock = threading.Lock()
+        self._subscritores = defaultdict(set)
+        # seguir=False: ninguém lê o feed sozinho, quem usa o broker chama _avancar() (testes)
+        self._seguir_feed = seguir
+        self._seguidor = None
+        self._parado = threading.Event()
+        self._streams = threading.Semaphore(maximo_streams or settings.SSE_MAXIMO_STREAMS)
+
+    def reservar_stream(self):
+        """Ocupa um dos lugares de stream deste processo; False se estiverem todos ocupados"""
+        return self._streams.acquire(blocking=False)
+
+    def libertar_stream(self):
+        self._streams.release()
+
+    def subscrever(self, aula_id):
+        fila = queue.Queue(maxsize=TAMANHO_FILA)
+        with self._lock:
+            self._subscritores[aula_id].add(fila)
+            if self._seguir_feed and (self._seguidor is None or not self._seguidor.is_alive()):
+                self._parado.clear()
+                self._seguidor = threading.Thread(target=self._seguir, name="sse-seguidor", daemon=True)
+                self._seguidor.start()
+        return fila
+
+    def cancelar(self, aula_id, fila):
+        with self._lock:
+            self._subscritores[aula_id].discard(fila)
+            if not self._subscritores[aula_id]:
+                del self._subscritores[aula_id]
+
+    def parar(self):
+        """Termina a thread que segue o feed e espera por ela"""
+        self._parado.set()
+        with self._lock:
+            seguidor, self._seguidor = self._seguidor, None
+        if seguidor is not None:
+            seguidor.join()
+
+    def aulas_subscritas(self):
+        with self._lock:
+            return list(self._subscritores)
+
+    def publicar(self, aula_id, evento):
+        with self._lock:
+            filas = list(self._subscritores.get(aula_id, ()))
+        for fila in filas:
+            try:
+                fila.put_nowait(evento)
+            except queue.Full:
+                # Cliente lento: perde eventos antigos, o próximo traz a contagem atualizada
+                pass
+
+    def _seguir(self):
+        sequencia = None
+        while not self._parado.wait(INTERVALO):
+            try:
+                sequencia = self._avancar(sequencia)
+            except Exception:
+                # Um erro da base de dados (ex.: "database is locked") não pode matar a thread
+                logger.exception("Falha ao seguir o feed de alterações; nova tentativa em %ss", INTERVALO)
+            finally:
+                close_old_connections()
+
+    def _avancar(self, sequencia):
+        """Publica o que mudou desde `sequencia` e devolve até onde chegou"""
+        ultima = ultima_sequencia()
+        aulas = self.aulas_subscritas()
+        # Sem subscritores a sequência avança na mesma: quem subscrever depois não recebe eventos antigos
+        if sequencia is None or not aulas:
+            return ultima
+        # O atraso acumulado é lido em lotes, nunca de uma só vez
+        ate = min(ultima, sequencia + LOTE)
+        if ate > sequencia:
+            self._publicar_alteracoes(sequencia, ate, aulas)
+        return ate
+
+    def _publicar_alteracoes(self, desde, ate, aulas):
+        alteracoes = [
+            a for a in alteracoes_desde(desde, limite=ate - desde, entidades=['registopresenca'], ate=ate)
+            if a.aula_id in aulas
+        ]
+        if not alteracoes:
+            return
+        registos = RegistoPresenca.objects.select_related('formando').in_bulk(
+            [a.objeto_id for a in alteracoes if a.operacao != 'remover']
+        )
+        presentes = presencas_por_aula({a.aula_id for a in alteracoes})
+        for alteracao in alteracoes:
+            registo = registos.get(alteracao.objeto_id)
+            self.publicar(alteracao.aula_id, {
+                "seq": alteracao.id,
+                "aula": alteracao.aula_id,
+                "operacao": alteracao.operacao,
+                "formando": (registo.formando.get_full_name() or registo.formando.username) if registo else None,
+                "entrada": registo.entrada.isoformat() if registo and registo.entrada else None,
+                "estado": registo.estado if registo else None,
+                "presentes": presentes.get(alteracao.aula_id, 0),
+            })
+
+
+broker = Broker()
@@ -0,0 +1,122 @@
+"""
+Ledger de horas assistidas por formando e módulo (HorasAssistidas).
+
+Cada registo com entrada conta o intervalo entrada→saída, limitado à
+duração de uma aula (DURACAO_AULA_HORAS); sem saída conta a aula inteira.
+O cálculo do curso inteiro é vetorizado com NumPy e gravado num único
+upsert; as escritas individuais atualizam só o par formando×módulo
+afetado (ver signals), em Python simples, sem carregar o NumPy.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, FloatField, Sum
+from django.db.models.functions import Cast
+
+from .models import HorasAssistidas, Inscricao, Modulo, RegistoPresenca
+
+
+def _horas(entrada, saida):
+    """Horas de um registo: saida - entrada, entre 0 e a duração de uma aula"""
+    duracao = settings.DURACAO_AULA_HORAS * 3600
+    if entrada is None or saida is None:
+        return duracao / 3600
+    return min(max((saida - entrada).total_seconds(), 0), duracao) / 3600
+
+
+def _duracoes_horas(entradas, saidas):
+    """O mesmo que _horas para todos os registos de uma vez (timestamps, NaN quando faltam)"""
+    import numpy as np
+
+    duracao = settings.DURACAO_AULA_HORAS * 3600
+    em_falta = np.isnan(entradas) | np.isnan(saidas)
+    segundos = np.where(em_falta, duracao, np.clip(np.nan_to_num(saidas - entradas), 0, duracao))
+    return segundos / 3600
+
+
+def _timestamps(valores):
+    import numpy as np
+
+    return np.fromiter((v.timestamp() if v else np.nan for v in valores), dtype=float, count=len(valores))
+
+
+def calcular_curso(curso):
+    """Recalcula o ledger de todos os formandos inscritos em todos os módulos do curso"""
+    # Só o cálculo em lote precisa do NumPy; os check-ins não pagam o import
+    import numpy as np
+
+    modulos = list(Modulo.objects.filter(curso=curso))
+    registos = list(
+        RegistoPresenca.objects.filter(aula__modulo__curso=curso, estado__in=RegistoPresenca.PRESENTES)
+        .values_list('formando_id', 'aula__modulo_id', 'entrada', 'saida')
+    )
+
+    linhas = {}
+    # Todos os inscritos ficam no ledger, mesmo com zero horas
+    for modulo in modulos:
+        for formando_id in Inscricao.objects.formandos_de(modulo).values_list('id', flat=True):
+            linhas[(formando_id, modulo.id)] = (0.0, 0)
+
+    if registos:
+        formandos, modulos_ids, entradas, saidas = zip(*registos)
+        horas = _duracoes_horas(_timestamps(entradas), _timestamps(saidas))
+        pares = np.column_stack([np.asarray(formandos), np.asarray(modulos_ids)])
+        unicos, inverso = np.unique(pares, axis=0, return_inverse=True)
+        inverso = inverso.ravel()
+        total_horas = np.bincount(inverso, weights=horas, minlength=len(unicos))
+        total_aulas = np.bincount(inverso, minlength=len(unicos))
+        for (formando_id, modulo_id), h, n in zip(unicos.tolist(), total_horas.tolist(), total_aulas.tolist()):
+            linhas[(formando_id, modulo_id)] = (h, n)
+
+    with transaction.atomic():
+        # Reescrita completa do curso: também remove linhas de inscrições que já não existem
+        HorasAssistidas.objects.filter(modulo__curso=curso).delete()
+        HorasAssistidas.objects.bulk_create(
+            [HorasAssistidas(formando_id=f, modulo_id=m, horas=h, aulas_presentes=n)
+             for (f, m), (h, n) in linhas.items()],
+            batch_size=1000,
+        )
+    return len(linhas)
+
+
+def atualizar_par(formando_id, aula):
+    """Atualiza incrementalmente a linha do formando no módulo da aula"""
+    modulo_id = aula.modulo_id
+    registos = list(
+        RegistoPresenca.objects.filter(
+            formando_id=formando_id, aula__modulo_id=modulo_id, estado__in=RegistoPresenca.PRESENTES
+        )
+        .values_list('entrada', 'saida')
+    )
+    horas = sum(_horas(entrada, saida) for entrada, saida in registos)
+    HorasAssistidas.objects.update_or_create(
+        formando_id=formando_id,
+        modulo_id=modulo_id,
+        defaults={'horas': horas, 'aulas_presentes': len(registos)},
+    )
+
+
+def abaixo_do_limite(curso, limite=None, por_modulo=False):
+    """Formandos abaixo do limite de assiduidade, numa única query.
+
+    Por omissão compara o total de horas com a carga horária do curso; com
+    por_modulo=True compara cada módulo com a sua carga horária.
+    """
+    if limite is None:
+        limite = settings.LIMITE_ASSIDUIDADE
+    linhas = HorasAssistidas.objects.filter(modulo__curso=curso)
+    if por_modulo:
+        return (
+            linhas.annotate(percentagem=F('horas') * 100 / Cast('modulo__carga_horaria', FloatField()))
+            .filter(percentagem__lt=limite * 100)
+            .select_related('formando', 'modulo')
+            .order_by('percentagem')
+        )
+    return (
+        linhas.values('formando_id', 'formando__username', 'formando__first_name', 'formando__last_name')
+        .annotate(
+            horas_total=Sum('horas'),
+            percentagem=Sum('horas') * 100 / Cast(F('modulo__curso__carga_horaria_total'), FloatField()),
+        )
+        .filter(percentagem__lt=limite * 100)
+        .order_by('percentagem')
+    )
@@ -0,0 +1,185 @@
+"""
+Índice de presenças em bitmap.
+
+Cada aula guarda um bitmap (IndicePresenca) em que o bit n está ligado se o
+formando na posição n do roster do curso (PosicaoRoster) esteve presente.
+Em memória o bitmap é um int do Python, por isso AND/OR/NOT e popcount
+entre aulas são operações nativas; em disco é guardado comprimido.
+
+O índice é atualizado em cada escrita de RegistoPresenca (ver signals); a
+migração 0008 preenche-o com os registos que já existiam e o comando
+reconstruir_indice_presencas (corrido todas as noites pelo agendador)
+reconstrói-o a partir da tabela.
+"""
+import zlib
+from functools import reduce
+
+from django.db import transaction
+from django.db.models import Max
+
+from .assiduidade import aulas_realizadas
+from .models import Aula, IndicePresenca, Inscricao, PosicaoRoster, RegistoPresenca
+
+# Primeiro byte do valor guardado: indica se o resto vem comprimido ou não
+_CRU = b'\x00'
+_ZLIB = b'\x01'
+
+
+def comprimir(bits):
+    cru = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    comprimido = zlib.compress(cru)
+    # Rosters pequenos ficam maiores com zlib; nesse caso guarda-se em bruto
+    if len(comprimido) < len(cru):
+        return _ZLIB + comprimido
+    return _CRU + cru
+
+
+def descomprimir(dados):
+    dados = bytes(dados)
+    if not dados:
+        return 0
+    corpo = dados[1:]
+    if dados[:1] == _ZLIB:
+        corpo = zlib.decompress(corpo)
+    return int.from_bytes(corpo, 'little')
+
+
+def formandos_do_bitmap(bits, roster):
+    """Converte um bitmap em ids de formandos; roster é {posicao: formando_id}"""
+    resultado = []
+    while bits:
+        menor = bits & -bits
+        resultado.append(roster[menor.bit_length() - 1])
+        bits ^= menor
+    return resultado
+
+
+# --------------------------
+# Roster
+# --------------------------
+def posicoes(curso_id, formando_ids):
+    """Posições dos formandos no roster do curso, atribuindo as que faltarem"""
+    formando_ids = set(formando_ids)
+    atuais = dict(
+        PosicaoRoster.objects.filter(curso_id=curso_id, formando_id__in=formando_ids)
+        .values_list('formando_id', 'posicao')
+    )
+    novos = sorted(formando_ids - set(atuais))
+    if novos:
+        with transaction.atomic(savepoint=False):
+            proxima = PosicaoRoster.objects.filter(curso_id=curso_id).aggregate(m=Max('posicao'))['m']
+            proxima = 0 if proxima is None else proxima + 1
+            PosicaoRoster.objects.bulk_create([
+                PosicaoRoster(curso_id=curso_id, formando_id=formando_id, posicao=proxima + i)
+                for i, formando_id in enumerate(novos)
+            ])
+        atuais.update({formando_id: proxima + i for i, formando_id in enumerate(novos)})
+    return atuais
+
+
+def roster(curso_id):
+    """{posicao: formando_id} do curso"""
+    return dict(PosicaoRoster.objects.filter(curso_id=curso_id).values_list('posicao', 'formando_id'))
+
+
+def mascara_inscritos(modulo):
+    """Bitmap com os formandos inscritos no módulo"""
+    ids = Inscricao.objects.formandos_de(modulo).values_list('id', flat=True)
+    return reduce(lambda acc, pos: acc | (1 << pos), posicoes(modulo.curso_id, ids).values(), 0)
+
+
+# --------------------------
+# Escrita
+# --------------------------
+def atualizar_registo(registo, aula, removido=False):
+    """Liga ou desliga o bit do formando no bitmap da aula do registo"""
+    curso_id = aula.modulo.curso_id
+    bit = 1 << posicoes(curso_id, [registo.formando_id])[registo.formando_id]
+    presente = not removido and registo.estado in RegistoPresenca.PRESENTES
+    with transaction.atomic(savepoint=False):
+        if presente:
+            indice, _ = IndicePresenca.objects.select_for_update().get_or_create(aula_id=registo.aula_id)
+        else:
+            # Remover nunca cria índice (a aula pode estar a ser apagada em cascata)
+            indice = IndicePresenca.objects.select_for_update().filter(aula_id=registo.aula_id).first()
+            if indice is None:
+                return
+        bits = descomprimir(indice.bitmap)
+        bits = bits | bit if presente else bits & ~bit
+        indice.bitmap = comprimir(bits)
+        indice.presentes = bits.bit_count()
+        indice.save()
+
+
+def reconstruir(cursos=None):
+    """Recalcula todos os bitmaps a partir de RegistoPresenca; devolve o número de aulas indexadas"""
+    aulas = Aula.objects.all()
+    if cursos is not None:
+        aulas = aulas.filter(modulo__curso__in=cursos)
+    registos = (
+        RegistoPresenca.objects.filter(aula__in=aulas, estado__in=RegistoPresenca.PRESENTES)
+        .values_list('aula_id', 'aula__modulo__curso_id', 'formando_id')
+    )
+    por_curso = {}
+    for aula_id, curso_id, formando_id in registos:
+        por_curso.setdefault(curso_id, []).append((aula_id, formando_id))
+
+    bitmaps = dict.fromkeys(aulas.values_list('id', flat=True), 0)
+    for curso_id, pares in por_curso.items():
+        pos = posicoes(curso_id, {formando_id for _, formando_id in pares})
+        for aula_id, formando_id in pares:
+            bitmaps[aula_id] |= 1 << pos[formando_id]
+
+    with transaction.atomic():
+        IndicePresenca.objects.filter(aula__in=aulas).delete()
+        IndicePresenca.objects.bulk_create(
+            [IndicePresenca(aula_id=aula_id, bitmap=comprimir(bits), presentes=bits.bit_count())
+             for aula_id, bits in bitmaps.items()],
+            batch_size=1000,
+        )
+    return len(bitmaps)
+
+
+# --------------------------
+# Consultas
+# --------------------------
+def bitmaps(aulas):
+    """{aula_id: bitmap} das aulas indicadas (aulas sem índice contam como vazias)"""
+    aula_ids = [getattr(a, 'pk', a) for a in aulas]
+    guardados = dict(IndicePresenca.objects.filter(aula_id__in=aula_ids).values_list('aula_id', 'bitmap'))
+    return {aula_id: descomprimir(guardados.get(aula_id, b'')) for aula_id in aula_ids}
+
+
+def presentes_em_todas(curso_id, aulas):
+    """Formandos presentes em todas as aulas indicadas (AND)"""
+    mapas = list(bitmaps(aulas).values())
+    if not mapas:
+        return []
+    return formandos_do_bitmap(reduce(int.__and__, mapas), roster(curso_id))
+
+
+def presentes_em_alguma(curso_id, aulas):
+    """Formandos presentes em pelo menos uma das aulas indicadas (OR)"""
+    return formandos_do_bitmap(reduce(int.__or__, bitmaps(aulas).values(), 0), roster(curso_id))
+
+
+def contagens(aulas):
+    """Número de presentes por aula (popcount já guardado, sem descomprimir)"""
+    aula_ids = [getattr(a, 'pk', a) for a in aulas]
+    return dict(IndicePresenca.objects.filter(aula_id__in=aula_ids).values_list('aula_id', 'presentes'))
+
+
+def faltas_consecutivas(modulo, n, aulas=None):
+    """Formandos inscritos que faltaram a pelo menos n aulas seguidas (já realizadas) do módulo"""
+    if aulas is None:
+        aulas = Aula.objects.filter(modulo=modulo)
+    aula_ids = list(aulas_realizadas(aulas).order_by('data', 'periodo', 'id').values_list('id', flat=True))
+    inscritos = mascara_inscritos(modulo)
+    mapas = bitmaps(aula_ids)
+    faltas = [inscritos & ~mapas[aula_id] for aula_id in aula_ids]
+
+    # Para cada janela de n aulas seguidas: faltou a todas = AND das faltas da janela
+    resultado = 0
+    for inicio in range(len(faltas) - n + 1):
+        resultado |= reduce(int.__and__, faltas[inicio:inicio + n])
+    return formandos_do_bitmap(resultado, roster(modulo.curso_id))
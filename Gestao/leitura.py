@@ -0,0 +1,60 @@
+"""
+Separação entre leituras dos painéis e escritas.
+
+As agregações longas dos painéis (página do coordenador, monitor de
+códigos, relatórios) leem pela ligação "leitura": o mesmo ficheiro SQLite
+aberto com mode=ro e PRAGMA query_only, sem nunca pedir um lock de escrita.
+Com a base de dados em WAL (ativar_wal), um leitor não bloqueia quem escreve (o check-in)
+e vê sempre tudo o que já foi confirmado, por isso não há atraso de réplica.
+
+Só as leituras feitas dentro de painel() mudam de ligação; tudo o resto
+(e qualquer leitura dentro de uma transação, que tem de ver as próprias
+escritas) continua na ligação "default".
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+LEITURA = "leitura"
+
+_em_painel = ContextVar('em_painel', default=False)
+
+
+@contextmanager
+def painel():
+    """Encaminha para a ligação só de leitura as queries feitas no bloco (também serve de decorator)"""
+    token = _em_painel.set(True)
+    try:
+        yield
+    finally:
+        _em_painel.reset(token)
+
+
+def ativar_wal(ligacao):
+    """Passa o ficheiro SQLite da ligação a WAL (fica guardado no ficheiro); devolve o modo resultante"""
+    with ligacao.cursor() as cursor:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        return cursor.fetchone()[0]
+
+
+class RouterLeitura:
+    """Leituras dos painéis na ligação "leitura"; escritas e migrações sempre na "default" """
+
+    def db_for_read(self, model, **hints):
+        if not _em_painel.get() or LEITURA not in settings.DATABASES:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return LEITURA
+
+    def db_for_write(self, model, **hints):
+        # Instâncias lidas num painel trazem _state.db = "leitura"; gravá-las vai na mesma para a default
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # as duas ligações são o mesmo ficheiro
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != LEITURA
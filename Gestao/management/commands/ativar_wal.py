@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from Gestao.leitura import ativar_wal
+
+
+class Command(BaseCommand):
+    help = 'Passa a base de dados SQLite a WAL, para que as leituras dos painéis não bloqueiem os check-ins.'
+
+    def handle(self, *args, **options):
+        ligacao = connections[DEFAULT_DB_ALIAS]
+        if ligacao.vendor != 'sqlite':
+            self.stdout.write(f"{ligacao.vendor}: nada a fazer")
+            return
+        self.stdout.write(self.style.SUCCESS(f"journal_mode={ativar_wal(ligacao)}"))
@@ -0,0 +1,22 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from Gestao.alertas import processar
+
+
+class Command(BaseCommand):
+    help = 'Atualiza as sequências de faltas e taxas de presença e cria os alertas de assiduidade.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ate', type=date.fromisoformat, help='Processar até esta data (AAAA-MM-DD); por omissão ontem')
+        parser.add_argument('--desde-inicio', action='store_true', help='Refaz o estado de todos a partir do histórico completo')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        avaliadas, notificacoes = processar(ate=options['ate'], desde_inicio=options['desde_inicio'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{avaliadas} presenças/faltas avaliadas, {notificacoes} notificações criadas "
+            f"em {time.perf_counter() - inicio:.2f}s"
+        ))
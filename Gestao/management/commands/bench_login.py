@@ -0,0 +1,44 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import check_password, make_password
+from django.core import signing
+from django.core.management.base import BaseCommand
+
+from Gestao.autenticacao import TOKEN_SALT
+
+
+class Command(BaseCommand):
+    help = 'Mede logins por segundo (hash da palavra-passe) e retomas de sessão por token, por core.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=64, help='Número de logins simulados')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Threads no pool de hash')
+
+    def handle(self, *args, **options):
+        total = options['logins']
+        workers = options['workers']
+        encoded = make_password('12345678')
+
+        # --- Login completo: um PBKDF2 por pedido ---
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            inicio = time.perf_counter()
+            resultados = list(pool.map(lambda _: check_password('12345678', encoded), range(total)))
+            duracao = time.perf_counter() - inicio
+        assert all(resultados)
+        por_segundo = total / duracao
+
+        # --- Retoma de sessão: só verificar a assinatura do token ---
+        token = signing.dumps({'u': 1, 'h': 'x' * 64}, salt=TOKEN_SALT, compress=True)
+        n_tokens = total * 1000
+        inicio = time.perf_counter()
+        for _ in range(n_tokens):
+            signing.loads(token, salt=TOKEN_SALT, max_age=3600)
+        tokens_por_segundo = n_tokens / (time.perf_counter() - inicio)
+
+        self.stdout.write(f"Logins: {total} em {duracao:.2f}s com {workers} workers")
+        cores = min(workers, os.cpu_count() or 1)
+        self.stdout.write(f"  {por_segundo:.1f} logins/s ({por_segundo / cores:.1f} logins/s por core)")
+        self.stdout.write(f"Retoma por token: {tokens_por_segundo:.0f} sessões/s num core")
+        self.stdout.write(self.style.SUCCESS("Benchmark concluído"))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Gestao.horas import abaixo_do_limite, calcular_curso
+from Gestao.models import Curso
+
+
+class Command(BaseCommand):
+    help = 'Recalcula as horas assistidas por formando e módulo e lista quem está abaixo do limite.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--curso', type=int, action='append', help='Só os cursos indicados (repetível)')
+        parser.add_argument('--limite', type=float, help='Fração mínima da carga horária (por omissão LIMITE_ASSIDUIDADE)')
+
+    def handle(self, *args, **options):
+        cursos = Curso.objects.all()
+        if options['curso']:
+            cursos = cursos.filter(id__in=options['curso'])
+
+        for curso in cursos:
+            inicio = time.perf_counter()
+            linhas = calcular_curso(curso)
+            self.stdout.write(f"{curso.nome}: {linhas} linhas em {time.perf_counter() - inicio:.2f}s")
+            for linha in abaixo_do_limite(curso, options['limite']):
+                nome = f"{linha['formando__first_name']} {linha['formando__last_name']}".strip() or linha['formando__username']
+                self.stdout.write(f"  {nome}: {linha['horas_total']:.1f}h ({linha['percentagem']:.1f}%)")
+
+        self.stdout.write(self.style.SUCCESS("Horas assistidas atualizadas"))
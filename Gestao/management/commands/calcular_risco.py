@@ -0,0 +1,30 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from Gestao.risco import calcular, mais_em_risco
+
+
+class Command(BaseCommand):
+    help = 'Calcula a probabilidade de cada formando ficar abaixo do limite de assiduidade (correr à noite).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ate', type=date.fromisoformat, help='Histórico até esta data (AAAA-MM-DD); por omissão ontem')
+        parser.add_argument('--mostrar', type=int, default=10, help='Quantos formandos em maior risco listar')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        resultado = calcular(ate=options['ate'])
+        self.stdout.write(
+            f"Modelo ajustado com {resultado['treino']} formandos ({resultado['positivos']} abaixo do limite): "
+            + ", ".join(f"{nome}={peso:+.3f}" for nome, peso in resultado['pesos'].items())
+        )
+        for risco in mais_em_risco(options['mostrar']):
+            self.stdout.write(
+                f"  {risco.formando.username}: {risco.probabilidade:.0%} "
+                f"(taxa recente {risco.taxa_recente:.0%}, {risco.faltas_seguidas} faltas seguidas)"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado['formandos']} formandos pontuados em {time.perf_counter() - inicio:.2f}s"
+        ))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from Gestao.agendador import HISTORICO, estado
+
+
+class Command(BaseCommand):
+    help = 'Mostra as tarefas do agendador do launcher, a última execução, as durações e a próxima hora.'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Histórico: {HISTORICO}")
+        for linha in estado():
+            ultima = linha['ultima']
+            if ultima is None:
+                descricao = "nunca correu"
+            else:
+                descricao = f"última {ultima['inicio']} ({ultima['resultado']}"
+                if 'segundos' in ultima:
+                    descricao += f", {ultima['segundos']:.1f}s"
+                descricao += ")"
+            if linha['media_segundos'] is not None:
+                descricao += f", média {linha['media_segundos']:.1f}s, máx. {linha['maximo_segundos']:.1f}s"
+            if linha['falhas']:
+                descricao += f", {linha['falhas']}/{linha['execucoes']} com erro"
+            proxima = f"{linha['proxima']:%Y-%m-%d %H:%M}" if linha['proxima'] else "-"
+            self.stdout.write(f"{linha['tarefa']:<20} {linha['cron']:<14} próxima {proxima}  {descricao}")
+            if ultima and ultima['resultado'] == 'erro' and ultima.get('saida'):
+                self.stdout.write(self.style.ERROR("  " + ultima['saida'].strip().splitlines()[-1]))
@@ -0,0 +1,20 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from Gestao.codigos import pre_gerar
+
+
+class Command(BaseCommand):
+    help = 'Pré-gera os códigos de presença de todas as aulas do dia numa única inserção (correr de manhã).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data', type=date.fromisoformat, help='Dia das aulas (AAAA-MM-DD); por omissão hoje')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        criados = pre_gerar(options['data'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{criados} códigos gerados em {time.perf_counter() - inicio:.2f}s"
+        ))
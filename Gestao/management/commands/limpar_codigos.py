@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from Gestao.codigos import limpar_expirados
+
+
+class Command(BaseCommand):
+    help = 'Apaga do registo de códigos ativos os que já expiraram (o histórico em CodigoPresenca fica intacto).'
+
+    def handle(self, *args, **options):
+        apagados = limpar_expirados()
+        self.stdout.write(self.style.SUCCESS(f"{apagados} códigos expirados removidos do registo"))
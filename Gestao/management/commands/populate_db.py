@@ -2,8 +2,9 @@ import random
 from faker import Faker
 from datetime import datetime, timedelta
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from Gestao.models import Utilizador, Curso, Modulo, Aula, RegistoPresenca
+from Gestao import horas, indice_presencas
+from Gestao.alteracoes import registar_em_massa
+from Gestao.models import Utilizador, Curso, Modulo, Inscricao, Aula, RegistoPresenca
 
 class Command(BaseCommand):
     help = 'Popula a base de dados com utilizadores, curso, módulos, aulas e registos de presença.'
@@ -62,6 +63,9 @@ class Command(BaseCommand):
         }
         curso_obj = Curso.objects.create(**curso_data)
 
+        # --- Inscrever todos os formandos no curso ---
+        Inscricao.objects.inscrever(Utilizador.objects.filter(tipo="Formando"), curso_obj)
+
         # --- Criar módulos ---
         modulos_nomes = [
             "Engenharia de software",
@@ -99,6 +103,7 @@ class Command(BaseCommand):
         aulas = []
         registos_presenca = []
         start_date = datetime(2024, 1, 1)
+        formandos_inscritos = list(Inscricao.objects.formandos_de(modulos[0]))
 
         for modulo in modulos:
             for _ in range(random.randint(3, 6)):
@@ -113,37 +118,40 @@ class Command(BaseCommand):
                 )
                 aulas.append(aula_obj)
 
-                for formando in Utilizador.objects.filter(tipo="Formando"):
+                for formando in formandos_inscritos:
                     presente = random.choice([True, False, True])
                     if presente:
-                        entrada = datetime.combine(data.date(), datetime.min.time()) + timedelta(hours=9, minutes=random.randint(0, 15))
+                        hora = 9 if periodo == 'manha' else 14
+                        entrada = datetime.combine(data.date(), datetime.min.time()) + timedelta(hours=hora, minutes=random.randint(0, 15))
                         saida = entrada + timedelta(hours=3)
-                        registos_presenca.append({
-                            "formando": formando,
-                            "aula": aula_obj,
-                            "entrada": entrada,
-                            "saida": saida,
-                            "motivo_atraso": "" if entrada.hour <= 9 else "Chegada tardia devido a transporte.",
-                            "falta_justificada": False
-                        })
-                    else:
-                        registos_presenca.append({
-                            "formando": formando,
-                            "aula": aula_obj,
-                            "entrada": None,
-                            "saida": None,
-                            "motivo_atraso": "",
-                            "falta_justificada": random.choice([False, True])
-                        })
+                        registo = RegistoPresenca(
+                            formando=formando,
+                            aula=aula_obj,
+                            entrada=entrada,
+                            saida=saida,
+                            falta_justificada=False
+                        )
+                        # bulk_create não chama save(), por isso o estado é calculado aqui
+                        registo.estado = registo.estado_pela_entrada()
+                        if registo.estado == 'atrasado':
+                            registo.motivo_atraso = "Chegada tardia devido a transporte."
+                        registos_presenca.append(registo)
+                    elif random.choice([False, True]):
+                        # Só as faltas justificadas precisam de linha; as restantes são inferidas
+                        registos_presenca.append(RegistoPresenca(
+                            formando=formando,
+                            aula=aula_obj,
+                            entrada=None,
+                            saida=None,
+                            motivo_atraso="",
+                            falta_justificada=True,
+                            estado='justificada'
+                        ))
 
-        for registo in registos_presenca:
-            RegistoPresenca.objects.create(
-                formando=registo["formando"],
-                aula=registo["aula"],
-                entrada=registo["entrada"],
-                saida=registo["saida"],
-                motivo_atraso=registo["motivo_atraso"],
-                falta_justificada=registo["falta_justificada"]
-            )
+        RegistoPresenca.objects.bulk_create(registos_presenca)
+        registar_em_massa(registos_presenca, 'criar')
+        # bulk_create não dispara signals: o índice e o ledger de horas são construídos de uma vez
+        indice_presencas.reconstruir([curso_obj])
+        horas.calcular_curso(curso_obj)
 
         self.stdout.write(self.style.SUCCESS("Base de dados populada com sucesso!"))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Gestao.indice_presencas import reconstruir
+from Gestao.models import Curso
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói os bitmaps de presença de cada aula a partir dos registos de presença.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--curso', type=int, action='append', help='Só os cursos indicados (repetível)')
+
+    def handle(self, *args, **options):
+        cursos = Curso.objects.filter(id__in=options['curso']) if options['curso'] else None
+        inicio = time.perf_counter()
+        total = reconstruir(cursos)
+        duracao = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(f"Índice reconstruído: {total} aulas em {duracao:.2f}s"))
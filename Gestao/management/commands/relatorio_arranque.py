@@ -0,0 +1,76 @@
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# O que um script Streamlit importa antes de desenhar a primeira página
+MODULOS_PADRAO = ["streamlit", "django", "pandas", "plotly.express"]
+
+ARRANQUE = (
+    "from Projecto_Final.bootstrap import setup_django; setup_django(); "
+    "import Gestao.models, Gestao.assiduidade"
+)
+
+
+def resumir_importtime(stderr):
+    """Agrega a saída de -X importtime por pacote de topo (tempo cumulativo em ms)"""
+    por_pacote = defaultdict(float)
+    for linha in stderr.splitlines():
+        if not linha.startswith("import time:") or "|" not in linha:
+            continue
+        partes = linha[len("import time:"):].split("|")
+        if len(partes) != 3 or not partes[1].strip().isdigit():
+            continue
+        nome = partes[2]
+        # Só as entradas sem indentação são imports de topo; as outras já estão no cumulativo
+        if nome.startswith("  "):
+            continue
+        por_pacote[nome.strip().split(".")[0]] += int(partes[1]) / 1000
+    return sorted(por_pacote.items(), key=lambda item: item[1], reverse=True)
+
+
+class Command(BaseCommand):
+    help = 'Mostra o custo de arranque a frio (-X importtime) e o custo fixo de cada rerun do Streamlit.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('modulos', nargs='*', default=MODULOS_PADRAO, help='Módulos a medir')
+        parser.add_argument('--top', type=int, default=15, help='Número de pacotes a mostrar')
+        parser.add_argument('--reruns', type=int, default=1000, help='Reruns simulados para o custo a quente')
+
+    def handle(self, *args, **options):
+        modulos = options['modulos']
+        codigo = f"{ARRANQUE}; " + "; ".join(f"import {m}" for m in modulos)
+
+        # --- Arranque a frio: processo novo, como o primeiro run de um worker ---
+        inicio = time.perf_counter()
+        resultado = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", codigo],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+        )
+        total_frio = time.perf_counter() - inicio
+        if resultado.returncode != 0:
+            self.stderr.write(resultado.stderr.splitlines()[-1] if resultado.stderr else "Falha ao importar")
+            return
+
+        self.stdout.write(f"Arranque a frio: {total_frio * 1000:.0f} ms (processo completo)")
+        for pacote, ms in resumir_importtime(resultado.stderr)[:options['top']]:
+            self.stdout.write(f"  {ms:9.1f} ms  {pacote}")
+
+        # --- Custo fixo por rerun: o que o script repete com tudo já carregado ---
+        for modulo in modulos:
+            __import__(modulo)
+        from Projecto_Final.bootstrap import setup_django
+
+        reruns = options['reruns']
+        inicio = time.perf_counter()
+        for _ in range(reruns):
+            setup_django()
+            for modulo in modulos:
+                __import__(modulo)
+        por_rerun = (time.perf_counter() - inicio) / reruns
+
+        self.stdout.write(f"Custo fixo por rerun (bootstrap + imports em cache): {por_rerun * 1e6:.1f} µs")
+        self.stdout.write(self.style.SUCCESS("Relatório concluído"))
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Gestao', '0003_registopresenca_justificativo_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Inscricao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_inscricao', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Inscrição',
+                'verbose_name_plural': 'Inscrições',
+            },
+        ),
+        migrations.AlterField(
+            model_name='registopresenca',
+            name='formando',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='aula',
+            index=models.Index(fields=['modulo', 'data'], name='Gestao_aula_modulo__5f268b_idx'),
+        ),
+        migrations.AddField(
+            model_name='inscricao',
+            name='curso',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inscricoes', to='Gestao.curso'),
+        ),
+        migrations.AddField(
+            model_name='inscricao',
+            name='formando',
+            field=models.ForeignKey(limit_choices_to={'tipo': 'Formando'}, on_delete=django.db.models.deletion.CASCADE, related_name='inscricoes', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='inscricao',
+            name='modulo',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='inscricoes', to='Gestao.modulo'),
+        ),
+        migrations.AddIndex(
+            model_name='inscricao',
+            index=models.Index(fields=['curso', 'modulo'], name='Gestao_insc_curso_i_6aa2a4_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='inscricao',
+            constraint=models.UniqueConstraint(fields=('formando', 'curso', 'modulo'), name='inscricao_unica'),
+        ),
+        migrations.AddConstraint(
+            model_name='inscricao',
+            constraint=models.UniqueConstraint(condition=models.Q(('modulo__isnull', True)), fields=('formando', 'curso'), name='inscricao_curso_unica'),
+        ),
+    ]
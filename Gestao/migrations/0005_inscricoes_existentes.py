@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def inscrever_formandos_existentes(apps, schema_editor):
+    """Inscreve no curso cada formando que já tem registos nas aulas desse curso"""
+    Inscricao = apps.get_model('Gestao', 'Inscricao')
+    RegistoPresenca = apps.get_model('Gestao', 'RegistoPresenca')
+    pares = (
+        RegistoPresenca.objects
+        .values_list('formando_id', 'aula__modulo__curso_id')
+        .distinct()
+    )
+    Inscricao.objects.bulk_create(
+        [Inscricao(formando_id=formando_id, curso_id=curso_id) for formando_id, curso_id in pares],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Gestao', '0004_inscricao'),
+    ]
+
+    operations = [
+        migrations.RunPython(inscrever_formandos_existentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+from django.db.models import Q
+
+
+def remover_faltas_vazias(apps, schema_editor):
+    """As faltas sem justificação passam a ser inferidas a partir das inscrições"""
+    RegistoPresenca = apps.get_model('Gestao', 'RegistoPresenca')
+    RegistoPresenca.objects.filter(
+        entrada__isnull=True,
+        falta_justificada=False,
+        motivo_atraso='',
+    ).filter(Q(justificativo='') | Q(justificativo__isnull=True)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Gestao', '0005_inscricoes_existentes'),
+    ]
+
+    operations = [
+        migrations.RunPython(remover_faltas_vazias, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Gestao', '0006_remover_faltas_vazias'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Alteracao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entidade', models.CharField(choices=[('registopresenca', 'Registo de Presença'), ('aula', 'Aula'), ('codigopresenca', 'Código de Presença')], max_length=20)),
+                ('objeto_id', models.BigIntegerField()),
+                ('operacao', models.CharField(choices=[('criar', 'Criar'), ('atualizar', 'Atualizar'), ('remover', 'Remover')], max_length=10)),
+                ('aula_id', models.BigIntegerField(blank=True, null=True)),
+                ('modulo_id', models.BigIntegerField(blank=True, null=True)),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Alteração',
+                'verbose_name_plural': 'Alterações',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['modulo_id', 'id'], name='Gestao_alte_modulo__f5ae8c_idx'), models.Index(fields=['aula_id', 'id'], name='Gestao_alte_aula_id_77f850_idx')],
+            },
+        ),
+    ]
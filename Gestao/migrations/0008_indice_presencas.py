@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:42
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from Gestao.indice_presencas import comprimir
+
+
+def indexar_registos_existentes(apps, schema_editor):
+    """Roster de cada curso (inscritos e quem já tem registos) e bitmap de cada aula a partir dos registos"""
+    Aula = apps.get_model('Gestao', 'Aula')
+    IndicePresenca = apps.get_model('Gestao', 'IndicePresenca')
+    Inscricao = apps.get_model('Gestao', 'Inscricao')
+    PosicaoRoster = apps.get_model('Gestao', 'PosicaoRoster')
+    RegistoPresenca = apps.get_model('Gestao', 'RegistoPresenca')
+
+    formandos = defaultdict(set)
+    for formando_id, curso_id in Inscricao.objects.values_list('formando_id', 'curso_id'):
+        formandos[curso_id].add(formando_id)
+    # Antes do campo estado (0011) um registo é uma presença quando tem entrada
+    presencas = list(
+        RegistoPresenca.objects.filter(entrada__isnull=False)
+        .values_list('aula_id', 'aula__modulo__curso_id', 'formando_id')
+    )
+    for _, curso_id, formando_id in presencas:
+        formandos[curso_id].add(formando_id)
+
+    posicoes = {}
+    for curso_id, ids in formandos.items():
+        for posicao, formando_id in enumerate(sorted(ids)):
+            posicoes[curso_id, formando_id] = posicao
+    PosicaoRoster.objects.bulk_create(
+        [PosicaoRoster(curso_id=curso_id, formando_id=formando_id, posicao=posicao)
+         for (curso_id, formando_id), posicao in posicoes.items()],
+        batch_size=1000,
+    )
+
+    bitmaps = dict.fromkeys(Aula.objects.values_list('id', flat=True), 0)
+    for aula_id, curso_id, formando_id in presencas:
+        bitmaps[aula_id] |= 1 << posicoes[curso_id, formando_id]
+    IndicePresenca.objects.bulk_create(
+        [IndicePresenca(aula_id=aula_id, bitmap=comprimir(bits), presentes=bits.bit_count())
+         for aula_id, bits in bitmaps.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Gestao', '0007_alteracao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndicePresenca',
+            fields=[
+                ('aula', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='indice', serialize=False, to='Gestao.aula')),
+                ('bitmap', models.BinaryField(default=b'')),
+                ('presentes', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PosicaoRoster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('posicao', models.PositiveIntegerField()),
+                ('curso', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='roster', to='Gestao.curso')),
+                ('formando', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='posicoes_roster', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('curso', 'formando'), name='roster_formando_unico'), models.UniqueConstraint(fields=('curso', 'posicao'), name='roster_posicao_unica')],
+            },
+        ),
+        migrations.RunPython(indexar_registos_existentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Gestao', '0008_indice_presencas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HorasAssistidas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('horas', models.FloatField(default=0)),
+                ('aulas_presentes', models.PositiveIntegerField(default=0)),
+                ('atualizado', models.DateTimeField(auto_now=True)),
+                ('formando', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='horas_assistidas', to=settings.AUTH_USER_MODEL)),
+                ('modulo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='horas_assistidas', to='Gestao.modulo')),
+            ],
+            options={
+                'verbose_name': 'Horas Assistidas',
+                'verbose_name_plural': 'Horas Assistidas',
+                'indexes': [models.Index(fields=['modulo', 'horas'], name='Gestao_hora_modulo__09f2da_idx')],
+                'constraints': [models.UniqueConstraint(fields=('formando', 'modulo'), name='horas_formando_modulo_unico')],
+            },
+        ),
+    ]
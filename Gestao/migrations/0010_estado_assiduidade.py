@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Gestao', '0009_horas_assistidas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadoAssiduidade',
+            fields=[
+                ('formando', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='estado_assiduidade', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('faltas_consecutivas', models.PositiveIntegerField(default=0)),
+                ('taxa_recente', models.FloatField(default=1.0, help_text='Média móvel exponencial da presença')),
+                ('aulas_processadas', models.PositiveIntegerField(default=0)),
+                ('processado_ate', models.DateField(blank=True, null=True)),
+                ('notificado_ate', models.DateField(blank=True, null=True)),
+                ('alerta_faltas', models.BooleanField(default=False)),
+                ('alerta_taxa', models.BooleanField(default=False)),
+            ],
+            options={
+                'verbose_name': 'Estado de Assiduidade',
+                'verbose_name_plural': 'Estados de Assiduidade',
+            },
+        ),
+        migrations.AlterField(
+            model_name='notificacao',
+            name='tipo',
+            field=models.CharField(choices=[('presenca', 'Registo de Presença'), ('aula', 'Nova Aula'), ('aviso', 'Aviso Geral'), ('assiduidade', 'Alerta de Assiduidade'), ('outro', 'Outro')], default='aviso', max_length=20),
+        ),
+    ]
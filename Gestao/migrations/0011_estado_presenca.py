@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:48
+
+from django.db import migrations, models
+
+
+def preencher_estado(apps, schema_editor):
+    """Converte os registos existentes: o atraso era marcado pelo texto de motivo_atraso"""
+    RegistoPresenca = apps.get_model('Gestao', 'RegistoPresenca')
+    registos = RegistoPresenca.objects.all()
+    registos.filter(entrada__isnull=True, falta_justificada=True).update(estado='justificada')
+    registos.filter(entrada__isnull=True, falta_justificada=False).update(estado='falta')
+    registos.filter(entrada__isnull=False).exclude(motivo_atraso='').update(estado='atrasado')
+    registos.filter(entrada__isnull=False, motivo_atraso='').update(estado='presente')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Gestao', '0010_estado_assiduidade'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registopresenca',
+            name='estado',
+            field=models.CharField(blank=True, choices=[('presente', 'Presente'), ('atrasado', 'Atrasado'), ('falta', 'Falta'), ('justificada', 'Falta Justificada')], db_index=True, max_length=12),
+        ),
+        migrations.AddIndex(
+            model_name='registopresenca',
+            index=models.Index(fields=['aula', 'estado'], name='Gestao_regi_aula_id_4b808f_idx'),
+        ),
+        migrations.RunPython(preencher_estado, migrations.RunPython.noop),
+    ]
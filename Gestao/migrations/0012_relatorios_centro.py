@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:54
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def preencher_semana(apps, schema_editor):
+    """Uma atualização por data distinta (há muito menos datas do que aulas)"""
+    Aula = apps.get_model('Gestao', 'Aula')
+    for data in Aula.objects.values_list('data', flat=True).distinct():
+        Aula.objects.filter(data=data).update(semana=data - timedelta(days=data.weekday()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Gestao', '0011_estado_presenca'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aula',
+            name='semana',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.RunPython(preencher_semana, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='utilizador',
+            name='tipo',
+            field=models.CharField(choices=[('Formando', 'Formando'), ('Formador', 'Formador'), ('Coordenador', 'Coordenador')], max_length=15),
+        ),
+        migrations.AddIndex(
+            model_name='aula',
+            index=models.Index(fields=['data', 'periodo'], name='Gestao_aula_data_ac1b31_idx'),
+        ),
+    ]
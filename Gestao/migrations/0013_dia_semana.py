@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:56
+
+from django.db import migrations, models
+
+
+def preencher_dia_semana(apps, schema_editor):
+    Aula = apps.get_model('Gestao', 'Aula')
+    for data in Aula.objects.values_list('data', flat=True).distinct():
+        Aula.objects.filter(data=data).update(dia_semana=data.isoweekday())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Gestao', '0012_relatorios_centro'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aula',
+            name='dia_semana',
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(preencher_dia_semana, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Gestao', '0013_dia_semana'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RiscoAssiduidade',
+            fields=[
+                ('formando', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='risco_assiduidade', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('probabilidade', models.FloatField(db_index=True)),
+                ('taxa_total', models.FloatField()),
+                ('taxa_recente', models.FloatField()),
+                ('faltas_seguidas', models.PositiveIntegerField()),
+                ('frequencia_atrasos', models.FloatField()),
+                ('desvio_dia_semana', models.FloatField(help_text='Diferença entre a taxa global e a do pior dia da semana')),
+                ('calculado_em', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Risco de Assiduidade',
+                'verbose_name_plural': 'Riscos de Assiduidade',
+            },
+        ),
+    ]
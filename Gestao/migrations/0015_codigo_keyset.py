@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Gestao', '0014_risco_assiduidade'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='codigopresenca',
+            index=models.Index(fields=['timestamp', 'id'], name='Gestao_codi_timesta_3af106_idx'),
+        ),
+    ]
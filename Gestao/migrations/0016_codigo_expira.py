@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:10
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def preencher_expira(apps, schema_editor):
+    CodigoPresenca = apps.get_model('Gestao', 'CodigoPresenca')
+    CodigoPresenca.objects.update(expira=F('timestamp') + timedelta(minutes=30))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Gestao', '0015_codigo_keyset'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codigopresenca',
+            name='expira',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(preencher_expira, migrations.RunPython.noop),
+    ]
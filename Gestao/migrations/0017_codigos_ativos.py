@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def preencher_ativos(apps, schema_editor):
+    CodigoPresenca = apps.get_model('Gestao', 'CodigoPresenca')
+    CodigoAtivo = apps.get_model('Gestao', 'CodigoAtivo')
+    CodigoAtivo.objects.bulk_create([
+        CodigoAtivo(codigo=codigo, aula_id=aula_id, expira=expira)
+        for codigo, aula_id, expira in CodigoPresenca.objects.filter(valido=True, expira__gte=timezone.now())
+        .values_list('codigo', 'aula_id', 'expira')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Gestao', '0016_codigo_expira'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodigoAtivo',
+            fields=[
+                ('codigo', models.CharField(max_length=6, primary_key=True, serialize=False)),
+                ('expira', models.DateTimeField(db_index=True)),
+                ('aula', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='codigos_ativos', to='Gestao.aula')),
+            ],
+            options={
+                'verbose_name': 'Código Ativo',
+                'verbose_name_plural': 'Códigos Ativos',
+            },
+        ),
+        migrations.RunPython(preencher_ativos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Gestao', '0017_codigos_ativos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codigoativo',
+            name='valido_desde',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='codigopresenca',
+            name='valido_desde',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Gestao', '0018_codigo_valido_desde'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='utilizador',
+            name='versao_sessao',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
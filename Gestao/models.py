@@ -1,3 +1,6 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import AbstractUser # Adicionar componentes à classe user!
 from django.contrib.auth import get_user_model
@@ -9,9 +12,12 @@ class Utilizador(AbstractUser):
     TIPO_CHOICES = [
         ('Formando', 'Formando'),
         ('Formador', 'Formador'),
+        ('Coordenador', 'Coordenador'),
     ]
-    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    tipo = models.CharField(max_length=15, choices=TIPO_CHOICES)
     nif = models.PositiveIntegerField(unique=True, null=True, blank=True)  # <--- Aqui adicionas
+    # Entra nos tokens de sessão dos frontends; terminar a sessão incrementa-a e revoga os tokens emitidos
+    versao_sessao = models.PositiveIntegerField(default=0, editable=False)
     def __str__(self):
         return f"{self.username} ({self.tipo})"
 
@@ -35,16 +41,94 @@ class Modulo(models.Model):
         return f"{self.nome} ({self.curso.nome})"  # Exibe nome do módulo e nome do curso
 
 
+# Inscrição de um formando num curso inteiro (modulo vazio) ou apenas num módulo desse curso.
+class InscricaoQuerySet(models.QuerySet):
+    def modulos_de(self, formando):
+        """Módulos a que o formando tem acesso, via inscrição no curso ou no próprio módulo"""
+        inscricoes = self.filter(formando=formando)
+        return Modulo.objects.filter(
+            models.Q(curso__in=inscricoes.filter(modulo__isnull=True).values('curso'))
+            | models.Q(id__in=inscricoes.filter(modulo__isnull=False).values('modulo'))
+        )
+
+    def formandos_de(self, modulo):
+        """Formandos inscritos no módulo, diretamente ou através do curso"""
+        inscricoes = self.filter(
+            models.Q(curso_id=modulo.curso_id, modulo__isnull=True) | models.Q(modulo=modulo)
+        )
+        return Utilizador.objects.filter(id__in=inscricoes.values('formando'))
+
+    def inscrever(self, formandos, curso, modulo=None):
+        """Inscreve vários formandos de uma vez; inscrições já existentes são ignoradas"""
+        return self.bulk_create(
+            [self.model(formando=f, curso=curso, modulo=modulo) for f in formandos],
+            ignore_conflicts=True,
+        )
+
+    def desinscrever(self, formandos, curso, modulo=None):
+        """Remove as inscrições dos formandos indicados numa única query"""
+        return self.filter(formando__in=formandos, curso=curso, modulo=modulo).delete()
+
+
+class Inscricao(models.Model):
+    formando = models.ForeignKey(Utilizador, on_delete=models.CASCADE, related_name='inscricoes', limit_choices_to={'tipo': 'Formando'})
+    curso = models.ForeignKey(Curso, on_delete=models.CASCADE, related_name='inscricoes')
+    modulo = models.ForeignKey(Modulo, on_delete=models.CASCADE, related_name='inscricoes', null=True, blank=True)
+    data_inscricao = models.DateTimeField(auto_now_add=True)
+
+    objects = InscricaoQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Inscrição'
+        verbose_name_plural = 'Inscrições'
+        constraints = [
+            models.UniqueConstraint(fields=['formando', 'curso', 'modulo'], name='inscricao_unica'),
+            models.UniqueConstraint(fields=['formando', 'curso'], condition=models.Q(modulo__isnull=True), name='inscricao_curso_unica'),
+        ]
+        # A constraint inscricao_unica já indexa (formando, curso, ...) para as queries do formando
+        indexes = [models.Index(fields=['curso', 'modulo'])]
+
+    def __str__(self):
+        alvo = self.modulo.nome if self.modulo_id else self.curso.nome
+        return f"{self.formando.username} -> {alvo}"
+
+
 # O modelo aula será onde vamos registar as aulas realizadas, com data e período (manhã/tarde).
 class Aula(models.Model):
     modulo = models.ForeignKey(Modulo, on_delete=models.CASCADE)
     data = models.DateField()
     periodo = models.CharField(max_length=10, choices=[('manha', 'Manhã'), ('tarde', 'Tarde')])
+    # Segunda-feira da semana da aula; os relatórios agrupam por semana sem funções de data na query
+    semana = models.DateField(null=True, editable=False)
+    # Dia da semana ISO (1 = segunda ... 7 = domingo), pela mesma razão
+    dia_semana = models.PositiveSmallIntegerField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['modulo', 'data']),
+            # Relatórios do centro filtram só por intervalo de datas
+            models.Index(fields=['data', 'periodo']),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.semana = self.data - timedelta(days=self.data.weekday())
+        self.dia_semana = self.data.isoweekday()
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Aula em {self.data} ({self.periodo}) - {self.modulo.nome}"  # Exibe a data, o período e o nome do módulo
 
 
 class RegistoPresenca(models.Model):
+    ESTADO_CHOICES = [
+        ('presente', 'Presente'),
+        ('atrasado', 'Atrasado'),
+        ('falta', 'Falta'),
+        ('justificada', 'Falta Justificada'),
+    ]
+    # Estados que contam como presença na aula
+    PRESENTES = ('presente', 'atrasado')
+
     formando = models.ForeignKey(Utilizador, on_delete=models.CASCADE)
     aula = models.ForeignKey(Aula, on_delete=models.CASCADE)
     entrada = models.DateTimeField(null=True, blank=True)
@@ -52,9 +136,28 @@ class RegistoPresenca(models.Model):
     motivo_atraso = models.TextField(blank=True)
     justificativo = models.FileField(upload_to='justificativos/%Y/%m/%d/', null=True, blank=True)
     falta_justificada = models.BooleanField(default=False)
+    # Se vier vazio é calculado no save() a partir da entrada e do horário do período
+    estado = models.CharField(max_length=12, choices=ESTADO_CHOICES, blank=True, db_index=True)
 
     class Meta:
         unique_together = ('formando', 'aula')
+        indexes = [models.Index(fields=['aula', 'estado'])]
+
+    def estado_pela_entrada(self):
+        if self.entrada is None:
+            return 'justificada' if self.falta_justificada else 'falta'
+        inicio = settings.HORARIO_PERIODOS.get(self.aula.periodo)
+        if inicio is None:
+            return 'presente'
+        limite = datetime.combine(self.aula.data, time.fromisoformat(inicio)) \
+            + timedelta(minutes=settings.TOLERANCIA_ATRASO_MINUTOS)
+        entrada = timezone.localtime(self.entrada) if timezone.is_aware(self.entrada) else self.entrada
+        return 'atrasado' if entrada.replace(tzinfo=None) > limite else 'presente'
+
+    def save(self, *args, **kwargs):
+        if not self.estado:
+            self.estado = self.estado_pela_entrada()
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.formando.username} - {self.aula}"
@@ -66,6 +169,7 @@ class Notificacao(models.Model):
         ('presenca', 'Registo de Presença'),
         ('aula', 'Nova Aula'),
         ('aviso', 'Aviso Geral'),
+        ('assiduidade', 'Alerta de Assiduidade'),
         ('outro', 'Outro'),
     ]
     
@@ -90,14 +194,159 @@ class CodigoPresenca(models.Model):
     codigo = models.CharField(max_length=6, unique=True)
     timestamp = models.DateTimeField(auto_now_add=True)
     valido = models.BooleanField(default=True)
+    # Fim da validade: CODIGO_VALIDADE_MINUTOS depois de gerado, ou depois do início da aula se foi pré-gerado
+    expira = models.DateTimeField(null=True, blank=True)
+    # Início da validade dos pré-gerados (pouco antes da aula); vazio = válido desde que foi gerado
+    valido_desde = models.DateTimeField(null=True, blank=True)
 
     def is_valid(self):
-        """Check if code is still valid (within 30 minutes)"""
-        time_diff = timezone.now() - self.timestamp
-        return time_diff.total_seconds() <= (30 * 60)  # 30 minutes
+        """Check if code is still valid (before its expiry time)"""
+        return timezone.now() <= self.expira
+
+    def save(self, *args, **kwargs):
+        if self.expira is None:
+            self.expira = timezone.now() + timedelta(minutes=settings.CODIGO_VALIDADE_MINUTOS)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.codigo} - {self.aula}"
 
     class Meta:
-        ordering = ['-timestamp']
\ No newline at end of file
+        ordering = ['-timestamp']
+        # Paginação por keyset (timestamp, id) no monitor de códigos
+        indexes = [models.Index(fields=['timestamp', 'id'])]
+
+
+# Registo dos códigos em vigor, partilhado por todos os processos: só tem os códigos ainda válidos
+# (poucas centenas de linhas), por isso a validação de um check-in é uma leitura pela chave primária
+class CodigoAtivo(models.Model):
+    codigo = models.CharField(max_length=6, primary_key=True)
+    aula = models.ForeignKey(Aula, on_delete=models.CASCADE, related_name='codigos_ativos')
+    expira = models.DateTimeField(db_index=True)
+    valido_desde = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Código Ativo'
+        verbose_name_plural = 'Códigos Ativos'
+
+    def __str__(self):
+        return f"{self.codigo} - {self.aula}"
+
+
+# Registo append-only de alterações: o id é o número de sequência monotónico do feed
+class Alteracao(models.Model):
+    ENTIDADE_CHOICES = [
+        ('registopresenca', 'Registo de Presença'),
+        ('aula', 'Aula'),
+        ('codigopresenca', 'Código de Presença'),
+    ]
+    OPERACAO_CHOICES = [
+        ('criar', 'Criar'),
+        ('atualizar', 'Atualizar'),
+        ('remover', 'Remover'),
+    ]
+
+    entidade = models.CharField(max_length=20, choices=ENTIDADE_CHOICES)
+    objeto_id = models.BigIntegerField()
+    operacao = models.CharField(max_length=10, choices=OPERACAO_CHOICES)
+    # Sem chaves estrangeiras: a alteração tem de sobreviver à remoção da aula ou do módulo
+    aula_id = models.BigIntegerField(null=True, blank=True)
+    modulo_id = models.BigIntegerField(null=True, blank=True)
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = 'Alteração'
+        verbose_name_plural = 'Alterações'
+        indexes = [
+            models.Index(fields=['modulo_id', 'id']),
+            models.Index(fields=['aula_id', 'id']),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.operacao} {self.entidade} {self.objeto_id}"
+
+
+# Posição fixa de cada formando no roster do curso: é o número do bit nos bitmaps de presença
+class PosicaoRoster(models.Model):
+    curso = models.ForeignKey(Curso, on_delete=models.CASCADE, related_name='roster')
+    formando = models.ForeignKey(Utilizador, on_delete=models.CASCADE, related_name='posicoes_roster')
+    posicao = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['curso', 'formando'], name='roster_formando_unico'),
+            models.UniqueConstraint(fields=['curso', 'posicao'], name='roster_posicao_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.curso.nome} #{self.posicao}: {self.formando.username}"
+
+
+# Bitmap comprimido das presenças de uma aula (bit = posição do formando no roster do curso)
+class IndicePresenca(models.Model):
+    aula = models.OneToOneField(Aula, on_delete=models.CASCADE, primary_key=True, related_name='indice')
+    bitmap = models.BinaryField(default=b'')
+    presentes = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Índice {self.aula_id} ({self.presentes} presentes)"
+
+
+# Horas assistidas por formando em cada módulo, para o relatório de assiduidade do financiamento
+class HorasAssistidas(models.Model):
+    formando = models.ForeignKey(Utilizador, on_delete=models.CASCADE, related_name='horas_assistidas')
+    modulo = models.ForeignKey(Modulo, on_delete=models.CASCADE, related_name='horas_assistidas')
+    horas = models.FloatField(default=0)
+    aulas_presentes = models.PositiveIntegerField(default=0)
+    atualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Horas Assistidas'
+        verbose_name_plural = 'Horas Assistidas'
+        constraints = [
+            models.UniqueConstraint(fields=['formando', 'modulo'], name='horas_formando_modulo_unico'),
+        ]
+        indexes = [models.Index(fields=['modulo', 'horas'])]
+
+    def __str__(self):
+        return f"{self.formando.username} - {self.modulo.nome}: {self.horas:.1f}h"
+
+
+# Estado incremental da assiduidade de cada formando, mantido pelo pipeline de alertas
+class EstadoAssiduidade(models.Model):
+    formando = models.OneToOneField(Utilizador, on_delete=models.CASCADE, primary_key=True, related_name='estado_assiduidade')
+    faltas_consecutivas = models.PositiveIntegerField(default=0)
+    taxa_recente = models.FloatField(default=1.0, help_text="Média móvel exponencial da presença")
+    aulas_processadas = models.PositiveIntegerField(default=0)
+    processado_ate = models.DateField(null=True, blank=True)
+    # Nunca recua, mesmo quando o histórico é refeito: evita notificar duas vezes o mesmo cruzamento
+    notificado_ate = models.DateField(null=True, blank=True)
+    alerta_faltas = models.BooleanField(default=False)
+    alerta_taxa = models.BooleanField(default=False)
+
+    class Meta:
+        verbose_name = 'Estado de Assiduidade'
+        verbose_name_plural = 'Estados de Assiduidade'
+
+    def __str__(self):
+        return f"{self.formando.username}: {self.faltas_consecutivas} faltas seguidas, {self.taxa_recente:.0%}"
+
+
+# Probabilidade de um formando ficar abaixo do limite de assiduidade, calculada em lote todas as noites
+class RiscoAssiduidade(models.Model):
+    formando = models.OneToOneField(Utilizador, on_delete=models.CASCADE, primary_key=True, related_name='risco_assiduidade')
+    probabilidade = models.FloatField(db_index=True)
+    taxa_total = models.FloatField()
+    taxa_recente = models.FloatField()
+    faltas_seguidas = models.PositiveIntegerField()
+    frequencia_atrasos = models.FloatField()
+    desvio_dia_semana = models.FloatField(help_text="Diferença entre a taxa global e a do pior dia da semana")
+    calculado_em = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Risco de Assiduidade'
+        verbose_name_plural = 'Riscos de Assiduidade'
+
+    def __str__(self):
+        return f"{self.formando.username}: {self.probabilidade:.0%}"
@@ -0,0 +1,164 @@
+"""
+Cache de dados de referência (cursos, módulos e nomes da equipa).
+
+São tabelas pequenas que mudam raramente mas aparecem em todos os
+dropdowns e etiquetas dos frontends. Cada processo guarda uma cópia em
+memória e só a recarrega quando a versão muda.
+
+A versão é o mtime de um ficheiro partilhado (REFERENCIAS_VERSAO_FICHEIRO):
+os signals tocam-lhe depois do commit de qualquer escrita nestas tabelas e
+cada leitura faz apenas um stat(), por isso todos os processos (gunicorn,
+workers Streamlit, comandos) veem a alteração sem uma única query.
+
+Dos utilizadores só ficam em cache os formadores e coordenadores (dezenas);
+os nomes dos formandos (milhares) são lidos quando são pedidos.
+
+As instâncias devolvidas são partilhadas entre sessões: são só de leitura.
+"""
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Curso, Modulo, Utilizador
+
+_lock = threading.Lock()
+_estado = {'versao': None, 'dados': None}
+
+TIPOS_EM_CACHE = ('Formador', 'Coordenador')
+
+# Recargas feitas por este processo (útil para confirmar que a cache está a funcionar)
+estatisticas = {'recargas': 0}
+
+
+def _versao_partilhada():
+    try:
+        return os.stat(settings.REFERENCIAS_VERSAO_FICHEIRO).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def _nome(first_name, last_name, username):
+    return f"{first_name} {last_name}".strip() or username
+
+
+def _carregar():
+    cursos = {c.id: c for c in Curso.objects.all()}
+    formadores = {
+        u.id: u for u in Utilizador.objects.filter(tipo='Formador')
+        .only('id', 'username', 'first_name', 'last_name', 'tipo')
+    }
+    modulos = {}
+    for modulo in Modulo.objects.order_by('nome'):
+        # Relações já preenchidas: modulo.curso.nome e modulo.formador.get_full_name() não fazem queries
+        modulo.curso = cursos[modulo.curso_id]
+        if modulo.formador_id in formadores:
+            modulo.formador = formadores[modulo.formador_id]
+        modulos[modulo.id] = modulo
+    nomes = {
+        utilizador_id: (_nome(first_name, last_name, username), tipo)
+        for utilizador_id, username, first_name, last_name, tipo
+        in Utilizador.objects.filter(tipo__in=TIPOS_EM_CACHE)
+        .values_list('id', 'username', 'first_name', 'last_name', 'tipo')
+    }
+    por_nome = sorted(
+        ((utilizador_id, nome) for utilizador_id, (nome, tipo) in nomes.items() if tipo == 'Formador'),
+        key=lambda item: item[1].lower(),
+    )
+    return {'cursos': cursos, 'modulos': modulos, 'nomes': nomes, 'formadores': dict(por_nome)}
+
+
+def _dados():
+    versao = _versao_partilhada()
+    if _estado['dados'] is not None and _estado['versao'] == versao:
+        return _estado['dados']
+    with _lock:
+        if _estado['dados'] is None or _estado['versao'] != versao:
+            # Uma escrita durante a carga muda outra vez a versão e obriga a nova recarga
+            _estado['dados'] = _carregar()
+            _estado['versao'] = versao
+            estatisticas['recargas'] += 1
+        return _estado['dados']
+
+
+def invalidar():
+    """Publica uma nova versão para todos os processos (chamado pelos signals depois do commit)"""
+    caminho = settings.REFERENCIAS_VERSAO_FICHEIRO
+    anterior = _versao_partilhada()
+    with open(caminho, 'a'):
+        pass
+    agora = max(time.time_ns(), anterior + 1)
+    os.utime(caminho, ns=(agora, agora))
+    _estado['versao'] = None
+
+
+def invalidar_depois_do_commit():
+    transaction.on_commit(invalidar)
+
+
+CAMPOS_UTILIZADOR = {'username', 'first_name', 'last_name', 'tipo'}
+
+
+def utilizador_mudou(utilizador, update_fields=None):
+    """Só nome e tipo interessam à cache; last_login, password, etc. não a invalidam"""
+    if update_fields is not None and not CAMPOS_UTILIZADOR & set(update_fields):
+        return False
+    dados = _estado['dados']
+    if dados is None:
+        # Este processo não tem cópia para comparar (ex.: o admin): invalida por precaução
+        return True
+    if utilizador.tipo not in TIPOS_EM_CACHE and utilizador.pk not in dados['nomes']:
+        return False
+    atual = (_nome(utilizador.first_name, utilizador.last_name, utilizador.username), utilizador.tipo)
+    return dados['nomes'].get(utilizador.pk) != atual
+
+
+# --------------------------
+# Consultas (sem queries enquanto a versão não mudar)
+# --------------------------
+def cursos():
+    """{id: Curso}"""
+    return _dados()['cursos']
+
+
+def modulos():
+    """{id: Modulo}, por ordem de nome"""
+    return _dados()['modulos']
+
+
+def modulo(modulo_id):
+    return modulos().get(modulo_id)
+
+
+def modulos_do_curso(curso_id):
+    return [m for m in modulos().values() if m.curso_id == curso_id]
+
+
+def modulos_do_formador(formador_id):
+    return [m for m in modulos().values() if m.formador_id == formador_id]
+
+
+def formadores():
+    """{id: nome} dos formadores, por ordem de nome"""
+    return _dados()['formadores']
+
+
+def nomes_utilizadores(utilizador_ids):
+    """{id: nome completo (ou username)} de quaisquer utilizadores; os formandos custam uma query"""
+    nomes = _dados()['nomes']
+    resultado = {i: nomes[i][0] for i in utilizador_ids if i in nomes}
+    em_falta = set(utilizador_ids) - set(resultado)
+    if em_falta:
+        resultado.update(
+            (utilizador_id, _nome(first_name, last_name, username))
+            for utilizador_id, username, first_name, last_name
+            in Utilizador.objects.filter(id__in=em_falta).values_list('id', 'username', 'first_name', 'last_name')
+        )
+    return resultado
+
+
+def nome_utilizador(utilizador_id):
+    """Nome completo (ou username) de qualquer utilizador"""
+    return nomes_utilizadores([utilizador_id]).get(utilizador_id, "-")
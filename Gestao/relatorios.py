@@ -0,0 +1,252 @@
+"""
+Relatórios de assiduidade do centro (página do coordenador).
+
+As taxas são presenças / presenças esperadas, em que as esperadas são
+(aulas realizadas) x (formandos inscritos no módulo). As presenças e os
+atrasos são contados em RegistoPresenca pelo índice (aula, estado), só para
+as aulas do período; os agrupamentos por semana e por dia percorrem a tabela
+de aulas com uma contagem por aula.
+
+Os resultados ficam em cache por período, com a versão das aulas desse
+período na chave (a última alteração a uma delas no feed e quantas são):
+uma presença noutro período não os invalida.
+Os cálculos leem pela ligação só de leitura (Gestao.leitura), sem atrasar
+os check-ins que estejam a ser gravados ao mesmo tempo.
+"""
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.db.models import (
+    Case, Count, Exists, F, FloatField, Func, IntegerField, Max, OuterRef, Q, RowRange, Subquery, Sum, Value, When,
+    Window,
+)
+from django.db.models.functions import Cast, Coalesce, Lag, NullIf
+from django.utils import timezone
+
+from .leitura import painel
+from .models import Alteracao, Aula, Inscricao, Modulo, RegistoPresenca
+
+CACHE_SEGUNDOS = 10 * 60  # as inscrições não passam pelo feed de alterações; expiram por tempo
+SEMANAS_MEDIA = 4  # janela da média móvel das tendências semanais
+
+
+def _aulas(desde, ate):
+    """Aulas realizadas no período (as futuras ainda não têm faltas)"""
+    ate = min(ate, timezone.now().date())
+    return Aula.objects.filter(data__gte=desde, data__lte=ate)
+
+
+def _versao(desde, ate):
+    """Muda quando muda uma aula do período ou uma presença numa delas.
+
+    A contagem apanha as aulas removidas ou mudadas para outra data, cujas
+    alterações já não se ligam ao período.
+    """
+    aulas = _aulas(desde or date.min, ate or date.max)
+    ultima = Alteracao.objects.filter(aula_id__in=aulas.values('id')).aggregate(ultima=Max('id'))['ultima']
+    return f"{ultima or 0}.{aulas.count()}"
+
+
+def _em_cache(nome, calcular, desde, ate, *args):
+    with painel():
+        chave = f"relatorios:{nome}:{_versao(desde, ate)}:" + ":".join(str(a) for a in (desde, ate, *args))
+        return cache.get_or_set(chave, lambda: calcular(desde, ate, *args), CACHE_SEGUNDOS)
+
+
+def inscritos_por_modulo():
+    """{modulo_id: formandos inscritos}, pela união das inscrições no curso inteiro e só no módulo.
+
+    As mesmas regras de Inscricao.objects.formandos_de: quem está inscrito
+    no curso e também no módulo conta uma vez.
+    """
+    no_curso = dict(
+        Inscricao.objects.filter(modulo__isnull=True)
+        .values_list('curso_id').annotate(n=Count('formando', distinct=True))
+    )
+    no_curso_inteiro = Inscricao.objects.filter(
+        modulo__isnull=True, curso_id=OuterRef('modulo__curso_id'), formando_id=OuterRef('formando_id'),
+    )
+    no_modulo = dict(
+        Inscricao.objects.filter(modulo__isnull=False).exclude(Exists(no_curso_inteiro))
+        .values_list('modulo_id').annotate(n=Count('formando', distinct=True))
+    )
+    return {
+        modulo_id: no_curso.get(curso_id, 0) + no_modulo.get(modulo_id, 0)
+        for modulo_id, curso_id in Modulo.objects.values_list('id', 'curso_id')
+    }
+
+
+def esperados_por_aula(inscritos):
+    """Expressão SQL com os inscritos do módulo de cada aula.
+
+    Os módulos são agrupados pelo número de inscritos, por isso o CASE tem um
+    ramo por tamanho de turma e não um por módulo.
+    """
+    por_tamanho = {}
+    for modulo_id, n in inscritos.items():
+        if n:
+            por_tamanho.setdefault(n, []).append(modulo_id)
+    if not por_tamanho:
+        return Value(0)
+    return Case(
+        *[When(modulo_id__in=ids, then=Value(n)) for n, ids in por_tamanho.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def presentes_por_aula():
+    """Expressão SQL com as presenças de cada aula, contadas em RegistoPresenca"""
+    return Coalesce(Subquery(
+        RegistoPresenca.objects.filter(aula=OuterRef('pk'), estado__in=RegistoPresenca.PRESENTES)
+        .order_by().values('aula').annotate(n=Count('id')).values('n'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+def _taxa(presencas, esperados):
+    return round(presencas / esperados, 4) if esperados else None
+
+
+def _linha(presencas, esperados, atrasos, aulas):
+    return {
+        'aulas': aulas,
+        'presencas': presencas,
+        'esperados': esperados,
+        'faltas': max(0, esperados - presencas),
+        'atrasos': atrasos,
+        'taxa': _taxa(presencas, esperados),
+    }
+
+
+def _calcular_taxas(desde, ate):
+    inscritos = inscritos_por_modulo()
+    aulas = _aulas(desde, ate)
+    por_modulo = dict(aulas.values_list('modulo_id').annotate(n=Count('id')))
+    contagens = {
+        linha['aula__modulo_id']: linha
+        for linha in RegistoPresenca.objects.filter(aula__in=aulas, estado__in=RegistoPresenca.PRESENTES)
+        .values('aula__modulo_id')
+        .annotate(presencas=Count('id'), atrasos=Count('id', filter=Q(estado='atrasado')))
+    }
+    modulos = (
+        Modulo.objects.filter(id__in=list(por_modulo))
+        .values('id', 'nome', 'curso_id', 'curso__nome', 'formador_id',
+                'formador__username', 'formador__first_name', 'formador__last_name')
+    )
+
+    resultado = {'cursos': {}, 'modulos': [], 'formadores': {}}
+    for m in modulos:
+        n_aulas = por_modulo[m['id']]
+        contagem = contagens.get(m['id'], {})
+        esperados = n_aulas * inscritos.get(m['id'], 0)
+        valores = (contagem.get('presencas', 0), esperados, contagem.get('atrasos', 0), n_aulas)
+        formador = f"{m['formador__first_name']} {m['formador__last_name']}".strip() or m['formador__username']
+        resultado['modulos'].append({
+            'modulo': m['nome'], 'curso': m['curso__nome'], 'formador': formador,
+            'inscritos': inscritos.get(m['id'], 0), **_linha(*valores),
+        })
+        # Cursos e formadores somam os módulos (poucas linhas, já agregadas na BD)
+        for grupo, chave, nome in (('cursos', m['curso_id'], m['curso__nome']),
+                                   ('formadores', m['formador_id'], formador)):
+            acumulado = resultado[grupo].setdefault(chave, [nome, 0, 0, 0, 0])
+            for i, valor in enumerate(valores, start=1):
+                acumulado[i] += valor
+
+    for grupo, coluna in (('cursos', 'curso'), ('formadores', 'formador')):
+        resultado[grupo] = [{coluna: nome, **_linha(*valores)} for nome, *valores in resultado[grupo].values()]
+    for grupo in resultado.values():
+        grupo.sort(key=lambda linha: (linha['taxa'] is None, linha['taxa'] or 0))
+    return resultado
+
+
+def taxas(desde, ate):
+    """Taxas de assiduidade por curso, módulo e formador no período [desde, ate], piores primeiro"""
+    return _em_cache('taxas', _calcular_taxas, desde, ate)
+
+
+class _SomaJanela(Func):
+    """SUM() como função de janela sobre um agregado (Sum(Sum(...)) não é aceite pelo ORM)"""
+    function = 'SUM'
+    window_compatible = True
+    output_field = IntegerField()
+
+
+class _JanelaAgregada(Window):
+    """Janela sobre valores agregados.
+
+    Marcada como agregado para que o GROUP BY fique só com as colunas de
+    partição e ordem, em vez de incluir o resultado da própria janela.
+    """
+    contains_aggregate = True
+
+
+def _calcular_semanal(desde, ate):
+    inscritos = inscritos_por_modulo()
+    presencas = Sum(presentes_por_aula())
+    esperados = Sum(esperados_por_aula(inscritos))
+    taxa = Cast(presencas, FloatField()) / NullIf(esperados, 0)
+    particao = {'partition_by': [F('modulo__curso_id')], 'order_by': F('semana').asc()}
+    janela = RowRange(start=-(SEMANAS_MEDIA - 1), end=0)
+    linhas = (
+        _aulas(desde, ate)
+        .values('modulo__curso_id', 'modulo__curso__nome', 'semana')
+        .annotate(
+            presencas=presencas,
+            esperados=esperados,
+            taxa=taxa,
+            # Tendência: semana anterior e média móvel das últimas SEMANAS_MEDIA semanas, na própria query
+            taxa_anterior=_JanelaAgregada(Lag(taxa), **particao),
+            presencas_janela=_JanelaAgregada(_SomaJanela(presencas), frame=janela, **particao),
+            esperados_janela=_JanelaAgregada(_SomaJanela(esperados), frame=janela, **particao),
+        )
+        .order_by('modulo__curso__nome', 'semana')
+    )
+    return [
+        {
+            'curso': linha['modulo__curso__nome'],
+            'semana': linha['semana'],
+            'presencas': linha['presencas'],
+            'esperados': linha['esperados'],
+            'taxa': _taxa(linha['presencas'], linha['esperados']),
+            'variacao': round(linha['taxa'] - linha['taxa_anterior'], 4)
+            if linha['taxa'] is not None and linha['taxa_anterior'] is not None else None,
+            'media_movel': _taxa(linha['presencas_janela'], linha['esperados_janela']),
+        }
+        for linha in linhas
+    ]
+
+
+def tendencia_semanal(desde, ate):
+    """Taxa semanal de cada curso, com a variação face à semana anterior e a média móvel"""
+    return _em_cache('semanal', _calcular_semanal, desde, ate)
+
+
+def _calcular_mapa(desde, ate, curso_id, modulo_id):
+    aulas = _aulas(desde or date.min, ate or date.max)
+    if curso_id is not None:
+        aulas = aulas.filter(modulo__curso_id=curso_id)
+    if modulo_id is not None:
+        aulas = aulas.filter(modulo_id=modulo_id)
+    linhas = (
+        aulas.values('dia_semana', 'periodo')
+        .annotate(
+            aulas=Count('id'),
+            presencas=Sum(presentes_por_aula()),
+            esperados=Sum(esperados_por_aula(inscritos_por_modulo())),
+        )
+        .order_by('dia_semana', 'periodo')
+    )
+    return [{**linha, 'taxa': _taxa(linha['presencas'], linha['esperados'])} for linha in linhas]
+
+
+def mapa_dias_periodos(desde=None, ate=None, curso_id=None, modulo_id=None):
+    """Taxa de assiduidade por dia da semana (1 = segunda) e período, numa única query agrupada"""
+    return _em_cache('mapa', _calcular_mapa, desde, ate, curso_id, modulo_id)
+
+
+def periodo_predefinido(nome, hoje=None):
+    """Intervalo de datas dos períodos oferecidos na página do coordenador"""
+    hoje = hoje or timezone.now().date()
+    dias = {'semana': 7, 'mes': 30, 'trimestre': 91, 'ano': 365}[nome]
+    return hoje - timedelta(days=dias - 1), hoje
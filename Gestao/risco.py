@@ -0,0 +1,249 @@
+"""
+Risco de assiduidade: probabilidade de cada formando ficar abaixo do limite.
+
+Corre em lote (comando calcular_risco, tipicamente à noite). O histórico
+inteiro é lido em poucas queries diretamente para arrays e as
+características de todos os formandos são calculadas de uma vez:
+
+- taxa_total / taxa_recente: presenças / aulas esperadas (inscrições x
+  aulas realizadas), no histórico e nos últimos RISCO_JANELA_DIAS dias;
+- faltas_seguidas: aulas esperadas desde a última presença;
+- frequencia_atrasos: atrasos / presenças;
+- desvio_dia_semana: taxa total menos a taxa do pior dia da semana.
+
+O modelo é uma regressão logística ajustada localmente: as características
+calculadas há RISCO_JANELA_DIAS dias são comparadas com o que aconteceu
+desde então (taxa abaixo de LIMITE_ASSIDUIDADE) e o modelo resultante
+pontua as características de hoje.
+"""
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.utils import timezone
+
+from .models import Aula, Inscricao, Modulo, RegistoPresenca, RiscoAssiduidade
+
+CARACTERISTICAS = ['taxa_total', 'taxa_recente', 'faltas_seguidas', 'frequencia_atrasos', 'desvio_dia_semana']
+_DIAS = 100_000  # multiplicador das chaves (grupo, dia): maior do que qualquer data em dias desde 1970
+
+
+def _colunas(queryset, *campos, dtype=None):
+    """Colunas da queryset lidas diretamente do cursor, sem criar objetos por linha.
+
+    Com dtype (colunas todas numéricas) a conversão para NumPy é feita de uma vez.
+    """
+    sql, params = queryset.values_list(*campos).query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        linhas = cursor.fetchall()
+    if dtype is not None:
+        return list(np.array(linhas, dtype=dtype).reshape(-1, len(campos)).T)
+    if not linhas:
+        return [np.array([], dtype=object) for _ in campos]
+    return [np.array(coluna) for coluna in zip(*linhas)]
+
+
+def _dias(valores):
+    """Datas (date ou texto ISO, conforme o backend) em dias desde 1970"""
+    return np.asarray(valores, dtype='datetime64[D]').astype(np.int64)
+
+
+class Historico:
+    """Aulas, inscrições e presenças até `ate`, em arrays prontos a agregar"""
+
+    def __init__(self, ate):
+        self.ate = ate
+        aula_ids, aula_modulos, aula_datas, aula_dias_semana = _colunas(
+            Aula.objects.filter(data__lte=ate).order_by('id'), 'id', 'modulo_id', 'data', 'dia_semana'
+        )
+        aula_ids = aula_ids.astype(np.int64)
+        aula_modulos = aula_modulos.astype(np.int64)
+        aula_datas = _dias(aula_datas)
+        aula_dias_semana = aula_dias_semana.astype(np.int64)
+
+        # Chaves ordenadas (módulo, data) e (módulo, dia da semana, data): contar aulas esperadas
+        # num intervalo de datas passa a ser um par de searchsorted por inscrição
+        self.chaves = np.sort(aula_modulos * _DIAS + aula_datas)
+        self.chaves_semana = np.sort((aula_modulos * 8 + aula_dias_semana) * _DIAS + aula_datas)
+
+        inscricoes = pd.DataFrame(dict(zip(
+            ['formando', 'curso', 'modulo'],
+            _colunas(Inscricao.objects.all(), 'formando_id', 'curso_id', 'modulo_id'),
+        )))
+        modulos = pd.DataFrame(dict(zip(['modulo', 'curso'], _colunas(Modulo.objects.all(), 'id', 'curso_id'))))
+        if inscricoes.empty:
+            inscricoes = pd.DataFrame(columns=['formando', 'curso', 'modulo'])
+        # Inscrições no curso inteiro valem para todos os módulos do curso
+        no_curso = inscricoes[inscricoes['modulo'].isna()][['formando', 'curso']].merge(modulos, on='curso')
+        pares = pd.concat([
+            inscricoes[inscricoes['modulo'].notna()][['formando', 'modulo']],
+            no_curso[['formando', 'modulo']],
+        ]).drop_duplicates()
+        self.formandos = np.unique(pares['formando'].to_numpy(dtype=np.int64))
+        self.par_formando = np.searchsorted(self.formandos, pares['formando'].to_numpy(dtype=np.int64))
+        self.par_modulo = pares['modulo'].to_numpy(dtype=np.int64)
+
+        # A maior leitura: só inteiros e sem join com as aulas (a data vem dos arrays acima)
+        formandos, aulas, atrasos = _colunas(
+            RegistoPresenca.objects.filter(estado__in=RegistoPresenca.PRESENTES)
+            .annotate(atraso=ExpressionWrapper(Q(estado='atrasado'), output_field=BooleanField())),
+            'formando_id', 'aula_id', 'atraso', dtype=np.int64,
+        )
+        indice_aula = np.minimum(np.searchsorted(aula_ids, aulas), max(len(aula_ids) - 1, 0))
+        # Ficam de fora aulas depois de `ate` e presenças de quem já não está inscrito
+        validos = np.isin(formandos, self.formandos)
+        if len(aula_ids):
+            validos &= aula_ids[indice_aula] == aulas
+        else:
+            validos[:] = False
+        self.pres_formando = np.searchsorted(self.formandos, formandos[validos])
+        self.pres_data = aula_datas[indice_aula[validos]]
+        self.pres_dia_semana = aula_dias_semana[indice_aula[validos]]
+        self.pres_atraso = atrasos[validos].astype(bool)
+
+    def _esperadas(self, desde, ate, dia_semana=None):
+        """Aulas esperadas por formando com data em ]desde, ate] (desde/ate em dias, escalares ou por formando)"""
+        if dia_semana is None:
+            grupo, chaves = self.par_modulo, self.chaves
+        else:
+            grupo, chaves = self.par_modulo * 8 + dia_semana, self.chaves_semana
+        desde = np.broadcast_to(desde, self.formandos.shape)[self.par_formando]
+        ate = np.broadcast_to(ate, self.formandos.shape)[self.par_formando]
+        por_par = (np.searchsorted(chaves, grupo * _DIAS + ate, side='right')
+                   - np.searchsorted(chaves, grupo * _DIAS + desde, side='right'))
+        return np.bincount(self.par_formando, weights=por_par, minlength=len(self.formandos)).astype(float)
+
+    def _presencas(self, mascara):
+        return np.bincount(self.pres_formando[mascara], minlength=len(self.formandos)).astype(float)
+
+    def caracteristicas(self, corte, janela):
+        """DataFrame (um formando por linha) com as características à data `corte`"""
+        corte = int(_dias(corte))
+        inicio = np.int64(-1)  # antes de qualquer data (as chaves de módulos diferentes não se misturam)
+        ate_corte = self.pres_data <= corte
+        recentes = ate_corte & (self.pres_data > corte - janela)
+
+        esperadas = self._esperadas(inicio, corte)
+        presencas = self._presencas(ate_corte)
+        taxa_total = np.divide(presencas, esperadas, out=np.ones_like(esperadas), where=esperadas > 0)
+        esperadas_recentes = self._esperadas(corte - janela, corte)
+        taxa_recente = np.divide(self._presencas(recentes), esperadas_recentes,
+                                 out=taxa_total.copy(), where=esperadas_recentes > 0)
+
+        ultima = np.full(len(self.formandos), inicio)
+        np.maximum.at(ultima, self.pres_formando[ate_corte], self.pres_data[ate_corte])
+        faltas_seguidas = self._esperadas(ultima, corte)
+
+        atrasos = self._presencas(ate_corte & self.pres_atraso)
+        frequencia_atrasos = np.divide(atrasos, presencas, out=np.zeros_like(presencas), where=presencas > 0)
+
+        pior_dia = taxa_total.copy()
+        for dia in range(1, 8):
+            esperadas_dia = self._esperadas(inicio, corte, dia)
+            taxa_dia = np.divide(self._presencas(ate_corte & (self.pres_dia_semana == dia)), esperadas_dia,
+                                 out=np.ones_like(esperadas_dia), where=esperadas_dia > 0)
+            pior_dia = np.minimum(pior_dia, taxa_dia)
+
+        return pd.DataFrame({
+            'taxa_total': taxa_total,
+            'taxa_recente': taxa_recente,
+            'faltas_seguidas': faltas_seguidas,
+            'frequencia_atrasos': frequencia_atrasos,
+            'desvio_dia_semana': taxa_total - pior_dia,
+            'esperadas': esperadas,
+        }, index=pd.Index(self.formandos, name='formando'))
+
+    def taxa_entre(self, desde, ate):
+        """(taxa, aulas esperadas) de cada formando no intervalo ]desde, ate]"""
+        desde, ate = int(_dias(desde)), int(_dias(ate))
+        esperadas = self._esperadas(desde, ate)
+        presencas = self._presencas((self.pres_data > desde) & (self.pres_data <= ate))
+        return np.divide(presencas, esperadas, out=np.ones_like(esperadas), where=esperadas > 0), esperadas
+
+
+def ajustar_logistica(X, y, l2=1.0, iteracoes=25):
+    """Regressão logística com regularização L2, pelo método de Newton; devolve os pesos (intercepto primeiro)"""
+    X = np.column_stack([np.ones(len(X)), X])
+    pesos = np.zeros(X.shape[1])
+    for _ in range(iteracoes):
+        p = 1 / (1 + np.exp(-X @ pesos))
+        gradiente = X.T @ (p - y) + l2 * pesos
+        hessiana = (X.T * (p * (1 - p))) @ X + l2 * np.eye(X.shape[1])
+        passo = np.linalg.solve(hessiana, gradiente)
+        pesos -= passo
+        if np.abs(passo).max() < 1e-6:
+            break
+    return pesos
+
+
+def prever(pesos, X):
+    return 1 / (1 + np.exp(-(pesos[0] + X @ pesos[1:])))
+
+
+def calcular(ate=None):
+    """Ajusta o modelo, pontua todos os formandos inscritos e grava os scores.
+
+    Devolve um dicionário com o número de formandos pontuados, o tamanho do
+    treino, os casos positivos e os pesos por característica.
+    """
+    if ate is None:
+        ate = timezone.now().date() - timedelta(days=1)
+    janela = settings.RISCO_JANELA_DIAS
+    corte_treino = ate - timedelta(days=janela)
+    historico = Historico(ate)
+
+    # Treino: características de há `janela` dias -> ficou abaixo do limite desde então?
+    passado = historico.caracteristicas(corte_treino, janela)
+    taxa_seguinte, esperadas_seguinte = historico.taxa_entre(corte_treino, ate)
+    treino = (passado['esperadas'].to_numpy() > 0) & (esperadas_seguinte > 0)
+    X_treino = passado.loc[treino, CARACTERISTICAS].to_numpy(dtype=float)
+    y_treino = (taxa_seguinte[treino] < settings.LIMITE_ASSIDUIDADE).astype(float)
+
+    # Padronização com as estatísticas do treino (a mesma transformação é aplicada a hoje)
+    media = X_treino.mean(axis=0) if len(X_treino) else np.zeros(len(CARACTERISTICAS))
+    desvio = X_treino.std(axis=0) if len(X_treino) else np.ones(len(CARACTERISTICAS))
+    desvio[desvio == 0] = 1
+    pesos = ajustar_logistica((X_treino - media) / desvio, y_treino)
+
+    atual = historico.caracteristicas(ate, janela)
+    probabilidades = prever(pesos, (atual[CARACTERISTICAS].to_numpy(dtype=float) - media) / desvio)
+
+    atual['probabilidade'] = probabilidades
+    atual['faltas_seguidas'] = atual['faltas_seguidas'].astype(int)
+    _gravar(atual)
+    return {
+        'formandos': len(atual),
+        'treino': int(treino.sum()),
+        'positivos': int(y_treino.sum()),
+        'pesos': dict(zip(['intercepto', *CARACTERISTICAS], pesos.round(3).tolist())),
+    }
+
+
+def _gravar(tabela):
+    """Substitui todos os scores (quem deixou de estar inscrito sai do ranking).
+
+    São dezenas de milhares de linhas de números já calculados: vão diretamente
+    para executemany, sem instanciar um modelo por linha como o bulk_create.
+    """
+    campos = ['probabilidade', *CARACTERISTICAS]
+    opts = RiscoAssiduidade._meta
+    colunas = [opts.get_field('formando').column, *(opts.get_field(c).column for c in campos),
+               opts.get_field('calculado_em').column]
+    nome = connection.ops.quote_name
+    sql = (f"INSERT INTO {nome(opts.db_table)} ({', '.join(nome(c) for c in colunas)}) "
+           f"VALUES ({', '.join(['%s'] * len(colunas))})")
+    agora = connection.ops.adapt_datetimefield_value(timezone.now())
+    valores = zip(tabela.index.tolist(), *(tabela[c].tolist() for c in campos))
+    linhas = [(*linha, agora) for linha in valores]
+    with transaction.atomic(), connection.cursor() as cursor:
+        RiscoAssiduidade.objects.all().delete()
+        cursor.executemany(sql, linhas)
+
+
+def mais_em_risco(limite=50):
+    """Formandos com maior probabilidade de ficar abaixo do limite"""
+    return RiscoAssiduidade.objects.select_related('formando').order_by('-probabilidade')[:limite]
@@ -0,0 +1,247 @@
+"""
+Modelos de leitura partilhados pelos frontends (app.py, Frontend/pages e monitor).
+
+Cada função devolve tudo o que uma página precisa num número fixo de
+queries, seja qual for o número de módulos, aulas ou formandos: as
+relações são lidas em lote e juntadas em Python, e os nomes de módulos,
+cursos e formadores vêm da cache de referências. O número máximo de
+queries de cada chamada é declarado com @orcamento e verificado nos
+testes (Gestao/tests.py), com a cache de referências já carregada.
+"""
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import referencias
+from .models import Aula, CodigoPresenca, Inscricao, RegistoPresenca
+
+LEITURAS = []  # funções com orçamento declarado (percorridas pelos testes)
+
+
+def orcamento(queries):
+    """Declara o número máximo de queries de uma chamada"""
+    def declarar(funcao):
+        funcao.orcamento_queries = queries
+        LEITURAS.append(funcao)
+        return funcao
+    return declarar
+
+
+# --------------------------
+# Módulos
+# --------------------------
+def _inscritos(modulos):
+    """{modulo_id: set(formando_id)}, com as mesmas regras de Inscricao.objects.formandos_de"""
+    por_curso, por_modulo = {}, {}
+    inscricoes = Inscricao.objects.filter(
+        Q(curso_id__in={m.curso_id for m in modulos}, modulo__isnull=True)
+        | Q(modulo_id__in=[m.id for m in modulos])
+    ).values_list('formando_id', 'curso_id', 'modulo_id')
+    for formando_id, curso_id, modulo_id in inscricoes:
+        if modulo_id is None:
+            por_curso.setdefault(curso_id, set()).add(formando_id)
+        else:
+            por_modulo.setdefault(modulo_id, set()).add(formando_id)
+    return {m.id: por_curso.get(m.curso_id, set()) | por_modulo.get(m.id, set()) for m in modulos}
+
+
+@orcamento(3)
+def resumo_modulos(modulos):
+    """{modulo_id: resumo} com as chaves de assiduidade.resumo_modulo, para vários módulos de uma vez"""
+    modulos = list(modulos)
+    if not modulos:
+        return {}
+    ids = [m.id for m in modulos]
+    hoje = timezone.now().date()
+    aulas = {
+        modulo_id: (total, realizadas)
+        for modulo_id, total, realizadas in Aula.objects.filter(modulo_id__in=ids)
+        .values('modulo_id')
+        .annotate(total=Count('id'), realizadas=Count('id', filter=Q(data__lte=hoje)))
+        .values_list('modulo_id', 'total', 'realizadas')
+    }
+    presentes = Q(estado__in=RegistoPresenca.PRESENTES)
+    totais = {
+        linha['aula__modulo_id']: linha
+        for linha in RegistoPresenca.objects.filter(aula__modulo_id__in=ids)
+        .values('aula__modulo_id')
+        .annotate(
+            presencas=Count('id', filter=presentes),
+            atrasos=Count('id', filter=Q(estado='atrasado')),
+            presencas_realizadas=Count('id', filter=presentes & Q(aula__data__lte=hoje)),
+        )
+    }
+    inscritos = _inscritos(modulos)
+
+    resultado = {}
+    for modulo_id in ids:
+        total, realizadas = aulas.get(modulo_id, (0, 0))
+        linha = totais.get(modulo_id, {'presencas': 0, 'atrasos': 0, 'presencas_realizadas': 0})
+        n = len(inscritos[modulo_id])
+        resultado[modulo_id] = {
+            'total_aulas': total,
+            'inscritos': n,
+            'presencas': linha['presencas'],
+            'faltas': max(0, realizadas * n - linha['presencas_realizadas']),
+            'atrasos': linha['atrasos'],
+        }
+    return resultado
+
+
+# --------------------------
+# Aulas
+# --------------------------
+@orcamento(3)
+def roster_aulas(modulo, aulas):
+    """{aula_id: [{'formando', 'registo'}]} com todos os inscritos do módulo, por username.
+
+    Sem registo (None) é uma falta virtual. Serve o editor de presenças de
+    várias aulas com as mesmas queries que uma só.
+    """
+    aulas = list(aulas)
+    if not aulas:
+        return {}
+    inscritos = list(
+        Inscricao.objects.formandos_de(modulo).order_by('username')
+        .only('id', 'username', 'first_name', 'last_name')
+    )
+    registos = {
+        (r.aula_id, r.formando_id): r
+        for r in RegistoPresenca.objects.filter(aula__in=[a.id for a in aulas])
+    }
+    return {
+        aula.id: [{'formando': f, 'registo': registos.get((aula.id, f.id))} for f in inscritos]
+        for aula in aulas
+    }
+
+
+@orcamento(2)
+def aulas_de_hoje(formando, dia=None):
+    """[(aula, registo do formando ou None)] das aulas do dia nos módulos do formando.
+
+    aula.modulo vem da cache de referências, com curso e formador já
+    preenchidos, por isso mostrar os nomes não faz queries.
+    """
+    dia = dia or timezone.localdate()
+    aulas = list(
+        Aula.objects.filter(data=dia, modulo__in=Inscricao.objects.modulos_de(formando)).order_by('periodo')
+    )
+    if not aulas:
+        return []
+    for aula in aulas:
+        aula.modulo = referencias.modulo(aula.modulo_id)
+    registos = {
+        r.aula_id: r for r in RegistoPresenca.objects.filter(formando=formando, aula__in=[a.id for a in aulas])
+    }
+    return [(aula, registos.get(aula.id)) for aula in aulas]
+
+
+# --------------------------
+# Códigos
+# --------------------------
+ESTADOS_CODIGO = ("Válido", "Agendado", "Substituído", "Expirado")
+
+
+def estado_codigo(codigo, agora=None):
+    """Validade do código; se foi usado vê-se pelas presenças (usos_codigos)"""
+    agora = agora or timezone.now()
+    if not codigo.valido:
+        return "Substituído"
+    if agora > codigo.expira:
+        return "Expirado"
+    if codigo.valido_desde and agora < codigo.valido_desde:
+        return "Agendado"
+    return "Válido"
+
+
+def codigos_filtrados(desde, ate, formador_id=None, modulo_id=None, periodo=None, estado=None):
+    """Códigos gerados entre duas datas (intervalo de timestamps, para usar o índice); não faz queries"""
+    inicio = timezone.make_aware(datetime.combine(desde, datetime.min.time()))
+    fim = timezone.make_aware(datetime.combine(ate + timedelta(days=1), datetime.min.time()))
+    codigos = CodigoPresenca.objects.filter(timestamp__gte=inicio, timestamp__lt=fim)
+    if formador_id is not None:
+        codigos = codigos.filter(aula__modulo__formador_id=formador_id)
+    if modulo_id is not None:
+        codigos = codigos.filter(aula__modulo_id=modulo_id)
+    if periodo is not None:
+        codigos = codigos.filter(aula__periodo=periodo)
+    agora = timezone.now()
+    if estado == "Substituído":
+        codigos = codigos.filter(valido=False)
+    elif estado == "Expirado":
+        codigos = codigos.filter(valido=True, expira__lt=agora)
+    elif estado == "Agendado":
+        codigos = codigos.filter(valido=True, expira__gte=agora, valido_desde__gt=agora)
+    elif estado == "Válido":
+        codigos = codigos.filter(valido=True, expira__gte=agora).exclude(valido_desde__gt=agora)
+    return codigos
+
+
+@orcamento(2)
+def usos_codigos(codigos):
+    """{codigo_id: check-ins feitos com o código}.
+
+    Cada entrada conta para o código da aula em vigor nesse momento, o
+    último gerado antes dela (um novo código retira o anterior do registo).
+    """
+    codigos = list(codigos)
+    aula_ids = {c.aula_id for c in codigos}
+    if not aula_ids:
+        return {}
+    gerados = {}
+    for codigo_id, aula_id, timestamp in (
+        CodigoPresenca.objects.filter(aula_id__in=aula_ids)
+        .order_by('timestamp', 'id').values_list('id', 'aula_id', 'timestamp')
+    ):
+        timestamps, ids = gerados.setdefault(aula_id, ([], []))
+        timestamps.append(timestamp)
+        ids.append(codigo_id)
+    usos = {}
+    for aula_id, entrada in RegistoPresenca.objects.filter(
+        aula_id__in=aula_ids, entrada__isnull=False
+    ).values_list('aula_id', 'entrada'):
+        timestamps, ids = gerados[aula_id]
+        i = bisect_right(timestamps, entrada) - 1
+        if i >= 0:
+            usos[ids[i]] = usos.get(ids[i], 0) + 1
+    return {c.id: usos.get(c.id, 0) for c in codigos}
+
+
+@orcamento(2)
+def pagina_codigos(codigos, cursor=None, tamanho=50, descendente=True):
+    """Uma página do registo de códigos depois do cursor (timestamp, id), e se há mais páginas.
+
+    Cada linha traz o código (com a aula), o estado e o primeiro registo de
+    presença da aula com entrada depois de o código ser gerado.
+    """
+    if cursor is not None:
+        timestamp, codigo_id = cursor
+        if descendente:
+            codigos = codigos.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=codigo_id))
+        else:
+            codigos = codigos.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=codigo_id))
+    ordem = ("-timestamp", "-id") if descendente else ("timestamp", "id")
+    pagina = list(codigos.select_related('aula').order_by(*ordem)[:tamanho + 1])
+    ha_mais = len(pagina) > tamanho
+    pagina = pagina[:tamanho]
+    if not pagina:
+        return [], False
+
+    registos_por_aula = {}
+    for registo in (
+        RegistoPresenca.objects.filter(aula_id__in={c.aula_id for c in pagina}, entrada__isnull=False)
+        .only('id', 'aula_id', 'formando_id', 'entrada', 'motivo_atraso', 'justificativo')
+        .order_by('id')
+    ):
+        registos_por_aula.setdefault(registo.aula_id, []).append(registo)
+
+    agora = timezone.now()
+    linhas = []
+    for codigo in pagina:
+        registo = next(
+            (r for r in registos_por_aula.get(codigo.aula_id, ()) if r.entrada >= codigo.timestamp), None
+        )
+        linhas.append({'codigo': codigo, 'estado': estado_codigo(codigo, agora), 'registo': registo})
+    return linhas, ha_mais
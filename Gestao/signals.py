@@ -0,0 +1,88 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from . import alertas, codigos, horas, indice_presencas, referencias
+from .alteracoes import ENTIDADES_SEGUIDAS, registar
+from .models import Aula, CodigoPresenca, Curso, Modulo, RegistoPresenca, Utilizador
+
+
+def registar_gravacao(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        registar(instance, 'criar' if created else 'atualizar')
+
+
+def registar_remocao(sender, instance, **kwargs):
+    registar(instance, 'remover')
+
+
+for modelo in ENTIDADES_SEGUIDAS:
+    post_save.connect(registar_gravacao, sender=modelo, dispatch_uid=f"alteracoes_save_{modelo.__name__}")
+    post_delete.connect(registar_remocao, sender=modelo, dispatch_uid=f"alteracoes_delete_{modelo.__name__}")
+
+
+def atualizar_derivados(registo, removido=False):
+    """Índice, horas e alertas do registo numa única transação.
+
+    Com transaction_mode IMMEDIATE (settings) a transação pede logo o lock de
+    escrita, por isso dois check-ins em simultâneo não leem o mesmo bitmap,
+    posição do roster ou linha do ledger antes de o outro os gravar.
+    """
+    try:
+        # Normalmente já vem carregada por quem gravou o registo
+        aula = registo.aula
+    except Aula.DoesNotExist:
+        return
+    with transaction.atomic():
+        indice_presencas.atualizar_registo(registo, aula, removido=removido)
+        horas.atualizar_par(registo.formando_id, aula)
+        alertas.registar_escrita(registo, aula, removido=removido)
+
+
+def atualizar_indice(sender, instance, raw=False, **kwargs):
+    if not raw:
+        atualizar_derivados(instance)
+
+
+def remover_do_indice(sender, instance, **kwargs):
+    atualizar_derivados(instance, removido=True)
+
+
+post_save.connect(atualizar_indice, sender=RegistoPresenca, dispatch_uid="indice_presencas_save")
+post_delete.connect(remover_do_indice, sender=RegistoPresenca, dispatch_uid="indice_presencas_delete")
+
+
+def invalidar_referencias(sender, instance=None, raw=False, **kwargs):
+    if not raw:
+        referencias.invalidar_depois_do_commit()
+
+
+def utilizador_gravado(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    # Só os nomes da equipa estão em cache: um formando novo não a invalida
+    if created:
+        mudou = instance.tipo in referencias.TIPOS_EM_CACHE
+    else:
+        mudou = referencias.utilizador_mudou(instance, update_fields)
+    if mudou:
+        referencias.invalidar_depois_do_commit()
+
+
+for modelo in (Curso, Modulo):
+    post_save.connect(invalidar_referencias, sender=modelo, dispatch_uid=f"referencias_save_{modelo.__name__}")
+    post_delete.connect(invalidar_referencias, sender=modelo, dispatch_uid=f"referencias_delete_{modelo.__name__}")
+post_save.connect(utilizador_gravado, sender=Utilizador, dispatch_uid="referencias_save_Utilizador")
+post_delete.connect(invalidar_referencias, sender=Utilizador, dispatch_uid="referencias_delete_Utilizador")
+
+
+def sincronizar_codigo(sender, instance, raw=False, **kwargs):
+    if not raw:
+        codigos.sincronizar([instance])
+
+
+def remover_codigo(sender, instance, **kwargs):
+    codigos.remover(instance.codigo)
+
+
+post_save.connect(sincronizar_codigo, sender=CodigoPresenca, dispatch_uid="codigos_ativos_save")
+post_delete.connect(remover_codigo, sender=CodigoPresenca, dispatch_uid="codigos_ativos_delete")
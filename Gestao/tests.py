@@ -1,3 +1,1045 @@
-from django.test import TestCase
+import io
+import itertools
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from pathlib import Path
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection, connections
+from django.db.migrations.loader import MigrationLoader
+from django.db.utils import ConnectionHandler
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+import launch
+from Projecto_Final import ligacoes
+
+from . import (
+    agendador, alertas, autenticacao, codigos, eventos, horas, indice_presencas, referencias, relatorios, risco,
+    servicos,
+)
+from .alteracoes import alteracoes_desde, aulas_alteradas, ultima_sequencia
+from .assiduidade import marcar_falta, resumo_modulo
+from .autenticacao import criar_token_sessao
+from .eventos import Broker
+from .leitura import LEITURA, RouterLeitura, ativar_wal, painel
+from .models import (
+    Aula, CodigoAtivo, CodigoPresenca, Curso, EstadoAssiduidade, HorasAssistidas, IndicePresenca, Inscricao, Modulo,
+    Notificacao, RegistoPresenca, Utilizador,
+)
+
+_VERSAO = Path(tempfile.mkdtemp()) / "referencias_versao"
+_numeros = itertools.count()
+
+
+def criar_utilizador(tipo='Formando'):
+    return Utilizador.objects.create(username=f"{tipo.lower()}{next(_numeros)}", tipo=tipo)
+
+
+def criar_turma(formandos=2, formador=None):
+    """Curso com um módulo e formandos inscritos no curso inteiro"""
+    curso = Curso.objects.create(nome=f"Curso {next(_numeros)}", carga_horaria_total=100)
+    modulo = Modulo.objects.create(
+        nome=f"Módulo {next(_numeros)}", curso=curso, formador=formador or criar_utilizador('Formador'),
+        carga_horaria=25,
+    )
+    inscritos = [criar_utilizador() for _ in range(formandos)]
+    Inscricao.objects.inscrever(inscritos, curso)
+    return modulo, inscritos
+
+
+class InscricaoTests(TestCase):
+    """Um formando vê os módulos do curso em que está inscrito ou só o módulo em que se inscreveu"""
+
+    def test_modulos_e_formandos_pelo_curso_ou_pelo_modulo(self):
+        modulo, (do_curso,) = criar_turma(formandos=1)
+        outro = Modulo.objects.create(
+            nome="Outro", curso=modulo.curso, formador=modulo.formador, carga_horaria=10
+        )
+        so_modulo = criar_utilizador()
+        Inscricao.objects.inscrever([so_modulo], modulo.curso, outro)
+
+        self.assertEqual(set(Inscricao.objects.modulos_de(do_curso)), {modulo, outro})
+        self.assertEqual(list(Inscricao.objects.modulos_de(so_modulo)), [outro])
+        self.assertEqual(list(Inscricao.objects.formandos_de(modulo)), [do_curso])
+        self.assertEqual(set(Inscricao.objects.formandos_de(outro)), {do_curso, so_modulo})
+
+    def test_inscrever_ignora_repetidos_e_desinscrever_remove(self):
+        modulo, formandos = criar_turma(formandos=2)
+        Inscricao.objects.inscrever(formandos, modulo.curso)
+        self.assertEqual(Inscricao.objects.filter(curso=modulo.curso).count(), 2)
+
+        Inscricao.objects.desinscrever(formandos[:1], modulo.curso)
+        self.assertEqual(list(Inscricao.objects.formandos_de(modulo)), formandos[1:])
+        self.assertFalse(Inscricao.objects.modulos_de(formandos[0]).exists())
+
+
+
+class FaltasVirtuaisTests(TestCase):
+    """As faltas são inscritos menos presentes nas aulas já realizadas; só se guardam com dados próprios"""
+
+    def test_resumo_conta_faltas_so_nas_aulas_realizadas(self):
+        modulo, formandos = criar_turma(formandos=3)
+        hoje = timezone.localdate()
+        passada = Aula.objects.create(modulo=modulo, data=hoje - timedelta(days=1), periodo='manha')
+        Aula.objects.create(modulo=modulo, data=hoje + timedelta(days=1), periodo='manha')
+        RegistoPresenca.objects.create(formando=formandos[0], aula=passada, entrada=timezone.now(), estado='presente')
+
+        resumo = resumo_modulo(modulo)
+        self.assertEqual(resumo['total_aulas'], 2)
+        self.assertEqual(resumo['inscritos'], 3)
+        self.assertEqual(resumo['presencas'], 1)
+        self.assertEqual(resumo['faltas'], 2)
+
+    def test_marcar_falta_so_guarda_linhas_com_justificacao(self):
+        modulo, (formando,) = criar_turma(formandos=1)
+        aula = Aula.objects.create(modulo=modulo, data=timezone.localdate(), periodo='manha')
+        RegistoPresenca.objects.create(formando=formando, aula=aula, entrada=timezone.now())
+
+        self.assertIsNone(marcar_falta(formando.id, aula))
+        self.assertFalse(RegistoPresenca.objects.exists())
+
+        registo = marcar_falta(formando.id, aula, "Consulta médica")
+        self.assertEqual((registo.estado, registo.motivo_atraso), ('justificada', "Consulta médica"))
+        self.assertEqual(RegistoPresenca.objects.get().estado, 'justificada')
+
+
+class AutenticacaoTests(TestCase):
+    """Login com o hash no pool e retoma da sessão por token assinado"""
+
+    def test_token_retoma_a_sessao_ate_a_palavra_passe_mudar(self):
+        user = criar_utilizador()
+        user.set_password("segredo123")
+        user.save()
+        token = autenticacao.criar_token_sessao(user)
+        self.assertEqual(autenticacao.utilizador_do_token(token), user)
+        self.assertIsNone(autenticacao.utilizador_do_token(token + "x"))
+
+        user.set_password("outro-segredo")
+        user.save()
+        self.assertIsNone(autenticacao.utilizador_do_token(token))
+
+    def test_terminar_sessao_revoga_os_tokens_emitidos(self):
+        user = criar_utilizador()
+        token = autenticacao.criar_token_sessao(user)
+        autenticacao.revogar_sessoes(user)
+        self.assertIsNone(autenticacao.utilizador_do_token(token))
+
+        novo = autenticacao.criar_token_sessao(user)
+        self.assertEqual(autenticacao.utilizador_do_token(novo), user)
+
+    @override_settings(PASSWORD_HASHERS=[
+        "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+        "django.contrib.auth.hashers.MD5PasswordHasher",
+    ])
+    def test_login_guarda_o_hash_atualizado(self):
+        user = criar_utilizador()
+        user.password = make_password("segredo123", hasher="md5")
+        user.save()
+
+        futuro = autenticacao.iniciar_autenticacao(user.username, "segredo123")
+        self.assertEqual(autenticacao.concluir_autenticacao(futuro), user)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith("pbkdf2_sha256$"))
+
+        self.assertIsNone(autenticacao.autenticar(user.username, "errada"))
+        with self.assertRaises(Utilizador.DoesNotExist):
+            autenticacao.iniciar_autenticacao("ninguem", "segredo123")
+
+
+class ProxyLauncherTests(SimpleTestCase):
+    """O proxy do launcher mantém cada cliente no mesmo worker enquanto este estiver saudável"""
+
+    def test_cliente_so_muda_de_worker_quando_o_seu_cai(self):
+        workers = [launch.Worker(f"app-{i}", [], 9000 + i, "/") for i in range(3)]
+        for worker in workers:
+            worker.healthy = True
+        proxy = launch.StickyProxy("app", 8501, workers)
+        clientes = [f"10.0.0.{i}" for i in range(30)]
+        antes = {ip: proxy.choose(ip) for ip in clientes}
+
+        caido = antes[clientes[0]]
+        caido.healthy = False
+        depois = {ip: proxy.choose(ip) for ip in clientes}
+        for ip in clientes:
+            if antes[ip] is caido:
+                self.assertIsNot(depois[ip], caido)
+            else:
+                self.assertIs(depois[ip], antes[ip])
+
+        caido.healthy = True
+        self.assertEqual({ip: proxy.choose(ip) for ip in clientes}, antes)
+
+    def test_sem_workers_disponiveis(self):
+        proxy = launch.StickyProxy("app", 8501, [launch.Worker("app-1", [], 9000, "/")])
+        self.assertIsNone(proxy.choose("10.0.0.1"))
+        self.assertIsNone(proxy.choose(None))
+
+
+class AgendadorTests(SimpleTestCase):
+    """Expressões cron, próxima execução e execuções sobrepostas do agendador"""
+
+    def test_campos_da_expressao(self):
+        cron = agendador.Cron("*/15 9-17 * * 1-5,7")
+        self.assertEqual(cron.minutos, {0, 15, 30, 45})
+        self.assertEqual(cron.horas, set(range(9, 18)))
+        self.assertEqual(cron.dias_semana, {0, 1, 2, 3, 4, 5})
+        self.assertTrue(cron.coincide(datetime(2026, 10, 19, 9, 45)))
+        self.assertFalse(cron.coincide(datetime(2026, 10, 17, 9, 45)))  # sábado
+        for invalida in ("* * * *", "60 * * * *", "5-2 * * * *", "* * 0 * *"):
+            with self.subTest(expressao=invalida), self.assertRaises(ValueError):
+                agendador.Cron(invalida)
+
+    def test_proxima_execucao(self):
+        segunda = datetime(2026, 10, 19, 12, 0)
+        self.assertEqual(agendador.Cron("30 6 * * *").proxima(segunda), datetime(2026, 10, 20, 6, 30))
+        self.assertEqual(agendador.Cron("*/30 * * * *").proxima(datetime(2026, 10, 19, 23, 45)),
+                         datetime(2026, 10, 20, 0, 0))
+        # Dia do mês e dia da semana restritos: basta um deles (sexta 23 antes do dia 13 seguinte)
+        self.assertEqual(agendador.Cron("0 0 13 * 5").proxima(segunda), datetime(2026, 10, 23, 0, 0))
+        self.assertEqual(agendador.Cron("0 9 29 2 *").proxima(segunda), datetime(2028, 2, 29, 9, 0))
+
+    def test_execucao_sobreposta_e_saltada(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            historico = str(Path(pasta) / "historico.json")
+            tarefas = agendador.Agendador({'tarefa': ("* * * * *", ["check"])}, historico=historico)
+            tarefas.a_correr['tarefa'] = None  # execução anterior ainda a arrancar
+            with redirect_stdout(io.StringIO()):
+                self.assertFalse(tarefas.disparar('tarefa'))
+            tarefas.pool.shutdown()
+            self.assertEqual([e['resultado'] for e in agendador.ler_historico(historico)['tarefa']], ['saltada'])
+
+
+class FeedAlteracoesTests(TestCase):
+    """Cada escrita acrescenta uma alteração com sequência crescente; a API serve o delta à equipa"""
+
+    def setUp(self):
+        self.modulo, (self.formando,) = criar_turma(formandos=1)
+        self.aula = Aula.objects.create(modulo=self.modulo, data=timezone.localdate(), periodo='manha')
+
+    def test_escritas_e_remocoes_entram_no_feed(self):
+        inicio = ultima_sequencia()
+        registo = RegistoPresenca.objects.create(formando=self.formando, aula=self.aula, entrada=timezone.now())
+        registo.save()
+        registo.delete()
+
+        feed = alteracoes_desde(inicio)
+        self.assertEqual([a.operacao for a in feed], ['criar', 'atualizar', 'remover'])
+        self.assertTrue(all(a.aula_id == self.aula.id and a.modulo_id == self.modulo.id for a in feed))
+        self.assertEqual(ultima_sequencia([self.modulo]), feed[-1].id)
+        self.assertEqual(len(alteracoes_desde(inicio, limite=2)), 2)
+        self.assertEqual(alteracoes_desde(inicio, entidades=['aula']), [])
+
+    def test_aulas_alteradas_entre_sequencias(self):
+        outra = Aula.objects.create(modulo=self.modulo, data=timezone.localdate(), periodo='tarde')
+        inicio = ultima_sequencia()
+        RegistoPresenca.objects.create(formando=self.formando, aula=self.aula, entrada=timezone.now())
+        meio = ultima_sequencia()
+        CodigoPresenca.objects.create(aula=outra, codigo="123456")
+
+        self.assertEqual(aulas_alteradas(inicio), {self.aula.id, outra.id})
+        self.assertEqual(aulas_alteradas(inicio, ate=meio), {self.aula.id})
+        self.assertEqual(aulas_alteradas(inicio, entidades=['codigopresenca']), {outra.id})
+        self.assertEqual(aulas_alteradas(ultima_sequencia()), set())
+
+    def pedir(self, utilizador=None, **params):
+        if utilizador is not None:
+            params['token'] = criar_token_sessao(utilizador)
+        return self.client.get(reverse('alteracoes'), params)
+
+    def test_api_exige_login_da_equipa(self):
+        self.assertEqual(self.pedir().status_code, 401)
+        self.assertEqual(self.pedir(self.formando).status_code, 403)
+        self.assertEqual(self.pedir(self.modulo.formador).status_code, 200)
+
+    def test_limite_fora_do_intervalo(self):
+        RegistoPresenca.objects.create(formando=self.formando, aula=self.aula, entrada=timezone.now())
+        for limite in (0, -5):
+            with self.subTest(limite=limite):
+                dados = self.pedir(self.modulo.formador, desde=0, limite=limite).json()
+                self.assertEqual(len(dados['alteracoes']), 1)
+                self.assertGreater(dados['ultima'], 0)
+
+
+class EventosPresencaTests(TestCase):
+    """O broker SSE segue o feed em lotes e só publica para as aulas subscritas"""
+
+    def setUp(self):
+        self.modulo, (self.formando,) = criar_turma(formandos=1)
+        self.aula = Aula.objects.create(modulo=self.modulo, data=timezone.localdate(), periodo='manha')
+        # Sem a thread que segue o feed: o teste avança o broker à mão
+        self.broker = Broker(maximo_streams=1, seguir=False)
+
+    def tearDown(self):
+        self.broker.parar()
+
+    def test_sem_subscritores_a_sequencia_avanca(self):
+        broker = self.broker
+        sequencia = broker._avancar(None)
+        RegistoPresenca.objects.create(formando=self.formando, aula=self.aula, entrada=timezone.now())
+        sequencia = broker._avancar(sequencia)
+        self.assertEqual(sequencia, ultima_sequencia())
+
+        # Quem subscreve agora já não recebe o check-in anterior
+        fila = broker.subscrever(self.aula.id)
+        broker._avancar(sequencia)
+        self.assertTrue(fila.empty())
+
+    def test_publica_check_ins_da_aula_subscrita(self):
+        broker = self.broker
+        fila = broker.subscrever(self.aula.id)
+        sequencia = broker._avancar(None)
+        RegistoPresenca.objects.create(formando=self.formando, aula=self.aula, entrada=timezone.now())
+        self.assertEqual(broker._avancar(sequencia), ultima_sequencia())
+
+        evento = fila.get_nowait()
+        self.assertEqual((evento['aula'], evento['operacao'], evento['presentes']), (self.aula.id, 'criar', 1))
+        self.assertEqual(evento['formando'], self.formando.username)
+
+    def test_stream_recusado_quando_nao_ha_lugar(self):
+        while eventos.broker.reservar_stream():
+            pass
+        try:
+            token = criar_token_sessao(self.modulo.formador)
+            resposta = self.client.get(reverse('eventos_aula', args=[self.aula.id]), {'token': token})
+            conteudo = b"".join(resposta.streaming_content).decode()
+        finally:
+            for _ in range(settings.SSE_MAXIMO_STREAMS):
+                eventos.broker.libertar_stream()
+        self.assertIn("event: ocupado", conteudo)
+        self.assertEqual(eventos.broker.aulas_subscritas(), [])
+
+
+class IndicePresencasTests(TestCase):
+    """O bitmap de cada aula acompanha as escritas e responde às consultas entre aulas"""
+
+    def setUp(self):
+        self.modulo, self.formandos = criar_turma(formandos=3)
+        hoje = timezone.localdate()
+        self.aulas = [
+            Aula.objects.create(modulo=self.modulo, data=hoje - timedelta(days=3 - i), periodo='manha')
+            for i in range(3)
+        ]
+
+    def presenca(self, formando, aula):
+        return RegistoPresenca.objects.create(formando=formando, aula=aula, entrada=timezone.now())
+
+    def test_escritas_ligam_e_desligam_bits(self):
+        a, b, c = self.formandos
+        registo = self.presenca(a, self.aulas[0])
+        self.presenca(b, self.aulas[0])
+        self.presenca(b, self.aulas[1])
+        self.assertEqual(indice_presencas.contagens(self.aulas), {self.aulas[0].id: 2, self.aulas[1].id: 1})
+        curso_id = self.modulo.curso_id
+        self.assertEqual(indice_presencas.presentes_em_todas(curso_id, self.aulas[:2]), [b.id])
+        self.assertEqual(sorted(indice_presencas.presentes_em_alguma(curso_id, self.aulas)), [a.id, b.id])
+
+        registo.delete()
+        self.assertEqual(indice_presencas.contagens(self.aulas[:1]), {self.aulas[0].id: 1})
+        antes = indice_presencas.bitmaps(self.aulas)
+        indice_presencas.reconstruir()
+        self.assertEqual(indice_presencas.bitmaps(self.aulas), antes)
+
+    def test_compressao_ida_e_volta(self):
+        for bits in (0, 1, (1 << 5000) - 1, int('10' * 3000, 2)):
+            self.assertEqual(indice_presencas.descomprimir(indice_presencas.comprimir(bits)), bits)
+
+    def test_faltas_consecutivas_so_em_aulas_realizadas(self):
+        a, b, c = self.formandos
+        self.presenca(a, self.aulas[1])
+        self.presenca(b, self.aulas[2])
+        # Uma aula futura sem presenças não conta como falta
+        Aula.objects.create(modulo=self.modulo, data=timezone.localdate() + timedelta(days=1), periodo='manha')
+        self.assertEqual(sorted(indice_presencas.faltas_consecutivas(self.modulo, 2)), sorted([b.id, c.id]))
+        self.assertEqual(indice_presencas.faltas_consecutivas(self.modulo, 3), [c.id])
+
+
+class HorasAssistidasTests(TestCase):
+    """O ledger soma as horas de cada registo, igual por escrita individual ou recalculado em lote"""
+
+    def setUp(self):
+        self.modulo, self.formandos = criar_turma(formandos=3)
+        self.aulas = [
+            Aula.objects.create(modulo=self.modulo, data=timezone.localdate(), periodo=periodo)
+            for periodo in ('manha', 'tarde')
+        ]
+
+    def ledger(self):
+        return {
+            (linha.formando_id, linha.modulo_id): (round(linha.horas, 6), linha.aulas_presentes)
+            for linha in HorasAssistidas.objects.all()
+        }
+
+    def test_escritas_individuais_e_lote_coincidem(self):
+        a, b, c = self.formandos
+        entrada = timezone.now()
+        # Uma hora; sem saída conta a aula inteira; mais do que uma aula fica limitado
+        for formando, aula, saida in ((a, 0, timedelta(hours=1)), (a, 1, None), (b, 0, timedelta(hours=9))):
+            RegistoPresenca.objects.create(
+                formando=formando, aula=self.aulas[aula], entrada=entrada, saida=saida and entrada + saida
+            )
+        m = self.modulo.id
+        self.assertEqual(self.ledger(), {(a.id, m): (4.0, 2), (b.id, m): (3.0, 1)})
+
+        horas.calcular_curso(self.modulo.curso)
+        self.assertEqual(self.ledger(), {(a.id, m): (4.0, 2), (b.id, m): (3.0, 1), (c.id, m): (0.0, 0)})
+
+    def test_abaixo_do_limite(self):
+        a, b, c = self.formandos
+        for formando in (a, b):
+            for aula in self.aulas:
+                RegistoPresenca.objects.create(formando=formando, aula=aula, entrada=timezone.now())
+        horas.calcular_curso(self.modulo.curso)
+        # 6 horas em 25 do módulo: só quem não veio fica abaixo de 20%
+        ids = [linha.formando_id for linha in horas.abaixo_do_limite(self.modulo.curso, 0.2, por_modulo=True)]
+        self.assertEqual(ids, [c.id])
+        self.assertEqual(len(horas.abaixo_do_limite(self.modulo.curso, 0.9)), 3)
+
+
+class EstadoAssiduidadeTests(TestCase):
+    """O estado avança aula a aula, notifica só na passagem do limite e é refeito após correções"""
+
+    def setUp(self):
+        self.modulo, (self.formando,) = criar_turma(formandos=1)
+        hoje = timezone.localdate()
+        self.aulas = [
+            Aula.objects.create(modulo=self.modulo, data=hoje - timedelta(days=dias), periodo='manha')
+            for dias in (3, 2, 1, 0)
+        ]
+
+    def estado(self):
+        return EstadoAssiduidade.objects.get(formando=self.formando)
+
+    def test_faltas_seguidas_notificam_uma_vez(self):
+        # Três faltas até ontem: a taxa recente cai abaixo do mínimo na 2.ª e a sequência chega a 3 na 3.ª
+        self.assertEqual(alertas.processar(), (3, 4))
+        estado = self.estado()
+        self.assertEqual((estado.faltas_consecutivas, estado.aulas_processadas), (3, 3))
+        self.assertTrue(estado.alerta_faltas and estado.alerta_taxa)
+        self.assertEqual(Notificacao.objects.filter(formando=self.formando).count(), 2)
+        # Uma segunda passagem não volta a avaliar nem a notificar
+        self.assertEqual(alertas.processar(), (0, 0))
+
+    def test_presenca_repoe_a_sequencia_e_correcao_refaz_o_historico(self):
+        alertas.processar()
+        RegistoPresenca.objects.create(formando=self.formando, aula=self.aulas[3], entrada=timezone.now())
+        estado = self.estado()
+        self.assertEqual(estado.faltas_consecutivas, 0)
+        self.assertFalse(estado.alerta_faltas)
+
+        # Presença numa aula já processada: o estado volta ao início e a próxima passagem refaz tudo
+        RegistoPresenca.objects.create(formando=self.formando, aula=self.aulas[1], entrada=timezone.now())
+        self.assertIsNone(self.estado().processado_ate)
+        self.assertEqual(alertas.processar(), (3, 0))
+        estado = self.estado()
+        self.assertEqual((estado.faltas_consecutivas, estado.aulas_processadas), (1, 3))
+        self.assertFalse(estado.alerta_faltas)
+
+    def test_faltas_justificadas_nao_contam(self):
+        for aula in self.aulas[:3]:
+            marcar_falta(self.formando.id, aula, "Consulta médica")
+        self.assertEqual(alertas.processar(), (0, 0))
+        self.assertEqual(self.estado().faltas_consecutivas, 0)
+
+
+class RelatoriosTests(TestCase):
+    """Taxas do centro por período, com os inscritos contados uma vez e cache invalidada só pelo período"""
+
+    def setUp(self):
+        cache.clear()
+        self.modulo, self.formandos = criar_turma(formandos=2)
+        # Inscrito no curso e também no módulo: conta uma vez
+        Inscricao.objects.inscrever(self.formandos[:1], self.modulo.curso, self.modulo)
+        self.hoje = timezone.localdate()
+        self.antiga = Aula.objects.create(modulo=self.modulo, data=self.hoje - timedelta(days=40), periodo='manha')
+        self.recente = Aula.objects.create(modulo=self.modulo, data=self.hoje - timedelta(days=1), periodo='manha')
+
+    def presenca(self, formando, aula):
+        RegistoPresenca.objects.create(formando=formando, aula=aula, entrada=timezone.now())
+
+    def test_taxas_contam_cada_inscrito_uma_vez(self):
+        self.assertEqual(relatorios.inscritos_por_modulo()[self.modulo.id], 2)
+        self.presenca(self.formandos[0], self.recente)
+        desde, ate = relatorios.periodo_predefinido('semana')
+        (linha,) = relatorios.taxas(desde, ate)['modulos']
+        self.assertEqual((linha['inscritos'], linha['aulas'], linha['presencas'], linha['faltas']), (2, 1, 1, 1))
+        self.assertEqual(linha['taxa'], 0.5)
+
+    def test_cache_so_muda_com_alteracoes_no_periodo(self):
+        desde, ate = relatorios.periodo_predefinido('semana')
+        relatorios.taxas(desde, ate)
+        # Uma presença fora do período: só as queries da versão, o relatório vem da cache
+        self.presenca(self.formandos[0], self.antiga)
+        with self.assertNumQueries(2):
+            relatorios.taxas(desde, ate)
+
+        self.presenca(self.formandos[0], self.recente)
+        (linha,) = relatorios.taxas(desde, ate)['modulos']
+        self.assertEqual(linha['presencas'], 1)
+
+    def test_presencas_contadas_nos_registos_mesmo_sem_indice(self):
+        for formando, estado in zip(self.formandos, ('presente', 'atrasado')):
+            RegistoPresenca.objects.create(formando=formando, aula=self.recente, entrada=timezone.now(), estado=estado)
+        # Como numa base de dados com registos anteriores ao índice
+        IndicePresenca.objects.all().delete()
+        desde, ate = relatorios.periodo_predefinido('semana')
+
+        (linha,) = relatorios.taxas(desde, ate)['modulos']
+        self.assertEqual((linha['presencas'], linha['atrasos'], linha['taxa']), (2, 1, 1.0))
+        (semana,) = relatorios.tendencia_semanal(desde, ate)
+        self.assertEqual((semana['presencas'], semana['esperados']), (2, 2))
+        (celula,) = relatorios.mapa_dias_periodos(desde, ate)
+        self.assertEqual((celula['presencas'], celula['taxa']), (2, 1.0))
+
+    def test_mapa_por_dia_da_semana_e_periodo(self):
+        tarde = Aula.objects.create(modulo=self.modulo, data=self.recente.data, periodo='tarde')
+        self.presenca(self.formandos[0], self.recente)
+        self.presenca(self.formandos[0], tarde)
+        self.presenca(self.formandos[1], tarde)
+        linhas = relatorios.mapa_dias_periodos(self.recente.data, self.recente.data, modulo_id=self.modulo.id)
+        dia = self.recente.data.isoweekday()
+        self.assertEqual(
+            [(c['dia_semana'], c['periodo'], c['presencas'], c['esperados'], c['taxa']) for c in linhas],
+            [(dia, 'manha', 1, 2, 0.5), (dia, 'tarde', 2, 2, 1.0)],
+        )
+
+
+class RiscoTests(TestCase):
+    """Características calculadas em lote a partir do histórico e ranking dos formandos em risco"""
+
+    def setUp(self):
+        self.modulo, (self.assiduo, self.ausente) = criar_turma(formandos=2)
+        self.ontem = timezone.localdate() - timedelta(days=1)
+        aulas = [
+            Aula.objects.create(modulo=self.modulo, data=self.ontem - timedelta(days=dias), periodo='manha')
+            for dias in (3, 2, 1, 0)
+        ]
+        for i, aula in enumerate(aulas):
+            estado = 'atrasado' if i == 0 else 'presente'
+            RegistoPresenca.objects.create(formando=self.assiduo, aula=aula, entrada=timezone.now(), estado=estado)
+        RegistoPresenca.objects.create(formando=self.ausente, aula=aulas[0], entrada=timezone.now(), estado='presente')
+
+    def test_caracteristicas_do_historico(self):
+        tabela = risco.Historico(self.ontem).caracteristicas(self.ontem, 28)
+        assiduo, ausente = tabela.loc[self.assiduo.id], tabela.loc[self.ausente.id]
+        self.assertEqual((assiduo['taxa_total'], assiduo['faltas_seguidas']), (1.0, 0))
+        self.assertEqual(assiduo['frequencia_atrasos'], 0.25)
+        self.assertEqual((ausente['taxa_total'], ausente['faltas_seguidas']), (0.25, 3))
+        self.assertEqual(ausente['esperadas'], 4)
+
+    def test_logistica_separa_as_classes(self):
+        X = np.array([[-2.0], [-1.0], [1.0], [2.0]])
+        pesos = risco.ajustar_logistica(X, np.array([0.0, 0.0, 1.0, 1.0]))
+        probabilidades = risco.prever(pesos, X)
+        self.assertLess(probabilidades[1], 0.5)
+        self.assertGreater(probabilidades[2], 0.5)
+
+    def test_calcular_grava_o_ranking(self):
+        self.assertEqual(risco.calcular(self.ontem)['formandos'], 2)
+        ranking = list(risco.mais_em_risco(10))
+        self.assertEqual([r.formando_id for r in ranking], [self.ausente.id, self.assiduo.id])
+        self.assertEqual(ranking[0].faltas_seguidas, 3)
+
+
+def ligacoes_ficheiro(ficheiro):
+    """Ligações a um ficheiro sqlite temporário, com as opções de settings"""
+    return ConnectionHandler({
+        DEFAULT_DB_ALIAS: {**settings.DATABASES[DEFAULT_DB_ALIAS], 'NAME': ficheiro, 'TEST': {}},
+    })
+
+
+def em_thread(ligacoes, funcao, *args):
+    """Corre a função numa thread com a ligação default apontada para o ficheiro"""
+    erros = []
+
+    def correr():
+        connections[DEFAULT_DB_ALIAS] = ligacoes.create_connection(DEFAULT_DB_ALIAS)
+        try:
+            funcao(*args)
+        except Exception as erro:
+            erros.append(erro)
+        finally:
+            connections[DEFAULT_DB_ALIAS].close()
+
+    thread = threading.Thread(target=correr)
+    thread.start()
+    return thread, erros
+
+
+class CheckInsSimultaneosTests(SimpleTestCase):
+    """Check-ins ao mesmo tempo na mesma aula, em processos diferentes, não perdem escritas"""
+
+    # As threads usam as suas próprias ligações, a um ficheiro temporário com as opções de settings
+    databases = {DEFAULT_DB_ALIAS}
+
+    @override_settings(REFERENCIAS_VERSAO_FICHEIRO=_VERSAO)
+    def test_indice_roster_e_horas_ficam_completos(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            ficheiro = Path(pasta) / "db.sqlite3"
+            ligacoes = ligacoes_ficheiro(ficheiro)
+            turma = {}
+
+            def preparar():
+                call_command('migrate', verbosity=0)
+                turma['modulo'], turma['formandos'] = criar_turma(formandos=8)
+                turma['aula'] = Aula.objects.create(
+                    modulo=turma['modulo'], data=timezone.localdate(), periodo='manha'
+                )
+
+            thread, erros = em_thread(ligacoes, preparar)
+            thread.join()
+            self.assertEqual(erros, [])
+
+            partida = threading.Barrier(len(turma['formandos']))
+
+            def check_in(formando):
+                partida.wait()
+                RegistoPresenca.objects.create(formando=formando, aula=turma['aula'], entrada=timezone.now())
+
+            threads = [em_thread(ligacoes, check_in, formando) for formando in turma['formandos']]
+            for thread, _ in threads:
+                thread.join()
+            self.assertEqual([erro for _, erros in threads for erro in erros], [])
+
+            resultado = {}
+
+            def verificar():
+                modulo = turma['modulo']
+                resultado['indice'] = indice_presencas.contagens([turma['aula']])
+                resultado['presentes'] = indice_presencas.presentes_em_todas(modulo.curso_id, [turma['aula']])
+                resultado['posicoes'] = sorted(indice_presencas.roster(modulo.curso_id))
+                resultado['horas'] = HorasAssistidas.objects.filter(modulo=modulo, aulas_presentes=1).count()
+
+            thread, erros = em_thread(ligacoes, verificar)
+            thread.join()
+            self.assertEqual(erros, [])
+
+        n = len(turma['formandos'])
+        self.assertEqual(resultado['indice'], {turma['aula'].id: n})
+        self.assertEqual(sorted(resultado['presentes']), sorted(f.id for f in turma['formandos']))
+        self.assertEqual(resultado['posicoes'], list(range(n)))
+        self.assertEqual(resultado['horas'], n)
+
+
+class IndiceMigracaoTests(SimpleTestCase):
+    """A migração do índice preenche o roster e os bitmaps a partir dos registos que já existiam"""
+
+    databases = {DEFAULT_DB_ALIAS}
+
+    def test_indice_corresponde_aos_registos_existentes(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            ligacoes = ligacoes_ficheiro(Path(pasta) / "db.sqlite3")
+            resultado = {}
+
+            def preparar():
+                call_command('migrate', 'Gestao', '0007_alteracao', verbosity=0)
+                estado = MigrationLoader(connection).project_state(('Gestao', '0007_alteracao')).apps
+                modelo = {
+                    nome: estado.get_model('Gestao', nome)
+                    for nome in ('Utilizador', 'Curso', 'Modulo', 'Inscricao', 'Aula', 'RegistoPresenca')
+                }
+                formador = modelo['Utilizador'].objects.create(username="formador", tipo='Formador')
+                formandos = [
+                    modelo['Utilizador'].objects.create(username=f"formando{i}", tipo='Formando') for i in range(4)
+                ]
+                curso = modelo['Curso'].objects.create(nome="Curso", descricao="", carga_horaria_total=100)
+                modulo = modelo['Modulo'].objects.create(
+                    nome="Módulo", descricao="", carga_horaria=25, curso=curso, formador=formador
+                )
+                for formando in formandos[:3]:
+                    modelo['Inscricao'].objects.create(formando=formando, curso=curso)
+                aulas = [
+                    modelo['Aula'].objects.create(modulo=modulo, data=timezone.localdate() - timedelta(days=i),
+                                                  periodo='manha')
+                    for i in range(3)
+                ]
+                # O último formando não está inscrito mas tem uma presença; os registos sem entrada são faltas
+                for i, formando in enumerate(formandos):
+                    for aula in aulas[:i + 1]:
+                        modelo['RegistoPresenca'].objects.create(
+                            formando=formando, aula=aula, entrada=timezone.now() if i != 1 else None
+                        )
+                call_command('migrate', verbosity=0)
+
+                curso_id = Curso.objects.get().id
+                resultado['roster'] = sorted(indice_presencas.roster(curso_id).values())
+                resultado['formandos'] = sorted(Utilizador.objects.filter(tipo='Formando').values_list('id', flat=True))
+                resultado['aulas'] = {
+                    aula.id: (
+                        sorted(indice_presencas.presentes_em_alguma(curso_id, [aula])),
+                        indice_presencas.contagens([aula]).get(aula.id),
+                        sorted(RegistoPresenca.objects.filter(aula=aula, estado__in=RegistoPresenca.PRESENTES)
+                               .values_list('formando_id', flat=True)),
+                    )
+                    for aula in Aula.objects.all()
+                }
+
+            thread, erros = em_thread(ligacoes, preparar)
+            thread.join()
+            self.assertEqual(erros, [])
+
+        self.assertEqual(resultado['roster'], resultado['formandos'])
+        self.assertEqual(len(resultado['aulas']), 3)
+        for presentes, contagem, esperados in resultado['aulas'].values():
+            self.assertEqual(presentes, esperados)
+            self.assertEqual(contagem, len(esperados))
+
+
+class CodigosTests(TestCase):
+    """Códigos pré-gerados com janela de validade, substituição pelo formador e uso pelas presenças"""
+
+    def setUp(self):
+        self.modulo, (self.formando,) = criar_turma(formandos=1)
+        self.hoje = timezone.localdate()
+        self.manha = Aula.objects.create(modulo=self.modulo, data=self.hoje, periodo='manha')
+        self.tarde = Aula.objects.create(modulo=self.modulo, data=self.hoje, periodo='tarde')
+
+    def hoje_as(self, hora):
+        return timezone.make_aware(datetime.fromisoformat(f"{self.hoje} {hora}"))
+
+    def codigo(self, aula):
+        return CodigoPresenca.objects.get(aula=aula, valido=True)
+
+    def test_pre_gerados_so_valem_perto_da_aula(self):
+        self.assertEqual(codigos.pre_gerar(agora=self.hoje_as("06:30")), 2)
+        self.assertEqual(codigos.pre_gerar(agora=self.hoje_as("07:00")), 0)
+        manha, tarde = self.codigo(self.manha), self.codigo(self.tarde)
+
+        self.assertIsNone(codigos.aula_do_codigo(manha.codigo, self.hoje_as("06:30")))
+        self.assertEqual(servicos.estado_codigo(manha, self.hoje_as("06:30")), "Agendado")
+        self.assertEqual(codigos.aula_do_codigo(manha.codigo, self.hoje_as("08:50")), self.manha.id)
+        # O código da tarde não serve de manhã, só a partir de pouco antes das 14:00
+        self.assertIsNone(codigos.aula_do_codigo(tarde.codigo, self.hoje_as("09:00")))
+        self.assertEqual(codigos.aula_do_codigo(tarde.codigo, self.hoje_as("14:05")), self.tarde.id)
+        self.assertEqual(servicos.estado_codigo(manha, self.hoje_as("14:05")), "Expirado")
+        self.assertIsNone(codigos.aula_do_codigo(manha.codigo, self.hoje_as("14:05")))
+
+        # A meio do dia só se geram códigos para as aulas que ainda não passaram
+        CodigoPresenca.objects.all().delete()
+        self.assertEqual(codigos.pre_gerar(agora=self.hoje_as("12:00")), 1)
+
+    def test_gerar_novo_substitui_o_anterior_e_usos_vem_das_presencas(self):
+        primeiro = codigos.gerar_novo(self.manha.id)
+        RegistoPresenca.objects.create(formando=self.formando, aula=self.manha, entrada=timezone.now())
+        segundo = codigos.gerar_novo(self.manha.id)
+        primeiro.refresh_from_db()
+
+        self.assertEqual(servicos.estado_codigo(primeiro), "Substituído")
+        self.assertEqual(servicos.estado_codigo(segundo), "Válido")
+        self.assertIsNone(codigos.aula_do_codigo(primeiro.codigo))
+        self.assertEqual(codigos.aula_do_codigo(segundo.codigo), self.manha.id)
+        self.assertEqual(codigos.codigo_ativo(self.manha.id).codigo, segundo.codigo)
+        self.assertEqual(servicos.usos_codigos([primeiro, segundo]), {primeiro.id: 1, segundo.id: 0})
+
+        filtrados = servicos.codigos_filtrados(self.hoje, self.hoje, estado="Substituído")
+        self.assertEqual(list(filtrados), [primeiro])
+
+
+class CodigosAtivosTests(TestCase):
+    """O registo CodigoAtivo acompanha os CodigoPresenca e valida um código com uma leitura"""
+
+    def setUp(self):
+        modulo, _ = criar_turma(formandos=1)
+        self.aula = Aula.objects.create(modulo=modulo, data=timezone.localdate(), periodo='manha')
+
+    def test_signals_mantem_o_registo(self):
+        codigo = CodigoPresenca.objects.create(aula=self.aula, codigo="ABC123")
+        with self.assertNumQueries(1):
+            self.assertEqual(codigos.aula_do_codigo("ABC123"), self.aula.id)
+        codigo.expira = timezone.now() - timedelta(minutes=1)
+        codigo.save()
+        self.assertFalse(CodigoAtivo.objects.filter(pk="ABC123").exists())
+        codigo.expira = timezone.now() + timedelta(minutes=5)
+        codigo.save()
+        self.assertEqual(codigos.aula_do_codigo("ABC123"), self.aula.id)
+        codigo.delete()
+        self.assertIsNone(codigos.aula_do_codigo("ABC123"))
+
+    def test_sincronizar_e_limpar_expirados(self):
+        agora = timezone.now()
+        em_massa = CodigoPresenca.objects.bulk_create([
+            CodigoPresenca(aula=self.aula, codigo="AAA111", expira=agora + timedelta(minutes=5)),
+            CodigoPresenca(aula=self.aula, codigo="BBB222", expira=agora + timedelta(minutes=5), valido=False),
+        ])
+        # bulk_create não passa pelos signals: só sincronizar() acrescenta o código ao registo
+        self.assertFalse(CodigoAtivo.objects.exists())
+        codigos.sincronizar(em_massa, agora)
+        self.assertEqual(list(CodigoAtivo.objects.values_list('codigo', flat=True)), ["AAA111"])
+
+        self.assertEqual(codigos.limpar_expirados(agora + timedelta(minutes=10)), 1)
+        self.assertFalse(CodigoAtivo.objects.exists())
+
+
+class PaginacaoCodigosTests(TestCase):
+    """O registo de códigos é percorrido por keyset (timestamp, id) sem repetir nem saltar linhas"""
+
+    def setUp(self):
+        modulo, _ = criar_turma(formandos=1)
+        aula = Aula.objects.create(modulo=modulo, data=timezone.localdate(), periodo='manha')
+        self.ids = [CodigoPresenca.objects.create(aula=aula, codigo=f"{i:06d}").id for i in range(7)]
+        # Vários códigos com o mesmo timestamp: o id desempata
+        agora = timezone.now()
+        CodigoPresenca.objects.filter(id__in=self.ids[2:5]).update(timestamp=agora)
+        CodigoPresenca.objects.filter(id__in=self.ids[5:]).update(timestamp=agora + timedelta(seconds=1))
+
+    def percorrer(self, descendente):
+        codigos = servicos.codigos_filtrados(timezone.localdate(), timezone.localdate())
+        vistos, cursor, ha_mais = [], None, True
+        while ha_mais:
+            linhas, ha_mais = servicos.pagina_codigos(codigos, cursor, tamanho=2, descendente=descendente)
+            self.assertLessEqual(len(linhas), 2)
+            vistos += [linha['codigo'].id for linha in linhas]
+            ultimo = linhas[-1]['codigo']
+            cursor = (ultimo.timestamp, ultimo.id)
+        return vistos
+
+    def test_paginas_cobrem_todos_os_codigos_pela_ordem(self):
+        ordem = list(
+            CodigoPresenca.objects.filter(id__in=self.ids).order_by('timestamp', 'id').values_list('id', flat=True)
+        )
+        self.assertEqual(self.percorrer(descendente=False), ordem)
+        self.assertEqual(self.percorrer(descendente=True), ordem[::-1])
+
+
+@override_settings(REFERENCIAS_VERSAO_FICHEIRO=_VERSAO)
+class ReferenciasTests(TestCase):
+    """A cache só guarda os nomes da equipa e só as escritas que a afetam a invalidam"""
+
+    def setUp(self):
+        self.modulo, (self.formando,) = criar_turma(formandos=1)
+        self.formador = self.modulo.formador
+        referencias.invalidar()
+        referencias.modulos()
+
+    def test_nomes_da_equipa_em_cache_e_formandos_numa_query(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(referencias.modulo(self.modulo.id).formador.username, self.formador.username)
+            self.assertEqual(referencias.nome_utilizador(self.formador.id), self.formador.username)
+        self.assertIsNone(referencias.modulo(-1))
+        with self.assertNumQueries(1):
+            nomes = referencias.nomes_utilizadores([self.formador.id, self.formando.id, -1])
+        self.assertEqual(nomes, {self.formador.id: self.formador.username, self.formando.id: self.formando.username})
+
+    def test_so_escritas_da_equipa_invalidam(self):
+        recargas = referencias.estatisticas['recargas']
+        with self.captureOnCommitCallbacks(execute=True):
+            criar_utilizador()
+            self.formando.first_name = "Ana"
+            self.formando.save()
+        referencias.modulos()
+        self.assertEqual(referencias.estatisticas['recargas'], recargas)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.formador.first_name = "Rui"
+            self.formador.save()
+        self.assertEqual(referencias.nome_utilizador(self.formador.id), "Rui")
+        self.assertEqual(referencias.estatisticas['recargas'], recargas + 1)
+
+
+@override_settings(REFERENCIAS_VERSAO_FICHEIRO=_VERSAO)
+class OrcamentoQueriesTests(TestCase):
+    """Cada modelo de leitura de Gestao.servicos faz no máximo as queries declaradas, seja qual for o volume"""
+
+    def criar_dados(self, modulos_por_curso, formandos_por_curso, dias):
+        hoje = timezone.localdate()
+        formador = Utilizador.objects.create(username=f"formador{Utilizador.objects.count()}", tipo='Formador')
+        modulos = []
+        for c in range(2):
+            curso = Curso.objects.create(nome=f"Curso {Curso.objects.count()}", carga_horaria_total=100)
+            formandos = [
+                Utilizador.objects.create(username=f"formando{Utilizador.objects.count()}", tipo='Formando')
+                for _ in range(formandos_por_curso)
+            ]
+            Inscricao.objects.inscrever(formandos, curso)
+            for m in range(modulos_por_curso):
+                modulo = Modulo.objects.create(nome=f"Módulo {c}.{m}", curso=curso, formador=formador, carga_horaria=25)
+                modulos.append(modulo)
+                for d in range(dias):
+                    aula = Aula.objects.create(modulo=modulo, data=hoje - timedelta(days=d), periodo='manha')
+                    CodigoPresenca.objects.create(aula=aula, codigo=f"{aula.id:06d}")
+                    for formando in formandos[::2]:
+                        RegistoPresenca.objects.create(formando=formando, aula=aula, entrada=timezone.now())
+        # Os orçamentos contam com a cache de referências carregada, como num processo a correr
+        referencias.invalidar()
+        referencias.modulos()
+        return modulos, formandos
+
+    def verificar(self, funcao, *args, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            resultado = funcao(*args, **kwargs)
+        self.assertLessEqual(
+            len(queries), funcao.orcamento_queries,
+            f"{funcao.__name__}: " + "\n".join(q['sql'] for q in queries.captured_queries),
+        )
+        return resultado
+
+    def test_todas_as_leituras_declaram_orcamento(self):
+        self.assertEqual(
+            {f.__name__ for f in servicos.LEITURAS},
+            {'resumo_modulos', 'roster_aulas', 'aulas_de_hoje', 'pagina_codigos', 'usos_codigos'},
+        )
+
+    def test_orcamentos_nao_dependem_do_volume(self):
+        for modulos_por_curso, formandos_por_curso, dias in ((1, 2, 1), (3, 6, 4)):
+            with self.subTest(modulos=modulos_por_curso, formandos=formandos_por_curso, dias=dias):
+                modulos, formandos = self.criar_dados(modulos_por_curso, formandos_por_curso, dias)
+                modulo = referencias.modulo(modulos[0].id)
+
+                resumos = self.verificar(servicos.resumo_modulos, [referencias.modulo(m.id) for m in modulos])
+                self.assertEqual(resumos[modulo.id], resumo_modulo(modulo))
+
+                rosters = self.verificar(servicos.roster_aulas, modulo, Aula.objects.filter(modulo=modulo))
+                self.assertEqual(len(rosters), dias)
+                self.assertTrue(all(len(linhas) == formandos_por_curso for linhas in rosters.values()))
+
+                aulas = self.verificar(servicos.aulas_de_hoje, formandos[0])
+                self.assertEqual(len(aulas), modulos_por_curso)
+                self.assertTrue(all(registo is not None for _, registo in aulas))
+                with self.assertNumQueries(0):
+                    [(aula.modulo.curso.nome, aula.modulo.formador.username) for aula, _ in aulas]
+
+                codigos = servicos.codigos_filtrados(timezone.localdate() - timedelta(days=dias), timezone.localdate())
+                linhas, ha_mais = self.verificar(servicos.pagina_codigos, codigos, tamanho=3)
+                self.assertEqual(len(linhas), min(3, codigos.count()))
+                self.assertEqual(ha_mais, codigos.count() > 3)
+
+                # Cada aula tem um código, gerado antes das presenças: todas contam como uso
+                usos = self.verificar(servicos.usos_codigos, list(codigos))
+                self.assertEqual(sum(usos.values()), RegistoPresenca.objects.count())
+                with self.assertNumQueries(0):
+                    [linha['codigo'].aula.periodo for linha in linhas]
+
+    def test_leituras_sem_dados_nao_fazem_queries_desnecessarias(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(servicos.resumo_modulos([]), {})
+        formando = Utilizador.objects.create(username="sem_inscricoes", tipo='Formando')
+        with self.assertNumQueries(1):
+            self.assertEqual(servicos.aulas_de_hoje(formando), [])
+
+
+class LeituraPaineisTests(SimpleTestCase):
+    """As leituras dos painéis vão para a ligação só de leitura e não atrasam as escritas"""
+
+    # O teste de latência abre as suas próprias ligações, a um ficheiro temporário
+    databases = {DEFAULT_DB_ALIAS, LEITURA}
+
+    def test_so_as_leituras_dentro_de_painel_mudam_de_ligacao(self):
+        self.assertEqual(Aula.objects.all().db, DEFAULT_DB_ALIAS)
+        with painel():
+            self.assertEqual(Aula.objects.all().db, LEITURA)
+            aula = Aula(id=1)
+            aula._state.db = LEITURA
+            self.assertEqual(RouterLeitura().db_for_write(Aula, instance=aula), DEFAULT_DB_ALIAS)
+        self.assertEqual(Aula.objects.all().db, DEFAULT_DB_ALIAS)
+
+    def ligacoes(self, pasta):
+        """As ligações configuradas em settings, apontadas para um ficheiro temporário"""
+        ficheiro = Path(pasta) / "db.sqlite3"
+        configuracao = {
+            DEFAULT_DB_ALIAS: {**settings.DATABASES[DEFAULT_DB_ALIAS], 'NAME': ficheiro, 'TEST': {}},
+            LEITURA: {**settings.DATABASES[LEITURA], 'NAME': ficheiro.as_uri() + "?mode=ro", 'TEST': {}},
+        }
+        return ConnectionHandler(configuracao)
+
+    def test_check_in_nao_espera_pela_agregacao_de_um_painel(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            ligacoes = self.ligacoes(pasta)
+            escrita = ligacoes[DEFAULT_DB_ALIAS]
+            self.assertEqual(ativar_wal(escrita), "wal")
+            with escrita.cursor() as cursor:
+                cursor.execute("CREATE TABLE presenca (id INTEGER PRIMARY KEY, aula INTEGER)")
+                cursor.executemany("INSERT INTO presenca (aula) VALUES (%s)", [(i * 7919 % 100003,) for i in range(40000)])
+
+            def check_in():
+                inicio = time.perf_counter()
+                with escrita.cursor() as cursor:
+                    cursor.execute("INSERT INTO presenca (aula) VALUES (%s)", [1])
+                return time.perf_counter() - inicio
+
+            em_repouso = [check_in() for _ in range(20)]
+
+            duracao = {}
+            a_correr = threading.Event()
+
+            def agregacao():
+                leitura = ligacoes[LEITURA]
+                try:
+                    with leitura.cursor() as cursor:
+                        with self.assertRaises(OperationalError):
+                            cursor.execute("INSERT INTO presenca (aula) VALUES (%s)", [1])
+                        a_correr.set()
+                        inicio = time.perf_counter()
+                        cursor.execute(
+                            "SELECT COUNT(*) FROM presenca a, presenca b WHERE b.id < 400 AND a.aula < b.aula"
+                        )
+                        cursor.fetchone()
+                        duracao['segundos'] = time.perf_counter() - inicio
+                finally:
+                    leitura.close()
+
+            painel_thread = threading.Thread(target=agregacao)
+            painel_thread.start()
+            a_correr.wait()
+            durante = []
+            while painel_thread.is_alive():
+                durante.append(check_in())
+                time.sleep(0.01)
+            painel_thread.join()
+            escrita.close()
+
+        self.assertGreaterEqual(len(durante), 10, "a agregação terminou antes de medir os check-ins")
+        # Sem WAL cada check-in esperaria pelo fim da agregação (segundos); com WAL fica ao nível do repouso
+        self.assertLess(max(durante), duracao['segundos'] / 4)
+        self.assertLess(statistics.median(durante), max(0.05, statistics.median(em_repouso) * 20))
+
+
+class LigacoesStreamlitTests(SimpleTestCase):
+    """Cada execução do script corre numa thread nova mas reaproveita as ligações da anterior"""
+
+    databases = {DEFAULT_DB_ALIAS}
+
+    def tearDown(self):
+        ligacoes.esvaziar()
+
+    def executar(self, fragment=False):
+        """Corre uma "execução do script" numa thread nova; devolve a ligação sqlite3 que usou"""
+        usadas = []
+
+        def query():
+            with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+                cursor.execute("SELECT 1")
+            usadas.append(connections[DEFAULT_DB_ALIAS].connection)
+
+        def script():
+            with ligacoes.execucao():
+                query()
+                if fragment:
+                    # Um fragment dentro da execução completa não devolve as ligações a meio
+                    ligacoes.execucao()(query)()
+                    query()
+
+        thread = threading.Thread(target=script)
+        thread.start()
+        thread.join()
+        self.assertEqual(len(set(map(id, usadas))), 1)
+        return usadas[0]
+
+    def test_execucoes_seguidas_reaproveitam_a_ligacao(self):
+        antes = dict(ligacoes.estatisticas)
+        primeira = self.executar()
+        self.assertEqual(ligacoes.estado()['no_pool'], 1)
+        self.assertIs(self.executar(fragment=True), primeira)
+        self.assertIs(self.executar(), primeira)
+        self.assertEqual(ligacoes.estatisticas['criadas'] - antes['criadas'], 1)
+        self.assertEqual(ligacoes.estatisticas['reutilizadas'] - antes['reutilizadas'], 2)
+        self.assertEqual(ligacoes.estado()['no_pool'], 1)
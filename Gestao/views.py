@@ -1,3 +1,130 @@
-from django.shortcuts import render
+import json
+import queue
+import time
 
-# Create your views here.
+from django.conf import settings
+from django.db import connection
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from .alteracoes import LIMITE_PADRAO, alteracoes_desde
+from .autenticacao import utilizador_do_token
+from .eventos import broker
+from .models import Aula, RegistoPresenca
+
+SSE_KEEPALIVE = 15  # segundos entre comentários de keepalive
+SSE_RETRY_OCUPADO = 30  # segundos até o browser tentar outra vez quando não há lugar para o stream
+SSE_RETRY_NORMAL_MS = 1000
+
+
+def saude(request):
+    """Health check usado pelo launcher: responde 200 se a base de dados estiver acessível"""
+    try:
+        connection.ensure_connection()
+    except Exception as e:
+        return JsonResponse({"estado": "erro", "detalhe": str(e)}, status=503)
+    return JsonResponse({"estado": "ok"})
+
+
+def _inteiro(request, nome, padrao=None):
+    valor = request.GET.get(nome)
+    return int(valor) if valor not in (None, "") else padrao
+
+
+def _utilizador(request):
+    """Utilizador da sessão Django ou do token assinado dos frontends (?token=)"""
+    if request.user.is_authenticated:
+        return request.user
+    return utilizador_do_token(request.GET.get("token", ""))
+
+
+@require_GET
+def alteracoes(request):
+    """Alterações desde ?desde=N (opcionalmente filtradas por modulo, aula e entidade)"""
+    user = _utilizador(request)
+    if user is None:
+        return JsonResponse({"erro": "Autenticação necessária"}, status=401)
+    # O feed cobre todos os módulos: só para a equipa, não para formandos
+    if not (user.is_staff or user.tipo in ("Formador", "Coordenador")):
+        return JsonResponse({"erro": "Acesso não autorizado"}, status=403)
+    try:
+        desde = _inteiro(request, "desde", 0)
+        # Pelo menos 1: com limite 0 a resposta diria sempre "mais" e o cliente nunca avançava
+        limite = max(1, min(_inteiro(request, "limite", LIMITE_PADRAO), LIMITE_PADRAO))
+        modulo_id = _inteiro(request, "modulo")
+        aula_id = _inteiro(request, "aula")
+    except ValueError:
+        return JsonResponse({"erro": "Parâmetros numéricos inválidos"}, status=400)
+
+    lista = alteracoes_desde(
+        desde,
+        limite=limite,
+        entidades=request.GET.getlist("entidade"),
+        modulo_id=modulo_id,
+        aula_id=aula_id,
+    )
+    return JsonResponse({
+        "desde": desde,
+        "ultima": lista[-1].id if lista else desde,
+        "mais": len(lista) == limite,
+        "alteracoes": [
+            {
+                "seq": a.id,
+                "entidade": a.entidade,
+                "id": a.objeto_id,
+                "operacao": a.operacao,
+                "aula": a.aula_id,
+                "modulo": a.modulo_id,
+                "timestamp": a.timestamp.isoformat(),
+            }
+            for a in lista
+        ],
+    })
+
+
+def _evento_sse(evento, nome="presenca"):
+    cabecalho = f"id: {evento['seq']}\n" if "seq" in evento else ""
+    return f"{cabecalho}event: {nome}\ndata: {json.dumps(evento)}\n\n"
+
+
+@require_GET
+def eventos_aula(request, aula_id):
+    """Stream SSE com os check-ins de uma aula, à medida que são gravados"""
+    user = utilizador_do_token(request.GET.get("token", ""))
+    aula = Aula.objects.select_related("modulo").filter(id=aula_id).first()
+    if aula is None:
+        return JsonResponse({"erro": "Aula não encontrada"}, status=404)
+    if user is None or aula.modulo.formador_id != user.id:
+        return JsonResponse({"erro": "Acesso não autorizado"}, status=403)
+
+    presentes = RegistoPresenca.objects.filter(aula=aula, estado__in=RegistoPresenca.PRESENTES).count()
+
+    def stream():
+        # O stream só lê da fila: liberta já a ligação à base de dados deste pedido
+        connection.close()
+        if not broker.reservar_stream():
+            # Sem lugar: o browser volta a tentar mais tarde em vez de ocupar uma thread à espera
+            yield f"retry: {SSE_RETRY_OCUPADO * 1000}\nevent: ocupado\ndata: {{}}\n\n"
+            return
+        fila = broker.subscrever(aula.id)
+        try:
+            # Ao fim de SSE_DURACAO_MAXIMA o browser volta a ligar-se daqui a 1 s
+            yield f"retry: {SSE_RETRY_NORMAL_MS}\n\n"
+            # Estado inicial, para o widget não ficar vazio até ao primeiro check-in
+            yield _evento_sse({"aula": aula.id, "presentes": presentes}, nome="estado")
+            fim = time.monotonic() + settings.SSE_DURACAO_MAXIMA
+            while time.monotonic() < fim:
+                try:
+                    yield _evento_sse(fila.get(timeout=SSE_KEEPALIVE))
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            broker.cancelar(aula.id, fila)
+            broker.libertar_stream()
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    # O widget é servido pelo Streamlit, noutra origem
+    response["Access-Control-Allow-Origin"] = "*"
+    return response
@@ -0,0 +1,34 @@
+"""
+Arranque do Django para os scripts Streamlit.
+
+O Streamlit volta a executar o script inteiro em cada interação, mas os
+módulos importados ficam em sys.modules. Este módulo guarda o estado do
+arranque ao nível do processo, por isso só o primeiro run paga o
+django.setup(); os seguintes fazem apenas uma verificação.
+"""
+import os
+import threading
+import time
+
+_lock = threading.Lock()
+
+# Estatísticas do arranque deste processo (lidas pelo comando relatorio_arranque)
+estatisticas = {
+    "setup_segundos": None,
+    "chamadas": 0,
+}
+
+
+def setup_django(settings_module="Projecto_Final.settings"):
+    """Configura o Django uma única vez por processo; chamadas seguintes são gratuitas"""
+    estatisticas["chamadas"] += 1
+    if estatisticas["setup_segundos"] is not None:
+        return
+    with _lock:
+        if estatisticas["setup_segundos"] is not None:
+            return
+        inicio = time.perf_counter()
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
+        import django
+        django.setup()
+        estatisticas["setup_segundos"] = time.perf_counter() - inicio
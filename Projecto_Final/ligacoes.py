@@ -0,0 +1,132 @@
+"""
+Ligações à base de dados nos scripts Streamlit.
+
+O Django guarda uma ligação por thread e só a fecha no fim de um pedido
+HTTP. O Streamlit corre cada execução do script (e cada rerun de um
+fragment) numa thread nova, por isso cada interação abria ligações novas,
+pagava o connect e os PRAGMAs de novo e deixava as anteriores abertas até o
+GC as apanhar.
+
+Aqui as ligações de uma execução terminada ficam num pool do processo e a
+execução seguinte, noutra thread, recebe-as em vez de abrir outras. Só uma
+execução usa cada conjunto de ligações de cada vez. No fim da execução as
+ligações mais velhas do que CONN_MAX_AGE, com erros ou com o autocommit
+alterado são fechadas em vez de voltarem ao pool; com CONN_HEALTH_CHECKS o
+Django testa as reaproveitadas antes da primeira query.
+
+    with execucao():
+        main()
+"""
+import atexit
+import threading
+import weakref
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+_lock = threading.Lock()
+_livres = []  # [{alias: DatabaseWrapper}] devolvidos por execuções terminadas
+_local = threading.local()
+_todas = weakref.WeakSet()  # wrappers que já abriram uma ligação neste processo
+
+# Contadores deste processo (mostrados no monitor)
+estatisticas = {
+    "execucoes": 0,
+    "criadas": 0,
+    "reutilizadas": 0,
+    "fechadas": 0,
+}
+
+
+def _contar(nome, n=1):
+    with _lock:
+        estatisticas[nome] += n
+
+
+def _registar(sender, connection, **kwargs):
+    _todas.add(connection)
+    _contar("criadas")
+
+
+connection_created.connect(_registar, dispatch_uid="ligacoes_streamlit")
+
+
+def _fechar(ligacao):
+    ligacao.close()
+    _contar("fechadas")
+
+
+def _emprestar():
+    with _lock:
+        estatisticas["execucoes"] += 1
+        emprestadas = _livres.pop() if _livres else {}
+    ja_abertas = {ligacao.alias for ligacao in connections.all(initialized_only=True)}
+    for alias, ligacao in emprestadas.items():
+        if alias in ja_abertas:
+            _fechar(ligacao)
+        else:
+            connections[alias] = ligacao
+            _contar("reutilizadas")
+
+
+def _devolver():
+    devolvidas = {}
+    for ligacao in connections.all(initialized_only=True):
+        del connections[ligacao.alias]
+        if ligacao.connection is None:
+            continue
+        # Fecha as que passaram CONN_MAX_AGE, tiveram erros ou ficaram a meio de uma transação
+        ligacao.close_if_unusable_or_obsolete()
+        if ligacao.connection is None:
+            _contar("fechadas")
+            continue
+        # O pool garante que só uma thread a usa de cada vez
+        if not ligacao.allow_thread_sharing:
+            ligacao.inc_thread_sharing()
+        devolvidas[ligacao.alias] = ligacao
+    if not devolvidas:
+        return
+    with _lock:
+        if len(_livres) < settings.STREAMLIT_LIGACOES_LIVRES:
+            _livres.append(devolvidas)
+            return
+    # Pool cheio (pico de sessões que já passou): estas fecham-se
+    for ligacao in devolvidas.values():
+        _fechar(ligacao)
+
+
+@contextmanager
+def execucao():
+    """Empresta ligações do pool à execução do script e devolve-as no fim (também serve de decorator)"""
+    profundidade = getattr(_local, "profundidade", 0)
+    _local.profundidade = profundidade + 1
+    # Um fragment corrido dentro da execução completa usa as ligações que ela já tem
+    if profundidade == 0:
+        _emprestar()
+    try:
+        yield
+    finally:
+        _local.profundidade = profundidade
+        if profundidade == 0:
+            _devolver()
+
+
+@atexit.register
+def esvaziar():
+    """Fecha as ligações paradas no pool"""
+    with _lock:
+        conjuntos = _livres[:]
+        _livres.clear()
+    for conjunto in conjuntos:
+        for ligacao in conjunto.values():
+            _fechar(ligacao)
+
+
+def estado():
+    """Ligações abertas neste processo: total, paradas no pool e em uso por execuções a correr"""
+    abertas = sum(1 for ligacao in list(_todas) if ligacao.connection is not None)
+    with _lock:
+        no_pool = sum(len(conjunto) for conjunto in _livres)
+    return {"abertas": abertas, "no_pool": no_pool, "em_uso": abertas - no_pool, **estatisticas}
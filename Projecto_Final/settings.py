@@ -79,8 +79,73 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
-    }
+        # O ficheiro passa a WAL (as leituras dos painéis não bloqueiam os check-ins nem esperam por eles)
+        # com `manage.py ativar_wal`, que o launch.py corre ao arrancar; o modo fica guardado no ficheiro,
+        # por isso não vai no init_command, que o reescreveria em cada manage.py (db.sqlite3 está no git)
+        # IMMEDIATE: cada transação pede o lock de escrita no BEGIN, por isso as que leem e depois
+        # escrevem (índice, ledger e alertas de um check-in) não se sobrepõem entre processos
+        "OPTIONS": {
+            "init_command": "PRAGMA synchronous=NORMAL",
+            "transaction_mode": "IMMEDIATE",
+        },
+        # Ligações persistentes, testadas antes de serem reaproveitadas (Projecto_Final/ligacoes.py)
+        "CONN_MAX_AGE": 300,
+        "CONN_HEALTH_CHECKS": True,
+    },
+    # O mesmo ficheiro, só de leitura, para as agregações dos painéis (Gestao.leitura.painel)
+    "leitura": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": (BASE_DIR / "db.sqlite3").as_uri() + "?mode=ro",
+        "OPTIONS": {"init_command": "PRAGMA query_only=ON"},
+        "CONN_MAX_AGE": 300,
+        "CONN_HEALTH_CHECKS": True,
+        "TEST": {"MIRROR": "default"},
+    },
 }
+DATABASE_ROUTERS = ["Gestao.leitura.RouterLeitura"]
+
+
+# Streamlit sessions
+# Validade (em segundos) do token assinado que retoma a sessão sem voltar a pedir a palavra-passe
+SESSAO_STREAMLIT_DURACAO = 12 * 60 * 60
+
+# Conjuntos de ligações à base de dados guardados entre execuções dos scripts (por processo)
+STREAMLIT_LIGACOES_LIVRES = 8
+
+# Streams SSE de check-ins por processo Django (cada um ocupa uma das 4 threads de um worker gunicorn)
+# e duração máxima de cada um antes de o browser se voltar a ligar
+SSE_MAXIMO_STREAMS = 2
+SSE_DURACAO_MAXIMA = 5 * 60
+
+# Número de threads que calculam hashes de palavras-passe em paralelo (None = um por core)
+LOGIN_HASH_WORKERS = None
+
+# Ficheiro cujo mtime é a versão da cache de dados de referência (partilhado por todos os processos)
+REFERENCIAS_VERSAO_FICHEIRO = BASE_DIR / ".referencias_versao"
+
+
+# Assiduidade
+# Duração de uma aula (um período) em horas; limita as horas contadas por registo
+DURACAO_AULA_HORAS = 3
+
+# Hora de início de cada período e minutos de tolerância; uma entrada depois disso conta como atraso
+HORARIO_PERIODOS = {'manha': '09:00', 'tarde': '14:00'}
+TOLERANCIA_ATRASO_MINUTOS = 10
+# Validade de um código de presença (os pré-gerados contam a partir do início da aula)
+CODIGO_VALIDADE_MINUTOS = 30
+# Os pré-gerados só são aceites a partir destes minutos antes do início da aula
+CODIGO_ANTECEDENCIA_MINUTOS = 15
+
+# Fração mínima da carga horária que cada formando tem de assistir
+LIMITE_ASSIDUIDADE = 0.9
+
+# Alertas: faltas seguidas e taxa recente (média móvel sobre ~ALERTA_JANELA_AULAS aulas) que geram notificações
+ALERTA_FALTAS_CONSECUTIVAS = 3
+ALERTA_TAXA_MINIMA = 0.8
+ALERTA_JANELA_AULAS = 10
+
+# Risco de assiduidade: janela (em dias) da taxa recente e horizonte da previsão
+RISCO_JANELA_DIAS = 28
 
 
 # Password validation
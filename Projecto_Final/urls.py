@@ -18,6 +18,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 
+from Gestao import views
+
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("saude/", views.saude, name="saude"),
+    path("api/alteracoes/", views.alteracoes, name="alteracoes"),
+    path("api/aulas/<int:aula_id>/eventos/", views.eventos_aula, name="eventos_aula"),
 ]
@@ -1,31 +1,52 @@
 import os
 import sys
-import django
+import json
 import streamlit as st
+import streamlit.components.v1 as components
 from datetime import datetime, timedelta
-import pandas as pd
-import io
 import time
-import secrets
-from streamlit.runtime.scriptrunner import RerunData, RerunException
-from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
 
 
-# Configure Django
-sys.path.append(os.path.abspath(".."))
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Projecto_Final.settings")
-django.setup()
+# Configure Django once per process (Streamlit re-runs this script on every interaction)
+PROJECT_ROOT = os.path.abspath("..")
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
 
+from Projecto_Final.bootstrap import setup_django
+setup_django()
+
+from Projecto_Final import ligacoes
+
+from django.conf import settings
 from django.utils import timezone
-from Gestao.models import Modulo, Aula, RegistoPresenca, CodigoPresenca
-from auth.login import login_user
+from Gestao.models import Aula, RegistoPresenca, Inscricao
+from Gestao.assiduidade import presencas_por_aula, marcar_falta
+from Gestao.alteracoes import ultima_sequencia
+from Gestao import codigos, referencias, relatorios, servicos
+from Gestao.leitura import painel
+from Gestao.autenticacao import criar_token_sessao
+from auth.login import login_user, retomar_sessao, terminar_sessao
 
 # Constants
-CODE_VALIDITY_MINUTES = 30
+OVERVIEW_REFRESH_SECONDS = 60
+
+# Coordinator page periods (Gestao.relatorios.periodo_predefinido) and their labels
+COORDINATOR_PERIODS = {
+    'semana': "Últimos 7 dias",
+    'mes': "Últimos 30 dias",
+    'trimestre': "Últimos 3 meses",
+    'ano': "Último ano",
+}
+
+# Heatmap axis labels (Aula.dia_semana is ISO: 1 = Monday)
+WEEKDAY_LABELS = {1: "Segunda", 2: "Terça", 3: "Quarta", 4: "Quinta", 5: "Sexta", 6: "Sábado", 7: "Domingo"}
+PERIOD_LABELS = {'manha': "Manhã", 'tarde': "Tarde"}
+
+# Attendance editor labels for RegistoPresenca.estado (both absence states show as "Falta")
+EDITOR_STATUS = {'presente': "Presente", 'atrasado': "Atrasado"}
 
-# Global dictionary to store active codes
-ACTIVE_CODES = {}
+# Django server that streams live check-ins (server-sent events) to the browser
+DJANGO_PUBLIC_URL = os.environ.get("DJANGO_PUBLIC_URL", "http://localhost:8000")
 
 # LOGO
 st.logo(
@@ -46,60 +67,143 @@ st.set_page_config(
 # Code Generation
 # --------------------------
 def generate_attendance_code(aula_id):
-    """Generate a unique attendance code"""
-    # Generate a 6-character code (letters and numbers)
-    code = secrets.token_hex(3).upper()  # 6 characters
-    
-    # Create code in database
+    """Replace the class's active code with a new one (the only place the teacher page writes codes)"""
     try:
-        aula = Aula.objects.get(id=aula_id)
-        codigo = CodigoPresenca.objects.create(
-            aula=aula,
-            codigo=code
-        )
-        return code, codigo.timestamp
+        return codigos.gerar_novo(aula_id)
     except Exception as e:
         st.error(f"Erro ao gerar código: {str(e)}")
-        return None, None
+        return None
 
 def is_code_valid(code):
-    """Check if code is still valid (within 30 minutes)"""
-    try:
-        codigo = CodigoPresenca.objects.get(codigo=code, valido=True)
-        return codigo.is_valid()
-    except CodigoPresenca.DoesNotExist:
-        return False
+    """Check if code is still valid (not replaced and before its expiry)"""
+    return codigos.aula_do_codigo(code) is not None
 
 def get_aula_id_from_code(code):
     """Get aula_id from a valid code"""
-    try:
-        codigo = CodigoPresenca.objects.get(codigo=code, valido=True)
-        if codigo.is_valid():
-            return codigo.aula.id
-    except CodigoPresenca.DoesNotExist:
-        pass
-    return None
-
-def invalidate_code(code):
-    """Mark a code as invalid"""
-    try:
-        codigo = CodigoPresenca.objects.get(codigo=code)
-        codigo.valido = False
-        codigo.save()
-    except CodigoPresenca.DoesNotExist:
-        pass
+    return codigos.aula_do_codigo(code)
+
+# --------------------------
+# Live Fragments
+# --------------------------
+# Each fragment re-runs on its own schedule without re-running the rest of the page
+# (in a new thread, so it borrows pooled connections itself when it runs on its own)
+@st.fragment(run_every=OVERVIEW_REFRESH_SECONDS)
+@ligacoes.execucao()
+def painel_resumo_modulos(modulos):
+    """Summary cards for each module, recomputed only when the change feed moved"""
+    import pandas as pd
+    
+    chave = (tuple(m.id for m in modulos), timezone.now().date(), ultima_sequencia(modulos))
+    cache = st.session_state.get('resumo_cache')
+    if cache is None or cache[0] != chave:
+        cache = (chave, servicos.resumo_modulos(modulos))
+        st.session_state.resumo_cache = cache
+    resumos = cache[1]
+    
+    st.caption(f"🔄 Atualizado às {datetime.now().strftime('%H:%M:%S')}")
+    for modulo in modulos:
+        with st.expander(f"📌 {modulo.nome}", expanded=True):
+            col1, col2, col3, col4 = st.columns(4)
+            
+            # Metrics (absences are enrolled minus present)
+            resumo = resumos[modulo.id]
+            presencas = resumo['presencas']
+            faltas = resumo['faltas']
+            atrasos = resumo['atrasos']
+            
+            # Display metrics
+            with col1:
+                st.metric("Total de Aulas", resumo['total_aulas'])
+            with col2:
+                st.metric("Presenças", presencas)
+            with col3:
+                st.metric("Faltas", faltas)
+            with col4:
+                st.metric("Atrasos", atrasos)
+            
+            # Mini chart
+            if presencas or faltas:
+                chart_data = pd.DataFrame({
+                    "Tipo": ["Presenças", "Faltas", "Atrasos"],
+                    "Quantidade": [presencas, faltas, atrasos]
+                })
+                st.bar_chart(chart_data, x="Tipo", y="Quantidade", use_container_width=True)
+            else:
+                st.info("Ainda não há registos de presenças para este módulo")
+
+@st.fragment(run_every=1)
+def mostrar_tempo_codigo(expira, valido_desde=None):
+    """Countdown for the code on display; no database access"""
+    time_remaining = max(0, (expira - timezone.now()).total_seconds())
+    
+    # The bar spans the code's own window (pre-generated codes) or the configured validity (replacements)
+    if valido_desde is not None:
+        validity = (expira - valido_desde).total_seconds()
+    else:
+        validity = settings.CODIGO_VALIDADE_MINUTOS * 60
+    st.progress(min(1.0, time_remaining / validity) if validity > 0 else 0.0)
+    st.caption(f"Tempo restante: {int(time_remaining / 60)} minutos e {int(time_remaining % 60)} segundos")
+
+def contador_presencas_aula(aula_id, inscritos, token):
+    """Live check-in counter pushed by the Django SSE endpoint (no polling from Streamlit)"""
+    url = f"{DJANGO_PUBLIC_URL}/api/aulas/{aula_id}/eventos/?token={token}"
+    components.html(f"""
+    <div style="font-family: sans-serif;">
+        <div style="font-size: 0.9rem; color: #555;">Presenças registadas</div>
+        <div id="contador" style="font-size: 2rem; font-weight: 600;">-/{inscritos}</div>
+        <div id="ultimos" style="font-size: 0.85rem; color: #333;"></div>
+    </div>
+    <script>
+        const contador = document.getElementById("contador");
+        const ultimos = document.getElementById("ultimos");
+        const fonte = new EventSource({json.dumps(url)});
+        const mostrar = (dados) => contador.textContent = dados.presentes + "/{inscritos}";
+        fonte.addEventListener("estado", (e) => mostrar(JSON.parse(e.data)));
+        fonte.addEventListener("ocupado", () => ultimos.textContent = "Servidor ocupado, a tentar de novo...");
+        fonte.addEventListener("presenca", (e) => {{
+            const dados = JSON.parse(e.data);
+            mostrar(dados);
+            if (dados.formando && dados.operacao === "criar") {{
+                const linha = document.createElement("div");
+                linha.textContent = "✅ " + dados.formando;
+                ultimos.prepend(linha);
+                while (ultimos.childElementCount > 5) ultimos.lastChild.remove();
+            }}
+        }});
+    </script>
+    """, height=190)
+
+def mapa_calor_assiduidade(linhas):
+    """Weekday x period heatmap of attendance rates (rows from relatorios.mapa_dias_periodos)"""
+    import altair as alt
+    import pandas as pd
+    
+    if not linhas:
+        st.info("Não há aulas realizadas para estes filtros")
+        return
+    df = pd.DataFrame(linhas)
+    df["Dia"] = df["dia_semana"].map(WEEKDAY_LABELS)
+    df["Período"] = df["periodo"].map(PERIOD_LABELS)
+    df["Taxa (%)"] = (df["taxa"] * 100).round(1)
+    chart = alt.Chart(df).mark_rect().encode(
+        x=alt.X("Dia:N", sort=[WEEKDAY_LABELS[d] for d in sorted(WEEKDAY_LABELS)]),
+        y=alt.Y("Período:N", sort=list(PERIOD_LABELS.values())),
+        # Fixed 0-100 scale so colours compare across filters; the worst slots show in red
+        color=alt.Color("Taxa (%):Q", scale=alt.Scale(scheme="redyellowgreen", domain=[0, 100])),
+        tooltip=["Dia", "Período", "Taxa (%)", "aulas", "presencas", "esperados"],
+    )
+    text = chart.mark_text(baseline="middle").encode(text="Taxa (%):Q", color=alt.value("black"))
+    st.altair_chart(chart + text, use_container_width=True)
 
 # --------------------------
 # Teacher Interface
 # --------------------------
 def mostrar_interface_formador(user):
-    # Initialize last refresh time if not exists
-    if 'last_refresh_time' not in st.session_state:
-        st.session_state.last_refresh_time = datetime.now().strftime('%H:%M:%S')
-        st.session_state.last_refresh_timestamp = time.time()
+    # pandas is only needed by the teacher dashboards; login and student pages never import it
+    import pandas as pd
     
     # Date range selector
-    col1, col2, col3 = st.columns([1, 1, 2])
+    col1, col2, _ = st.columns([1, 1, 2])
     with col1:
         start_date = st.date_input("Data inicial", 
                                  value=timezone.now().date() - timedelta(days=7),
@@ -108,19 +212,12 @@ def mostrar_interface_formador(user):
         end_date = st.date_input("Data final", 
                                 value=timezone.now().date(),
                                 key="end_date")
-    
-    # Display refresh info in col3
-    with col3:
-        time_remaining = 120 - (time.time() - st.session_state.last_refresh_timestamp)
-        if time_remaining > 0:
-            st.caption(f"🔄 Próxima atualização em: {int(time_remaining)}s (Última: {st.session_state.last_refresh_time})")
-        else:
-            st.caption(f"⏳ Atualizando agora... (Última: {st.session_state.last_refresh_time})")
 
-    modulos = Modulo.objects.filter(formador=user)
+    # The teacher's modules come from the process-wide reference cache (no query per rerun)
+    modulos = referencias.modulos_do_formador(user.id)
     
     # Check if teacher has any modules assigned
-    if not modulos.exists():
+    if not modulos:
         st.warning("Não tem nenhum módulo atribuído a si.")
         st.info("Por favor, contacte a administração para lhe atribuírem módulos.")
         return
@@ -131,41 +228,8 @@ def mostrar_interface_formador(user):
     with tab1:
         st.subheader("Resumo dos Módulos")
         
-        # Summary cards for each module
-        for modulo in modulos:
-            with st.expander(f"📌 {modulo.nome}", expanded=True):
-                col1, col2, col3, col4 = st.columns(4)
-                
-                # Calculate metrics
-                aulas = Aula.objects.filter(modulo=modulo)
-                total_aulas = aulas.count()
-                
-                registos = RegistoPresenca.objects.filter(aula__in=aulas)
-                total_registos = registos.count()
-                
-                presencas = registos.filter(entrada__isnull=False).count()
-                faltas = registos.filter(entrada__isnull=True).count()
-                atrasos = registos.exclude(motivo_atraso__exact='').count()
-                
-                # Display metrics
-                with col1:
-                    st.metric("Total de Aulas", total_aulas)
-                with col2:
-                    st.metric("Presenças", presencas)
-                with col3:
-                    st.metric("Faltas", faltas)
-                with col4:
-                    st.metric("Atrasos", atrasos)
-                
-                # Mini chart
-                if total_registos > 0:
-                    chart_data = pd.DataFrame({
-                        "Tipo": ["Presenças", "Faltas", "Atrasos"],
-                        "Quantidade": [presencas, faltas, atrasos]
-                    })
-                    st.bar_chart(chart_data, x="Tipo", y="Quantidade", use_container_width=True)
-                else:
-                    st.info("Ainda não há registos de presenças para este módulo")
+        # Summary cards for each module (live fragment)
+        painel_resumo_modulos(modulos)
 
     with tab2:
         st.subheader("Gestão de Presenças")
@@ -173,139 +237,151 @@ def mostrar_interface_formador(user):
         # Module selector
         modulo_selecionado = st.selectbox(
             "Selecione o módulo",
-            options=[m.nome for m in modulos],
+            options=[m.id for m in modulos],
+            format_func=lambda i: referencias.modulo(i).nome,
             key="modulo_select"
         )
         
-        try:
-            modulo = Modulo.objects.get(nome=modulo_selecionado, formador=user)
-            aulas = Aula.objects.filter(
-                modulo=modulo,
-                data__range=[start_date, end_date]
-            ).order_by("-data")
-            
-            if not aulas.exists():
-                st.info("Não há aulas agendadas para este período")
-            
-            # Code Generation Section for Today's Classes
-            st.subheader("🎯 Gerador de Código para Presença")
-            aulas_hoje = aulas.filter(data=timezone.now().date())
+        modulo = referencias.modulo(modulo_selecionado)
+        if modulo is None:
+            st.error("Módulo não encontrado ou não está atribuído a si")
+            st.stop()
+
+        aulas = Aula.objects.filter(
+            modulo=modulo,
+            data__range=[start_date, end_date]
+        ).order_by("-data")
+        
+        if not aulas.exists():
+            st.info("Não há aulas agendadas para este período")
+        
+        # Code Generation Section for Today's Classes
+        st.subheader("🎯 Gerador de Código para Presença")
+        aulas_hoje = aulas.filter(data=timezone.now().date())
+        
+        if aulas_hoje.exists():
+            aula_selecionada = st.selectbox(
+                "Selecione a aula para gerar código",
+                options=[(a.id, f"{a.periodo} - {modulo.nome}") for a in aulas_hoje],
+                format_func=lambda x: x[1],
+                key="aula_code_select"
+            )
             
-            if aulas_hoje.exists():
-                aula_selecionada = st.selectbox(
-                    "Selecione a aula para gerar código",
-                    options=[(a.id, f"{a.periodo} - {a.modulo.nome}") for a in aulas_hoje],
-                    format_func=lambda x: x[1],
-                    key="aula_code_select"
-                )
+            if aula_selecionada:
+                aula_id = aula_selecionada[0]
                 
-                if aula_selecionada:
-                    aula_id = aula_selecionada[0]
-                    
-                    # Generate or get existing code
-                    if 'current_code' not in st.session_state or 'code_timestamp' not in st.session_state:
-                        code, timestamp = generate_attendance_code(aula_id)
-                        st.session_state.current_code = code
-                        st.session_state.code_timestamp = timestamp
-                        st.session_state.code_start_time = time.time()
-                    
+                # The class's active code (pre-generated each morning) is the same in every session and device
+                codigo = codigos.codigo_ativo(aula_id)
+                if codigo is None:
+                    st.info("Esta aula não tem nenhum código ativo.")
+                else:
                     # Display code with timer
                     col1, col2 = st.columns([2, 1])
                     with col1:
                         st.markdown(f"""
                         <div style='text-align: center; padding: 20px; background-color: #f0f2f6; border-radius: 10px;'>
-                            <h2 style='margin: 0;'>{st.session_state.current_code}</h2>
+                            <h2 style='margin: 0;'>{codigo.codigo}</h2>
                         </div>
                         """, unsafe_allow_html=True)
+                    # Pre-generated codes are only accepted from shortly before the class starts
+                    validade = f"O código expira às {timezone.localtime(codigo.expira):%H:%M}"
+                    if codigo.valido_desde and codigo.valido_desde > timezone.now():
+                        validade = (f"O código é aceite das {timezone.localtime(codigo.valido_desde):%H:%M} "
+                                    f"às {timezone.localtime(codigo.expira):%H:%M}")
                     with col2:
-                        st.info("""
+                        st.info(f"""
                         **Instruções:**
                         1. Mostre este código aos formandos
-                        2. O código expira em 30 minutos
+                        2. {validade}
                         3. Os formandos devem inserir este código
                         4. Gere um novo quando necessário
                         """)
                     
-                    # Timer display
-                    time_elapsed = time.time() - st.session_state.code_start_time
-                    time_remaining = max(0, (CODE_VALIDITY_MINUTES * 60) - time_elapsed)
-                    
-                    st.progress(time_remaining / (CODE_VALIDITY_MINUTES * 60))
-                    st.caption(f"Tempo restante: {int(time_remaining / 60)} minutos e {int(time_remaining % 60)} segundos")
-                    
-                    # Generate new code button
-                    if st.button("🔄 Gerar Novo Código", key="new_code_btn"):
-                        code, timestamp = generate_attendance_code(aula_id)
-                        st.session_state.current_code = code
-                        st.session_state.code_timestamp = timestamp
-                        st.session_state.code_start_time = time.time()
-                        st.rerun()
-            else:
-                st.info("Não há aulas agendadas para hoje")
-            
-            # Attendance editor for each class
-            st.subheader("📝 Registos de Presença")
-            for aula in aulas:
-                with st.expander(f"📅 {aula.data.strftime('%d/%m/%Y')} - {aula.periodo}", expanded=False):
-                    presencas = RegistoPresenca.objects.filter(aula=aula)
-                    
-                    if not presencas.exists():
-                        st.info("Nenhum formando registado nesta aula")
-                        continue
-                    
-                    # Create editable dataframe
-                    df = pd.DataFrame([{
-                        "ID": p.id,
-                        "Formando": p.formando.username,
-                        "Status": "Presente" if p.entrada else "Falta",
-                        "Hora": p.entrada.time() if p.entrada else "-",
-                        "Justificação": p.motivo_atraso if p.motivo_atraso else ""
-                    } for p in presencas])
-                    
-                    # Data editor with custom styling
-                    edited_df = st.data_editor(
-                        df,
-                        column_config={
-                            "ID": None,
-                            "Status": st.column_config.SelectboxColumn(
-                                "Status",
-                                options=["Presente", "Falta", "Atrasado"],
-                                required=True
-                            ),
-                            "Justificação": st.column_config.TextColumn(
-                                "Justificação (se aplicável)"
-                            )
-                        },
-                        key=f"attendance_editor_{aula.id}",
-                        hide_index=True,
-                        use_container_width=True
-                    )
-                    
-                    # Save button
-                    if st.button("Salvar Alterações", key=f"save_{aula.id}"):
-                        for _, row in edited_df.iterrows():
-                            registro = RegistoPresenca.objects.get(id=row['ID'])
-                            
-                            # Update status
-                            if row['Status'] == "Presente":
-                                registro.entrada = aula.data
-                                registro.motivo_atraso = ""
-                            elif row['Status'] == "Falta":
-                                registro.entrada = None
-                                registro.motivo_atraso = ""
-                            elif row['Status'] == "Atrasado":
-                                registro.entrada = aula.data
-                                registro.motivo_atraso = row['Justificação']
-                            
-                            registro.save()
-                        
-                        st.success("Alterações salvas com sucesso!")
-                        time.sleep(1)
+                    # Timer refreshes as a fragment
+                    mostrar_tempo_codigo(codigo.expira, codigo.valido_desde)
+                
+                # Check-ins are pushed by the server
+                contador_presencas_aula(
+                    aula_id,
+                    Inscricao.objects.formandos_de(modulo).count(),
+                    st.query_params.get("sessao") or criar_token_sessao(user),
+                )
+                
+                # Generate new code button (replaces the active code for everyone)
+                if st.button("🔄 Gerar Novo Código", key="new_code_btn"):
+                    if generate_attendance_code(aula_id) is not None:
                         st.rerun()
+        else:
+            st.info("Não há aulas agendadas para hoje")
         
-        except Modulo.DoesNotExist:
-            st.error("Módulo não encontrado ou não está atribuído a si")
-            st.stop()
+        # Attendance editor for each class
+        st.subheader("📝 Registos de Presença")
+        # Roster is every enrolled formando; missing registos are absences (same queries for any number of classes)
+        rosters = servicos.roster_aulas(modulo, aulas)
+        for aula in aulas:
+            with st.expander(f"📅 {aula.data.strftime('%d/%m/%Y')} - {aula.periodo}", expanded=False):
+                roster = rosters[aula.id]
+                registos = {linha['formando'].id: linha['registo'] for linha in roster if linha['registo']}
+                
+                if not roster:
+                    st.info("Nenhum formando inscrito nesta aula")
+                    continue
+                
+                # Create editable dataframe
+                df = pd.DataFrame([{
+                    "ID": f.id,
+                    "Formando": f.username,
+                    "Status": EDITOR_STATUS.get(p.estado, "Falta") if p else "Falta",
+                    "Hora": p.entrada.time() if p and p.entrada else "-",
+                    "Justificação": p.motivo_atraso if p and p.motivo_atraso else ""
+                } for linha in roster for f, p in [(linha['formando'], linha['registo'])]])
+                
+                # Data editor with custom styling
+                edited_df = st.data_editor(
+                    df,
+                    column_config={
+                        "ID": None,
+                        "Status": st.column_config.SelectboxColumn(
+                            "Status",
+                            options=["Presente", "Falta", "Atrasado"],
+                            required=True
+                        ),
+                        "Justificação": st.column_config.TextColumn(
+                            "Justificação (se aplicável)"
+                        )
+                    },
+                    key=f"attendance_editor_{aula.id}",
+                    hide_index=True,
+                    use_container_width=True
+                )
+                
+                # Save button
+                if st.button("Salvar Alterações", key=f"save_{aula.id}"):
+                    for _, row in edited_df.iterrows():
+                        # Absences are only stored when they carry a justification
+                        formando_id = int(row['ID'])
+                        if row['Status'] == "Falta":
+                            marcar_falta(formando_id, aula, row['Justificação'] or "")
+                            continue
+                        
+                        registro = registos.get(formando_id) or RegistoPresenca(
+                            formando_id=formando_id, aula=aula
+                        )
+                        
+                        # The formador's choice overrides the status derived from the entry time
+                        registro.entrada = registro.entrada or aula.data
+                        if row['Status'] == "Presente":
+                            registro.estado = 'presente'
+                            registro.motivo_atraso = ""
+                        elif row['Status'] == "Atrasado":
+                            registro.estado = 'atrasado'
+                            registro.motivo_atraso = row['Justificação']
+                        
+                        registro.save()
+                    
+                    st.success("Alterações salvas com sucesso!")
+                    time.sleep(1)
+                    st.rerun()
 
     with tab3:
         st.subheader("Análise Estatística")
@@ -313,73 +389,77 @@ def mostrar_interface_formador(user):
         # Module selector for statistics
         modulo_stats = st.selectbox(
             "Selecione o módulo para análise",
-            options=[m.nome for m in modulos],
+            options=[m.id for m in modulos],
+            format_func=lambda i: referencias.modulo(i).nome,
             key="modulo_stats"
         )
         
-        try:
-            modulo = Modulo.objects.get(nome=modulo_stats, formador=user)
-            aulas = Aula.objects.filter(modulo=modulo).order_by('data')
+        modulo = referencias.modulo(modulo_stats)
+        if modulo is None:
+            st.error("Módulo não encontrado ou não está atribuído a si")
+            st.stop()
+
+        aulas = Aula.objects.filter(modulo=modulo).order_by('data')
+        
+        if not aulas.exists():
+            st.info("Não há aulas registadas para este módulo")
+        else:
+            # Time series data - ensure consistent column names
+            presencas_aula = presencas_por_aula(aulas)
+            total = Inscricao.objects.formandos_de(modulo).count()
+            time_data = []
+            for aula in aulas:
+                presencas = presencas_aula.get(aula.id, 0)
+                
+                time_data.append({
+                    "date": aula.data,
+                    "presencas": presencas,
+                    "taxa_presenca": (presencas/total)*100 if total > 0 else 0,
+                    "aula_info": f"{aula.data.strftime('%d/%m')} {aula.periodo}"
+                })
             
-            if not aulas.exists():
-                st.info("Não há aulas registadas para este módulo")
-            else:
-                # Time series data - ensure consistent column names
-                time_data = []
-                for aula in aulas:
-                    presencas = RegistoPresenca.objects.filter(aula=aula, entrada__isnull=False).count()
-                    total = RegistoPresenca.objects.filter(aula=aula).count()
-                    
-                    time_data.append({
-                        "date": aula.data,
-                        "presencas": presencas,
-                        "taxa_presenca": (presencas/total)*100 if total > 0 else 0,
-                        "aula_info": f"{aula.data.strftime('%d/%m')} {aula.periodo}"
-                    })
+            df_time = pd.DataFrame(time_data)
+            
+            # Ensure we have data to display
+            if not df_time.empty:
+                # Charts
+                col1, col2 = st.columns(2)
                 
-                df_time = pd.DataFrame(time_data)
+                with col1:
+                    st.markdown("**Evolução de Presenças**")
+                    st.line_chart(
+                        df_time,
+                        x="date",
+                        y="taxa_presenca"
+                    )
                 
-                # Ensure we have data to display
-                if not df_time.empty:
-                    # Charts
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        st.markdown("**Evolução de Presenças**")
-                        st.line_chart(
-                            df_time,
-                            x="date",
-                            y="taxa_presenca"
-                        )
-                    
-                    with col2:
-                        st.markdown("**Distribuição de Presenças**")
-                        st.bar_chart(
-                            df_time,
-                            x="aula_info",
-                            y="presencas"
-                        )
-                    
-                    # Export button
-                    export_df = df_time.rename(columns={
-                        "date": "Data",
-                        "presencas": "Presenças",
-                        "taxa_presenca": "Taxa de Presença (%)",
-                        "aula_info": "Aula"
-                    })
-                    
-                    st.download_button(
-                        "Exportar Dados (CSV)",
-                        export_df.to_csv(index=False, sep=';').encode('utf-8'),
-                        f"estatisticas_{modulo.nome}.csv",
-                        "text/csv"
+                with col2:
+                    st.markdown("**Distribuição de Presenças**")
+                    st.bar_chart(
+                        df_time,
+                        x="aula_info",
+                        y="presencas"
                     )
-                else:
-                    st.warning("Dados insuficientes para gerar gráficos")
-        
-        except Modulo.DoesNotExist:
-            st.error("Módulo não encontrado ou não está atribuído a si")
-            st.stop()
+                
+                # Export button
+                export_df = df_time.rename(columns={
+                    "date": "Data",
+                    "presencas": "Presenças",
+                    "taxa_presenca": "Taxa de Presença (%)",
+                    "aula_info": "Aula"
+                })
+                
+                st.download_button(
+                    "Exportar Dados (CSV)",
+                    export_df.to_csv(index=False, sep=';').encode('utf-8'),
+                    f"estatisticas_{modulo.nome}.csv",
+                    "text/csv"
+                )
+                
+                st.markdown("**Assiduidade por Dia da Semana e Período**")
+                mapa_calor_assiduidade(relatorios.mapa_dias_periodos(modulo_id=modulo.id))
+            else:
+                st.warning("Dados insuficientes para gerar gráficos")
 
     with tab4:
         st.subheader("Configurações")
@@ -389,12 +469,128 @@ def mostrar_interface_formador(user):
         
         if st.button("Guardar Configurações"):
             st.success("Configurações guardadas com sucesso!")
+
+# --------------------------
+# Coordinator Interface
+# --------------------------
+def mostrar_interface_coordenador(user):
+    """Centre-wide attendance rates; every figure is aggregated in the database and cached per period"""
+    import pandas as pd
+    
+    periodo = st.radio(
+        "Período",
+        options=list(COORDINATOR_PERIODS),
+        format_func=COORDINATOR_PERIODS.get,
+        horizontal=True,
+        key="coord_periodo"
+    )
+    desde, ate = relatorios.periodo_predefinido(periodo)
+    st.caption(f"De {desde.strftime('%d/%m/%Y')} a {ate.strftime('%d/%m/%Y')} · taxa = presenças / (aulas realizadas × inscritos)")
+    
+    dados = relatorios.taxas(desde, ate)
+    if not dados['modulos']:
+        st.info("Não há aulas realizadas neste período")
+        return
     
-    # Auto-refresh logic
-    if time.time() - st.session_state.last_refresh_timestamp > 120:  # 2 minutes
-        st.session_state.last_refresh_time = datetime.now().strftime('%H:%M:%S')
-        st.session_state.last_refresh_timestamp = time.time()
-        st.rerun()
+    colunas = {
+        "taxa": st.column_config.ProgressColumn("Taxa de presença", format="%.0f%%", min_value=0, max_value=100),
+        "presencas": "Presenças",
+        "faltas": "Faltas",
+        "atrasos": "Atrasos",
+        "aulas": "Aulas",
+        "esperados": None,
+    }
+    
+    def tabela(linhas):
+        df = pd.DataFrame(linhas)
+        df["taxa"] = df["taxa"] * 100
+        st.dataframe(df, column_config=colunas, hide_index=True, use_container_width=True)
+        return df
+    
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(
+        ["🏫 Cursos", "📚 Módulos", "👨‍🏫 Formadores", "📈 Tendência Semanal", "🗓️ Dias e Períodos", "⚠️ Risco"]
+    )
+    
+    with tab1:
+        # Worst first, so the courses that need attention are at the top
+        tabela(dados['cursos'])
+    
+    with tab2:
+        df = tabela(dados['modulos'])
+        st.download_button(
+            "Exportar Dados (CSV)",
+            df.to_csv(index=False, sep=';').encode('utf-8'),
+            f"assiduidade_modulos_{periodo}.csv",
+            "text/csv"
+        )
+    
+    with tab3:
+        tabela(dados['formadores'])
+    
+    with tab4:
+        semanas = relatorios.tendencia_semanal(desde, ate)
+        if not semanas:
+            st.info("Sem dados semanais neste período")
+        else:
+            df = pd.DataFrame(semanas)
+            df["taxa"] = df["taxa"] * 100
+            df["media_movel"] = df["media_movel"] * 100
+            df["variacao"] = df["variacao"] * 100
+            st.markdown(f"**Média móvel de {relatorios.SEMANAS_MEDIA} semanas por curso (%)**")
+            st.line_chart(df, x="semana", y="media_movel", color="curso")
+            st.dataframe(
+                df.rename(columns={
+                    "curso": "Curso",
+                    "semana": "Semana",
+                    "taxa": "Taxa (%)",
+                    "variacao": "Variação (p.p.)",
+                    "media_movel": "Média móvel (%)",
+                    "presencas": "Presenças",
+                    "esperados": "Esperadas",
+                }),
+                hide_index=True,
+                use_container_width=True
+            )
+    
+    with tab5:
+        col1, col2, col3 = st.columns([2, 2, 1])
+        with col1:
+            cursos = {c.id: c.nome for c in sorted(referencias.cursos().values(), key=lambda c: c.nome)}
+            curso_id = st.selectbox("Curso", options=[None, *cursos],
+                                    format_func=lambda i: "Todos" if i is None else cursos[i], key="mapa_curso")
+        with col2:
+            modulos = {} if curso_id is None else {m.id: m.nome for m in referencias.modulos_do_curso(curso_id)}
+            modulo_id = st.selectbox("Módulo", options=[None, *modulos],
+                                     format_func=lambda i: "Todos" if i is None else modulos[i], key="mapa_modulo")
+        with col3:
+            historico = st.checkbox("Todo o histórico", key="mapa_historico")
+        if historico:
+            linhas = relatorios.mapa_dias_periodos(curso_id=curso_id, modulo_id=modulo_id)
+        else:
+            linhas = relatorios.mapa_dias_periodos(desde, ate, curso_id, modulo_id)
+        mapa_calor_assiduidade(linhas)
+    
+    with tab6:
+        # Scores are computed nightly by the calcular_risco management command
+        # (risco imports NumPy and pandas at load time, so only this tab loads it)
+        from Gestao.risco import mais_em_risco
+
+        riscos = list(mais_em_risco(50))
+        if not riscos:
+            st.info("Ainda não foram calculados scores de risco (comando calcular_risco)")
+        else:
+            st.caption(f"Calculado em {timezone.localtime(riscos[0].calculado_em).strftime('%d/%m/%Y %H:%M')}")
+            st.dataframe(pd.DataFrame([{
+                "Formando": r.formando.get_full_name() or r.formando.username,
+                "Risco": r.probabilidade * 100,
+                "Taxa total (%)": round(r.taxa_total * 100, 1),
+                "Taxa recente (%)": round(r.taxa_recente * 100, 1),
+                "Faltas seguidas": r.faltas_seguidas,
+                "Atrasos (%)": round(r.frequencia_atrasos * 100, 1),
+                "Pior dia (p.p. abaixo)": round(r.desvio_dia_semana * 100, 1),
+            } for r in riscos]), column_config={
+                "Risco": st.column_config.ProgressColumn("Risco", format="%.0f%%", min_value=0, max_value=100),
+            }, hide_index=True, use_container_width=True)
 
 # --------------------------
 # Student Interface
@@ -402,25 +598,18 @@ def mostrar_interface_formador(user):
 def mostrar_interface_formando(user):
     st.subheader(f"🎓 Bem-vindo, {user.first_name}")
     
-    # Get today's classes
-    hoje = timezone.now().date()
-    aulas_hoje = Aula.objects.filter(data=hoje).order_by('periodo')
+    # Today's classes for the user's enrolments with this user's records (two queries; names from the reference cache)
+    aulas_hoje = servicos.aulas_de_hoje(user)
     
-    if not aulas_hoje.exists():
+    if not aulas_hoje:
         st.info("Não há aulas agendadas para hoje")
         return
     
     # Display today's classes with code input for each
     st.subheader("📅 Suas Aulas Hoje")
 
-    for aula in aulas_hoje:
+    for aula, registro in aulas_hoje:
         with st.expander(f"📘 {aula.modulo.nome} - {aula.periodo}", expanded=True):
-            # Get current attendance status
-            registro = RegistoPresenca.objects.filter(
-                formando=user,
-                aula=aula
-            ).first()
-            
             # Display class information first
             st.markdown(f"""
             **Informações da Aula:**
@@ -435,8 +624,8 @@ def mostrar_interface_formando(user):
             st.markdown("---")
             
             # Display current status
-            if registro and registro.entrada:
-                st.success("✅ Presença registada")
+            if registro and registro.estado in RegistoPresenca.PRESENTES:
+                st.success("✅ Presença registada" + (" (com atraso)" if registro.estado == 'atrasado' else ""))
                 if registro.motivo_atraso:
                     st.info(f"Motivo do atraso: {registro.motivo_atraso}")
                     if registro.justificativo:
@@ -480,8 +669,8 @@ def mostrar_interface_formando(user):
                     
                     if st.form_submit_button("Confirmar Presença"):
                         if code:
-                            if is_code_valid(code):
-                                aula_id = get_aula_id_from_code(code)
+                            aula_id = get_aula_id_from_code(code)
+                            if aula_id is not None:
                                 if aula_id == aula.id:
                                     try:
                                         # Handle file upload if present
@@ -504,12 +693,11 @@ def mostrar_interface_formando(user):
                                             entrada=timezone.now(),
                                             saida=timezone.now() + timedelta(hours=3),
                                             motivo_atraso=motivo_atraso if status == "Atrasado" else "",
+                                            # Declared lateness is kept; otherwise it is derived from the entry time
+                                            estado='atrasado' if status == "Atrasado" else "",
                                             justificativo=justificativo_path if justificativo_path else None
                                         )
                                         
-                                        # Invalidate the used code
-                                        invalidate_code(code)
-                                        
                                         st.success("✅ Presença registada com sucesso!")
                                         st.rerun()  # Refresh to show updated status
                                     except Exception as e:
@@ -526,10 +714,10 @@ def mostrar_interface_formando(user):
 # --------------------------
 def display_attendance_status(registro):
     """Show current attendance status"""
-    if registro.entrada:
+    if registro.estado in RegistoPresenca.PRESENTES:
         status_msg = "✅ Presença registada"
-        if registro.motivo_atraso:
-            status_msg += f" | Atraso: {registro.motivo_atraso}"
+        if registro.estado == 'atrasado':
+            status_msg += f" | Atraso: {registro.motivo_atraso or '-'}"
         st.success(status_msg)
     else:
         st.error("❌ Falta registada")
@@ -540,8 +728,8 @@ def display_attendance_status(registro):
 def main():
     st.title("Gestão de Presenças - CESAE Braga")
     
-    # Session and login
-    user = st.session_state.get("user", None)
+    # Session and login (a signed token in the URL resumes the session after a refresh)
+    user = st.session_state.get("user", None) or retomar_sessao()
     
     if not user:
         login_user()
@@ -552,7 +740,7 @@ def main():
         col1, col2, col3 = st.columns([6, 1, 1])
         with col3:
             if st.button("Sair", icon="🔴", key="logout_btn"):
-                st.session_state.clear()
+                terminar_sessao()
                 st.rerun()
         
         # Role-based interface
@@ -560,6 +748,12 @@ def main():
             mostrar_interface_formador(user)
         elif user.tipo == "Formando":
             mostrar_interface_formando(user)
+        elif user.tipo == "Coordenador":
+            # Read-only page: its aggregates go through the read-only connection
+            with painel():
+                mostrar_interface_coordenador(user)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Connections come from the process pool and go back to it when the run ends
+    with ligacoes.execucao():
+        main()
\ No newline at end of file
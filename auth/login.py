@@ -1,19 +1,68 @@
 import streamlit as st
 from django.core.exceptions import ObjectDoesNotExist
-from Gestao.models import Utilizador
+from Gestao.autenticacao import (
+    concluir_autenticacao, criar_token_sessao, iniciar_autenticacao, revogar_sessoes, utilizador_do_token,
+)
+
+SESSAO_PARAM = "sessao"
+# Intervalo (segundos) com que o login pendente vê se o hash já terminou
+VERIFICACAO_INTERVALO = 0.2
+
+
+def retomar_sessao():
+    """Recupera o utilizador a partir do token no URL (sobrevive a um refresh do browser)"""
+    token = st.query_params.get(SESSAO_PARAM)
+    if not token:
+        return None
+    user = utilizador_do_token(token)
+    if user is None:
+        del st.query_params[SESSAO_PARAM]
+        return None
+    st.session_state["user"] = user
+    return user
+
+
+def terminar_sessao():
+    """Revoga os tokens do utilizador no servidor (não basta tirá-lo do URL) e limpa a sessão"""
+    user = st.session_state.get("user")
+    if user is not None:
+        revogar_sessoes(user)
+    st.session_state.clear()
+    st.query_params.clear()
+
 
 def login_user():
     st.subheader("Login")
     username = st.text_input("Nome de utilizador")
     password = st.text_input("Palavra-passe", type="password")
 
-    if st.button("Entrar"):
+    if st.button("Entrar") and "login_pendente" not in st.session_state:
         try:
-            user = Utilizador.objects.get(username=username)
-            if user.check_password(password):
-                st.session_state["user"] = user
-                st.rerun()
-            else:
-                st.error("Palavra-passe incorreta")
+            # O hash corre no pool: o script termina já e aguardar_login() vai vendo o resultado
+            st.session_state["login_pendente"] = iniciar_autenticacao(username, password)
         except ObjectDoesNotExist:
             st.error("Utilizador não encontrado")
+
+    if "login_pendente" in st.session_state:
+        aguardar_login()
+    elif st.session_state.pop("login_falhado", False):
+        st.error("Palavra-passe incorreta")
+
+
+@st.fragment(run_every=VERIFICACAO_INTERVALO)
+def aguardar_login():
+    """Só corre enquanto há um login pendente; quando o hash termina recarrega a página"""
+    futuro = st.session_state.get("login_pendente")
+    if futuro is None:
+        return
+    if not futuro.done():
+        st.caption("A verificar credenciais...")
+        return
+    del st.session_state["login_pendente"]
+    user = concluir_autenticacao(futuro)
+    if user is not None:
+        st.session_state["user"] = user
+        st.query_params[SESSAO_PARAM] = criar_token_sessao(user)
+    else:
+        st.session_state["login_falhado"] = True
+    st.rerun()
@@ -1,27 +1,263 @@
+"""
+Launcher de produção.
+
+Arranca o Django num pool de workers WSGI (gunicorn) e N processos Streamlit
+por frontend (app.py e Frontend/monitor.py), cada grupo atrás de um proxy TCP
+local com afinidade por IP do cliente. Um ciclo de supervisão faz health
+checks, reinicia workers que morrem ou deixam de responder e, com Ctrl+C ou
+SIGTERM, encerra tudo de forma ordenada.
+
+O mesmo processo corre o agendador de tarefas periódicas (Gestao/agendador.py):
+comandos de gestão como gerar_codigos ou calcular_risco em horários cron,
+sem broker externo. O estado vê-se com `python manage.py estado_agendador`.
+
+    python launch.py                      # um worker Streamlit por core
+    python launch.py --workers 4 --dev    # Django com runserver (desenvolvimento)
+    python launch.py --no-scheduler       # sem tarefas periódicas (ex.: outra instância já as corre)
+"""
+import argparse
+import asyncio
+import os
+import signal
 import subprocess
+import sys
 import threading
 import time
+import urllib.request
+import zlib
+
+from Gestao.agendador import Agendador
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+HEALTH_INTERVAL = 5  # segundos entre health checks
+HEALTH_FAILURES = 3  # falhas seguidas antes de reiniciar um worker
+STOP_TIMEOUT = 10  # segundos para um processo terminar antes de SIGKILL
+
+
+class Worker:
+    """Um processo supervisionado com um endpoint HTTP de health check"""
+
+    def __init__(self, name, cmd, port, health_path):
+        self.name = name
+        self.cmd = cmd
+        self.port = port
+        self.health_url = f"http://127.0.0.1:{port}{health_path}"
+        self.process = None
+        self.healthy = False
+        self.failures = 0
+        self.restarts = 0
+        self.started_at = 0.0
+
+    def start(self):
+        self.process = subprocess.Popen(self.cmd, cwd=BASE_DIR)
+        self.started_at = time.time()
+        self.healthy = False
+        self.failures = 0
+        print(f"[launch] {self.name} iniciado (pid {self.process.pid}, porta {self.port})")
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def check(self):
+        """Atualiza o estado de saúde; devolve False se o worker tiver de ser reiniciado"""
+        if not self.alive():
+            self.healthy = False
+            return False
+        try:
+            with urllib.request.urlopen(self.health_url, timeout=2) as resp:
+                self.healthy = resp.status == 200
+        except OSError:
+            self.healthy = False
+        if self.healthy:
+            self.failures = 0
+            return True
+        # Dá tempo ao arranque antes de contar falhas
+        if time.time() - self.started_at > HEALTH_INTERVAL * HEALTH_FAILURES:
+            self.failures += 1
+        return self.failures < HEALTH_FAILURES
+
+    def stop(self):
+        if not self.alive():
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def restart(self):
+        self.restarts += 1
+        print(f"[launch] A reiniciar {self.name} (reinício n.º {self.restarts})")
+        self.stop()
+        self.start()
+
+
+class StickyProxy:
+    """Proxy TCP que encaminha cada IP de cliente sempre para o mesmo worker saudável.
+
+    Funciona ao nível TCP, por isso serve tanto HTTP como as websockets do Streamlit.
+    """
+
+    def __init__(self, name, port, workers):
+        self.name = name
+        self.port = port
+        self.workers = workers
+        self.server = None
+        self._next = 0
+
+    def choose(self, client_ip):
+        # Sem workers saudáveis (ex.: ainda a arrancar) serve qualquer um que esteja vivo
+        usable = (lambda w: w.healthy) if any(w.healthy for w in self.workers) else (lambda w: w.alive())
+        if client_ip:
+            # O hash é sobre todos os workers: o cliente só muda se o seu worker estiver em baixo,
+            # e nesse caso passa para o seguinte em vez de baralhar os restantes clientes
+            start = zlib.crc32(client_ip.encode()) % len(self.workers)
+        else:
+            self._next = start = (self._next + 1) % len(self.workers)
+        for i in range(len(self.workers)):
+            worker = self.workers[(start + i) % len(self.workers)]
+            if usable(worker):
+                return worker
+        return None
+
+    async def _pipe(self, reader, writer):
+        try:
+            while data := await reader.read(65536):
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, client_reader, client_writer):
+        peer = client_writer.get_extra_info("peername")
+        worker = self.choose(peer[0] if peer else None)
+        if worker is None:
+            client_writer.close()
+            return
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection("127.0.0.1", worker.port)
+        except OSError:
+            worker.healthy = False
+            client_writer.close()
+            return
+        await asyncio.gather(
+            self._pipe(client_reader, upstream_writer),
+            self._pipe(upstream_reader, client_writer),
+        )
+
+    async def serve(self, host):
+        self.server = await asyncio.start_server(self._handle, host, self.port)
+        print(f"[launch] Proxy {self.name} em {host}:{self.port} -> {[w.port for w in self.workers]}")
+        async with self.server:
+            await self.server.serve_forever()
+
+
+def django_worker(args):
+    if args.dev:
+        cmd = [sys.executable, "manage.py", "runserver", f"{args.host}:{args.django_port}", "--noreload"]
+    else:
+        cmd = [
+            sys.executable, "-m", "gunicorn", "Projecto_Final.wsgi:application",
+            "--bind", f"{args.host}:{args.django_port}",
+            "--workers", str(args.django_workers),
+            # Threads por worker para que pedidos longos não ocupem um processo inteiro
+            "--worker-class", "gthread", "--threads", "4",
+            "--graceful-timeout", str(STOP_TIMEOUT),
+        ]
+    return Worker("django", cmd, args.django_port, "/saude/")
+
+
+def streamlit_workers(name, script, count, first_port):
+    workers = []
+    for i in range(count):
+        port = first_port + i
+        cmd = [
+            sys.executable, "-m", "streamlit", "run", script,
+            f"--server.port={port}",
+            "--server.address=127.0.0.1",
+            "--server.headless=true",
+        ]
+        workers.append(Worker(f"{name}-{i + 1}", cmd, port, "/_stcore/health"))
+    return workers
+
+
+def parse_args():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Arranca Django e os frontends Streamlit supervisionados")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--workers", type=int, default=cpus, help="Workers Streamlit para app.py (um por core)")
+    parser.add_argument("--monitor-workers", type=int, default=1, help="Workers Streamlit para o monitor")
+    parser.add_argument("--django-workers", type=int, default=2 * cpus + 1, help="Workers gunicorn do Django")
+    parser.add_argument("--django-port", type=int, default=8000)
+    parser.add_argument("--app-port", type=int, default=8501)
+    parser.add_argument("--monitor-port", type=int, default=8502)
+    parser.add_argument("--dev", action="store_true", help="Usa o runserver do Django em vez do gunicorn")
+    parser.add_argument("--no-scheduler", action="store_true", help="Não arranca o agendador de tarefas periódicas")
+    parser.add_argument("--scheduler-workers", type=int, default=2, help="Tarefas periódicas em simultâneo")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    django = django_worker(args)
+    app_workers = streamlit_workers("app", "app.py", args.workers, args.app_port + 10)
+    monitor_workers = streamlit_workers("monitor", os.path.join("Frontend", "monitor.py"),
+                                        args.monitor_workers, args.monitor_port + 100)
+    workers = [django] + app_workers + monitor_workers
+    proxies = [
+        StickyProxy("app", args.app_port, app_workers),
+        StickyProxy("monitor", args.monitor_port, monitor_workers),
+    ]
+
+    # WAL antes dos workers: os painéis leem sem bloquear os check-ins (ver Gestao/leitura.py)
+    subprocess.run([sys.executable, "manage.py", "ativar_wal"], cwd=BASE_DIR, check=True)
+
+    for worker in workers:
+        worker.start()
+
+    agendador = None
+    if not args.no_scheduler:
+        agendador = Agendador(workers=args.scheduler_workers)
+        agendador.iniciar()
+
+    loop = asyncio.new_event_loop()
+    tasks = [loop.create_task(proxy.serve(args.host)) for proxy in proxies]
+    proxy_thread = threading.Thread(target=loop.run_until_complete,
+                                    args=(asyncio.gather(*tasks, return_exceptions=True),),
+                                    daemon=True)
+    proxy_thread.start()
+
+    stopping = threading.Event()
+
+    def shutdown(signum, frame):
+        stopping.set()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    # Ciclo de supervisão: health checks e reinício de workers caídos
+    while not stopping.wait(HEALTH_INTERVAL):
+        for worker in workers:
+            if not worker.check():
+                worker.restart()
 
-def run_django():
-    """Start Django development server"""
-    subprocess.run(["python3", "manage.py", "runserver", "0.0.0.0:8000"])
+    print("Shutting down servers...")
+    if agendador is not None:
+        agendador.parar(timeout=STOP_TIMEOUT)
+    for task in tasks:
+        loop.call_soon_threadsafe(task.cancel)
+    for worker in workers:
+        if worker.alive():
+            worker.process.terminate()
+    for worker in workers:
+        worker.stop()
+    proxy_thread.join(timeout=STOP_TIMEOUT)
 
-def run_streamlit():
-    """Start Streamlit app"""
-    subprocess.run(["streamlit", "run", "app.py", "--server.port=8501"])
 
 if __name__ == "__main__":
-    # Start Django in a thread
-    django_thread = threading.Thread(target=run_django)
-    django_thread.daemon = True  # Thread will exit when main program exits
-    django_thread.start()
-
-    # Start Streamlit in main thread
-    run_streamlit()
-
-    # Keep the script running
-    try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        print("Shutting down servers...")
+    main()